@@ -0,0 +1,4 @@
+from dotenv import load_dotenv
+
+# Load the .env file once, before any backend module reads its configuration
+load_dotenv()
@@ -1,47 +1,165 @@
 import os
 import json
+import time
+import asyncio
 import logging
-from typing import List, Optional, Sequence, Literal
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Literal, Tuple
 
+from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage, AIMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_openai import ChatOpenAI
-from dotenv import load_dotenv
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables.config import var_child_runnable_config
+from langgraph.config import get_stream_writer
+from pydantic import BaseModel, Field, ValidationError
 
-from .state import AgentState
-from .tools import tavily_tool
+from .state import AgentState, ResearchTaskInput
+from .sections import Section, split_sections, join_sections, label_sections, parse_section_feedback, replace_sections
+from .clients import get_http_client, get_async_http_client, http_timeout
+from .llm_cache import with_response_cache
+from .metrics import instrument_llm, metrics
+from .routing import LLM_MODEL, RoutedAgent, agent_models
+from .search_results import SearchResultProcessor
+from .tools import TAVILY_TOOL_NAME, get_tavily_tool, set_tavily_tool, execute_tool_calls, aexecute_tool_calls
 
 # Get the logger configured in main.py (or configure a new one)
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
+# --- LLM and Agent Setup --- #
+# The LLM client and the agent runnables are built on first use, so importing the
+# graph needs no API keys and the server can report readiness before they exist.
 
-# Ensure OpenAI API key is set
-openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
-    raise ValueError("OPENAI_API_KEY not found in environment variables. Please add it to your .env file.")
+_llm: Optional[BaseChatModel] = None
+# Chat models by model name, for the model tiers other than the default (see backend.routing)
+_model_llms: Dict[str, BaseChatModel] = {}
+# Per-agent model overrides (see use_clients); an overridden agent isn't routed
+_agent_llms: Dict[str, BaseChatModel] = {}
+# Builds the chat model for a model name; replaceable through use_clients (None: _create_chat_model)
+_model_factory: Optional[Callable[[str], BaseChatModel]] = None
+# Agent name -> (system prompt, uses the search tool, structured output schema)
+AGENT_SPECS: Dict[str, Tuple[str, bool, Optional[type]]] = {}
+_agents: Dict[str, object] = {}
+_lock = threading.RLock()
 
-# --- LLM and Agent Setup --- #
+def get_llm(model: Optional[str] = None) -> BaseChatModel:
+    """Return the chat model for a model name (default LLM_MODEL), creating it on first use."""
+    global _llm
+    with _lock:
+        create = _model_factory or _create_chat_model
+        if model in (None, LLM_MODEL):
+            if _llm is None:
+                _llm = create(LLM_MODEL)
+            return _llm
+        if model not in _model_llms:
+            _model_llms[model] = create(model)
+        return _model_llms[model]
+
+def _create_chat_model(model: str) -> BaseChatModel:
+    # Ensure OpenAI API key is set
+    if not os.getenv("OPENAI_API_KEY"):
+        raise ValueError("OPENAI_API_KEY not found in environment variables. Please add it to your .env file.")
+    # Imported here: langchain_openai is slow to import and only needed once a report runs
+    from langchain_openai import ChatOpenAI
+
+    # stream_usage reports token usage for streamed calls too (the writer streams its draft).
+    # Retries are left to the shared client's policy (backoff, rate limits, circuit breaker)
+    return ChatOpenAI(
+        model=model,
+        temperature=0,
+        stream_usage=True,
+        max_retries=0,
+        timeout=http_timeout("openai"),
+        http_client=get_http_client("openai"),
+        http_async_client=get_async_http_client("openai"),
+    )
+
+def define_agent(name: str, system_prompt: str, uses_search: bool = False, output_schema: Optional[type] = None) -> None:
+    """Register an agent; its runnable is built by get_agent on first use.
+
+    With output_schema (a Pydantic model) the agent must answer by calling it as a tool.
+    """
+    AGENT_SPECS[name] = (system_prompt, uses_search, output_schema)
+
+def get_agent(name: str):
+    """Return the runnable for a registered agent, building it on first use.
+
+    Agents are routed between their model tiers (see backend.routing), unless
+    use_clients gave them a model of their own.
+    """
+    with _lock:
+        agent = _agents.get(name)
+        if agent is None:
+            system_prompt, uses_search, output_schema = AGENT_SPECS[name]
+            tools = [get_tavily_tool()] if uses_search else None
+
+            def build(model: Optional[str] = None):
+                llm = _agent_llms.get(name) or get_llm(model)
+                return create_agent_runnable(llm, system_prompt, tools=tools, name=name, output_schema=output_schema)
+
+            agent = _agents[name] = build() if name in _agent_llms else RoutedAgent(name, agent_models(name), build, system_prompt)
+        return agent
+
+def use_clients(
+    llm: Optional[BaseChatModel] = None,
+    search_tool=None,
+    agent_llms: Optional[Dict[str, BaseChatModel]] = None,
+    model_llms: Optional[Dict[str, BaseChatModel]] = None,
+    model_factory: Optional[Callable[[str], BaseChatModel]] = None,
+) -> None:
+    """Replace the chat model, the search tool, the models of named tiers or individual agents' models (e.g. with fakes).
 
-# Use a capable model like gpt-4o-mini for planning and writing
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+    model_factory(model name) replaces how chat models are created; the models it
+    builds are still routed like real ones. Agent runnables are rebuilt on their next use.
+    """
+    global _llm, _model_factory
+    with _lock:
+        if model_factory is not None:
+            # Models from the previous factory are dropped and rebuilt on first use
+            _model_factory = model_factory
+            _llm = None
+            _model_llms.clear()
+        if llm is not None:
+            _llm = llm
+        if search_tool is not None:
+            set_tavily_tool(search_tool)
+        if agent_llms is not None:
+            _agent_llms.update(agent_llms)
+        if model_llms is not None:
+            _model_llms.update(model_llms)
+        _agents.clear()
+
+def client_status() -> dict:
+    """Which clients and agents have been built so far, for readiness reporting."""
+    with _lock:
+        return {"llm": "ready" if _llm is not None else "not_initialized", "agents": sorted(_agents)}
+
+# --- Prompt Layout --- #
+# Providers cache the longest prompt prefix they have seen before, so every prompt is
+# laid out from most to least stable: the agent's static system message (including
+# its tool preamble), then context shared by the run's calls (prompt, plan, research),
+# then what is specific to the call. Keep variable content out of the first messages.
 
 # Helper function to create an agent runnable
-def create_agent_runnable(llm: ChatOpenAI, system_prompt: str, tools: Optional[list] = None):
-    prompt_parts = [
-        ("system", system_prompt),
-        MessagesPlaceholder(variable_name="messages"),
-    ]
-    if tools:
-        prompt_parts.insert(1, ("system", f"You have access to the following tools: {{tool_names}}.\nRemember to call tools when needed."))
-        prompt = ChatPromptTemplate.from_messages(prompt_parts)
-        prompt = prompt.partial(tool_names=", ".join([tool.name for tool in tools]))
-        agent_runnable = prompt | llm.bind_tools(tools)
+def create_agent_runnable(llm: BaseChatModel, system_prompt: str, tools: Optional[list] = None, name: Optional[str] = None, output_schema: Optional[type] = None):
+    if output_schema:
+        # Force a call to the schema's tool so the answer arrives as validated JSON arguments
+        model = llm.bind_tools([output_schema], tool_choice=output_schema.__name__)
+    elif tools:
+        # The tool preamble is part of the one static system message
+        tool_names = ", ".join(tool.name for tool in tools)
+        system_prompt = f"{system_prompt}\n\nYou have access to the following tools: {tool_names}.\nRemember to call tools when needed."
+        model = llm.bind_tools(tools)
     else:
-        prompt = ChatPromptTemplate.from_messages(prompt_parts)
-        agent_runnable = prompt | llm
+        model = llm
+    # Literal text, so braces in the prompts aren't read as template variables
+    prompt = ChatPromptTemplate.from_messages([SystemMessage(content=system_prompt), MessagesPlaceholder(variable_name="messages")])
+    # Record latency, tokens and cost of every call (cache hits never reach the model)
+    model = instrument_llm(model, name)
+    if name:
+        # The opt-in response cache sits between the rendered prompt and the model
+        model = with_response_cache(model, name)
+    agent_runnable = prompt | model
     return agent_runnable
 
 # --- Agent Definitions --- #
@@ -52,130 +170,375 @@ planner_system_prompt = (
     "til at generere en rapport baseret på brugerens prompt, specifikt tilpasset til studerende på 'Eksport og teknologi'-programmet på UCN. "
     "Overvej programmets fokusområder: Produktudvikling & Teknologi, Global Salg & Marketing, Bæredygtighed & Kvalitet, Kulturel Forretningsforståelse, Produktionsplanlægning. "
     "Opdel prompten i specifikke forskningsspørgsmål til specialistagenter (Teknologi, Marked/Salg, Bæredygtighed/Kvalitet). "
-    "Output planen som en klar, struktureret tekst. Specificer hvilken agent der skal håndtere hver del af planen. "
-    "Tildel det næste trin til en af forskningsagenterne. "
+    "Svar med værktøjet ResearchPlan: planen som en klar, struktureret tekst og en liste af forskningsopgaver. "
+    "Hver opgave har et id (T1, T2, ...), den agent der skal løse den (tech_researcher, market_sales_researcher eller sustainability_quality_researcher), "
+    "et konkret forskningsspørgsmål og id'erne på de opgaver, hvis resultater den bygger på. "
+    "Medtag kun de opgaver og agenter prompten kræver; en simpel prompt kan nøjes med én opgave. Lad opgaver være uafhængige, når det er muligt. "
     "VIGTIGT: Du skal altid svare på dansk."
 )
-planner_agent = create_agent_runnable(llm, planner_system_prompt)
+
+class ResearchTask(BaseModel):
+    id: str = Field(description="Short unique task id, e.g. T1.")
+    agent: Literal["tech_researcher", "market_sales_researcher", "sustainability_quality_researcher"] = Field(description="The research agent that handles the task.")
+    question: str = Field(description="The concrete research question, in Danish.")
+    depends_on: List[str] = Field(default_factory=list, description="Ids of the tasks whose findings this task builds on.")
+
+class ResearchPlan(BaseModel):
+    """A research plan broken into tasks for the research agents."""
+    plan: str = Field(description="The research plan as clear, structured text, in Danish.")
+    tasks: List[ResearchTask] = Field(description="The research tasks the plan needs.")
+
+define_agent("planner", planner_system_prompt, output_schema=ResearchPlan)
 
 def run_planner_agent(state: AgentState):
     logger.info("--- Running Planner Agent ---")
-    
+    messages = _planner_messages(state)
+
+    # Invoke the planner agent
+    response = get_agent("planner").invoke({"messages": messages})
+    return _planner_update(state, messages, response)
+
+async def arun_planner_agent(state: AgentState):
+    logger.info("--- Running Planner Agent ---")
+    messages = _planner_messages(state)
+
+    # Invoke the planner agent without blocking the event loop
+    response = await get_agent("planner").ainvoke({"messages": messages})
+    return _planner_update(state, messages, response)
+
+def _planner_messages(state: AgentState) -> List[BaseMessage]:
     # Create a message with the user's prompt
     prompt_message = HumanMessage(content=state['prompt'])
     
     # Create messages list with the prompt message
-    messages = [prompt_message]
-    
-    # Invoke the planner agent
-    response = planner_agent.invoke({"messages": messages})
-    
-    # Ensure response is AIMessage for consistency
-    if not isinstance(response, AIMessage):
-        response = AIMessage(content=str(response))
-    
-    # Simple logic to determine the first researcher based on the response content
-    plan_content = response.content
-    next_agent = "tech_researcher" # Default start
-    if "market" in plan_content.lower() or "sales" in plan_content.lower():
-        next_agent = "market_sales_researcher"
-    elif "sustainability" in plan_content.lower() or "quality" in plan_content.lower():
-        next_agent = "sustainability_quality_researcher"
+    return [prompt_message]
+
+def _parse_plan(response) -> Tuple[str, List[dict]]:
+    """The plan text and research tasks from the planner's ResearchPlan tool call.
+
+    A plain text plan (a model ignoring the tool) gets one task per researcher it names.
+    """
+    for tool_call in getattr(response, "tool_calls", None) or []:
+        if tool_call["name"] == ResearchPlan.__name__:
+            try:
+                plan = ResearchPlan.model_validate(tool_call["args"])
+            except ValidationError as e:
+                logger.warning(f"Invalid research plan, falling back to keyword routing: {e}")
+                break
+            if plan.tasks:
+                return plan.plan, sanitize_tasks([task.model_dump() for task in plan.tasks])
+            return plan.plan, default_tasks(plan.plan)
+    plan_content = str(response.content)
+    return plan_content, default_tasks(plan_content)
+
+def _planner_update(state: AgentState, messages: List[BaseMessage], response) -> dict:
+    plan_content, research_tasks = _parse_plan(response)
+    # The shared history gets the plan as text rather than a dangling tool call
+    response = AIMessage(content=plan_content, name="planner")
+    logger.info(f"Planner created {len(research_tasks)} research tasks: " + ", ".join(
+        f"{task['id']} ({task['agent']}{', after ' + '+'.join(task['depends_on']) if task['depends_on'] else ''})" for task in research_tasks
+    ))
+
+    # Sequential mode runs the researchers of the planned tasks, in task order
+    research_agents = sequential_order(research_tasks)
+
+    # Only emit new messages; the reducer appends them to the history.
+    # The prompt is added too if the run didn't start with it in messages.
+    new_messages = [response] if state.get('messages') else messages + [response]
 
     # Return the updated state
-    return {"messages": messages + [response], "next_agent": next_agent}
+    return {
+        "messages": new_messages,
+        "plan": plan_content,
+        "next_agent": research_agents[0],
+        "research_agents": research_agents,
+        "research_tasks": research_tasks,
+    }
+
+# Keywords (Danish and English) the plan uses to name each research area
+RESEARCHER_KEYWORDS = {
+    "tech_researcher": ("teknologi", "teknisk", "produktudvikling", "technology", "product development"),
+    "market_sales_researcher": ("marked", "salg", "marketing", "market", "sales"),
+    "sustainability_quality_researcher": ("bæredygtig", "kvalitet", "sustainability", "quality"),
+}
+
+def select_researchers(plan_content: str) -> List[str]:
+    """Return the researchers named in the plan, or all of them if the plan names none."""
+    plan_lower = plan_content.lower()
+    selected = [
+        researcher for researcher, keywords in RESEARCHER_KEYWORDS.items()
+        if any(keyword in plan_lower for keyword in keywords)
+    ]
+    return selected or list(RESEARCHER_KEYWORDS)
+
+def default_tasks(plan_content: str) -> List[dict]:
+    """One task per researcher the plan names, on that researcher's general topic."""
+    return [
+        {"id": f"T{i}", "agent": researcher, "question": RESEARCH_TOPICS[researcher], "depends_on": []}
+        for i, researcher in enumerate(select_researchers(plan_content), start=1)
+    ]
+
+def sequential_order(tasks: List[dict]) -> List[str]:
+    """The researchers of the tasks, one each, ordered so dependencies run first where possible.
+
+    A researcher runs all its tasks in one go, so it is placed by its earliest
+    task's dependency depth, then by plan order.
+    """
+    deps = {task["id"]: task["depends_on"] for task in tasks}
+    depth: Dict[str, int] = {}
+
+    def task_depth(task_id: str) -> int:
+        # sanitize_tasks has removed cycles
+        if task_id not in depth:
+            depth[task_id] = 1 + max((task_depth(dep) for dep in deps.get(task_id, [])), default=0)
+        return depth[task_id]
+
+    first: Dict[str, Tuple[int, int]] = {}
+    for i, task in enumerate(tasks):
+        position = (task_depth(task["id"]), i)
+        first[task["agent"]] = min(first.get(task["agent"], position), position)
+    return sorted(first, key=first.get) or list(RESEARCH_TOPICS)
+
+def sanitize_tasks(tasks: List[dict]) -> List[dict]:
+    """Make task ids unique and drop dependencies that are unknown or would form a cycle.
+
+    Tasks are kept in plan order; when dependencies form a cycle, the first task in
+    it loses its unresolved dependencies rather than failing the run.
+    """
+    seen = set()
+    for i, task in enumerate(tasks, start=1):
+        if not task["id"] or task["id"] in seen:
+            task["id"] = f"{task['id'] or 'T'}_{i}"
+        seen.add(task["id"])
+    known = {task["id"] for task in tasks}
+    deps = {task["id"]: [dep for dep in dict.fromkeys(task["depends_on"]) if dep in known and dep != task["id"]] for task in tasks}
+    resolved = set()
+    while len(resolved) < len(tasks):
+        ready = [task_id for task_id, task_deps in deps.items() if task_id not in resolved and all(dep in resolved for dep in task_deps)]
+        if not ready:
+            # A cycle: release the first unresolved task from its unresolved dependencies
+            task_id = next(task_id for task_id in deps if task_id not in resolved)
+            logger.warning(f"Dropping cyclic dependencies of research task {task_id}")
+            deps[task_id] = [dep for dep in deps[task_id] if dep in resolved]
+            continue
+        resolved.update(ready)
+    for task in tasks:
+        task["depends_on"] = deps[task["id"]]
+    return tasks
 
 # 2. Technology Research Agent
 tech_researcher_system_prompt = (
     "Du er Teknologiforskningsagenten. Fokusér KUN på de tekniske aspekter, produktudvikling, materialer, og produktionsprocesser relevant for forskningsplanen. "
-    f"Brug det leverede søgeværktøj ({tavily_tool.name}) til at finde relevant information. Syntetisér fund til et koncist resumé for det tildelte emne. "
+    f"Brug det leverede søgeværktøj ({TAVILY_TOOL_NAME}) til at finde relevant information. Syntetisér fund til et koncist resumé for det tildelte emne. "
     "Output dine fund klart og tydeligt. Adressér ikke andre emner som marketing eller bæredygtighed. "
     "VIGTIGT: Du skal altid svare på dansk."
 )
-tech_researcher_agent = create_agent_runnable(llm, tech_researcher_system_prompt, tools=[tavily_tool])
+define_agent("tech_researcher", tech_researcher_system_prompt, uses_search=True)
 
 # 3. Market & Sales Research Agent
 market_sales_researcher_system_prompt = (
     "Du er Markeds- og Salgsforskningsagenten. Fokusér KUN på global markedsanalyse, konkurrentforskning, målkunder, salgskanaler og marketingstrategier relevante for forskningsplanen. "
-    f"Overvej kulturelle forskelle i internationale markeder. Brug det leverede søgeværktøj ({tavily_tool.name}) til at finde relevant information. "
+    f"Overvej kulturelle forskelle i internationale markeder. Brug det leverede søgeværktøj ({TAVILY_TOOL_NAME}) til at finde relevant information. "
     "Syntetisér fund til et koncist resumé for det tildelte emne. Adressér ikke tekniske eller bæredygtighedsemner. "
     "VIGTIGT: Du skal altid svare på dansk."
 )
-market_sales_researcher_agent = create_agent_runnable(llm, market_sales_researcher_system_prompt, tools=[tavily_tool])
+define_agent("market_sales_researcher", market_sales_researcher_system_prompt, uses_search=True)
 
 # 4. Sustainability & Quality Research Agent
 sustainability_quality_researcher_system_prompt = (
     "Du er Bæredygtigheds- og Kvalitetsforskningsagenten. Fokusér KUN på bæredygtighedsregler, miljøvenlige praksisser, kvalitetsstandarder (f.eks. ISO) og etiske overvejelser relevante for forskningsplanen. "
-    f"Brug det leverede søgeværktøj ({tavily_tool.name}) til at finde relevant information. Syntetisér fund til et koncist resumé for det tildelte emne. "
+    f"Brug det leverede søgeværktøj ({TAVILY_TOOL_NAME}) til at finde relevant information. Syntetisér fund til et koncist resumé for det tildelte emne. "
     "Adressér ikke tekniske eller marketingemner. "
     "VIGTIGT: Du skal altid svare på dansk."
 )
-sustainability_quality_researcher_agent = create_agent_runnable(llm, sustainability_quality_researcher_system_prompt, tools=[tavily_tool])
+define_agent("sustainability_quality_researcher", sustainability_quality_researcher_system_prompt, uses_search=True)
 
 # Shared function for running research agents and handling tool calls
 def run_research_agent(state: AgentState, agent_runnable, agent_name: str, research_topic: str):
     logger.info(f"--- Running {agent_name} for topic: {research_topic} ---")
-    # Append the specific task to the messages
-    task_message = HumanMessage(content=f"Research the following based on the overall plan: {research_topic}")
-    messages = state['messages'] + [task_message]
-    
+    messages = _research_messages(state, research_topic)
+    response = _research(agent_runnable, messages, research_topic)
+    return _store_research(agent_name, response)
+
+async def arun_research_agent(state: AgentState, agent_runnable, agent_name: str, research_topic: str):
+    logger.info(f"--- Running {agent_name} for topic: {research_topic} ---")
+    messages = _research_messages(state, research_topic)
+    response = await _aresearch(agent_runnable, messages, research_topic)
+    return _store_research(agent_name, response)
+
+def _research(agent_runnable, messages: List[BaseMessage], question: str):
+    # Search results are deduplicated, trimmed, ranked and budgeted before the model sees them
+    results = SearchResultProcessor(question)
     response = agent_runnable.invoke({"messages": messages})
     
     # Handle potential tool calls
     while response.tool_calls:
-        tool_messages = []
-        for tool_call in response.tool_calls:
-            tool_output = tavily_tool.invoke(tool_call["args"])
-            tool_messages.append(
-                ToolMessage(content=str(tool_output), tool_call_id=tool_call["id"])
-            )
+        # Run all searches from this turn concurrently; order and tool_call_id are preserved
+        tool_messages = results.process(response.tool_calls, execute_tool_calls(get_tavily_tool(), response.tool_calls))
         # Add response and tool messages to history before next invocation
         messages = messages + [response] + tool_messages
         response = agent_runnable.invoke({"messages": messages})
+    return response
+
+async def _aresearch(agent_runnable, messages: List[BaseMessage], question: str):
+    results = SearchResultProcessor(question)
+    response = await agent_runnable.ainvoke({"messages": messages})
 
+    # Handle potential tool calls
+    while response.tool_calls:
+        # Run all searches from this turn concurrently; order and tool_call_id are preserved
+        tool_messages = results.process(response.tool_calls, await aexecute_tool_calls(get_tavily_tool(), response.tool_calls))
+        # Add response and tool messages to history before next invocation
+        messages = messages + [response] + tool_messages
+        response = await agent_runnable.ainvoke({"messages": messages})
+    return response
+
+def _research_messages(state: AgentState, research_topic: str, dependencies: Optional[List[Tuple[str, str]]] = None) -> List[BaseMessage]:
+    # Scoped context: the user's prompt, the plan, this researcher's own task and the
+    # findings of the tasks it depends on. Other agents' messages and tool transcripts
+    # are deliberately left out. The prompt and plan are the same for all of a run's
+    # research calls, so they come first; the tool loop appends to the end.
+    shared = state['prompt']
+    if state.get('plan'):
+        shared = f"{shared}\n\nOverall research plan:\n{state['plan']}"
+    task = f"Research the following based on the overall plan: {research_topic}"
+    if dependencies:
+        findings = "\n\n".join(f"--- {question} ---\n{result}" for question, result in dependencies)
+        task = f"{task}\n\nBuild on these findings from earlier research tasks:\n{findings}"
+    return [HumanMessage(content=shared), HumanMessage(content=task)]
+
+def _store_research(agent_name: str, response) -> dict:
     # Ensure response is AIMessage
     if not isinstance(response, AIMessage):
          response = AIMessage(content=str(response))
 
     # Store the research directly in the appropriate state field based on agent_name
+    # Only the final summary goes into the shared history; the tool transcript stays local
     research_content = response.content
     if "Technology" in agent_name:
-        return {"tech_research": research_content, "messages": messages + [response]}
+        return {"tech_research": research_content, "messages": [response]}
     elif "Market" in agent_name or "Sales" in agent_name:
-        return {"market_sales_research": research_content, "messages": messages + [response]}
+        return {"market_sales_research": research_content, "messages": [response]}
     elif "Sustainability" in agent_name or "Quality" in agent_name:
-        return {"sustainability_quality_research": research_content, "messages": messages + [response]}
+        return {"sustainability_quality_research": research_content, "messages": [response]}
     else:
         # Fallback
         logger.warning(f"Unknown research agent type: {agent_name}. Not storing research.")
-        return {"messages": messages + [response]}
+        return {"messages": [response]}
 
-# Specific runner functions for each researcher
-def run_tech_researcher(state: AgentState):
-    # Simplistic: Assume the plan guides the topic. A better way would parse the plan.
-    topic = "Technology and Product Development aspects"
-    result = run_research_agent(state, tech_researcher_agent, "Technology Researcher", topic)
-    # Decide next agent (this logic needs refinement - ideally based on plan completion)
-    next_agent = "market_sales_researcher" 
-    logger.info(f"Tech Researcher finished. Next: {next_agent}")
+# General topic per researcher, used when the plan has no tasks of its own for it
+TECH_TOPIC = "Technology and Product Development aspects"
+MARKET_SALES_TOPIC = "Market, Sales, and Cultural aspects"
+SUSTAINABILITY_QUALITY_TOPIC = "Sustainability and Quality aspects"
+RESEARCH_TOPICS = {
+    "tech_researcher": TECH_TOPIC,
+    "market_sales_researcher": MARKET_SALES_TOPIC,
+    "sustainability_quality_researcher": SUSTAINABILITY_QUALITY_TOPIC,
+}
+
+def _topic(state: AgentState, researcher: str) -> str:
+    # Sequential mode runs each researcher once, on the questions of all its planned tasks
+    questions = [task["question"] for task in state.get('research_tasks') or [] if task["agent"] == researcher]
+    return "\n".join(questions) or RESEARCH_TOPICS[researcher]
+
+def _next_researcher(state: AgentState, researcher: str) -> str:
+    # The next researcher in the planned order, or the writer after the last one
+    order = state.get('research_agents') or list(RESEARCH_TOPICS)
+    later = order[order.index(researcher) + 1:] if researcher in order else []
+    return later[0] if later else "writer"
+
+def _finish_researcher(result: dict, agent_label: str, next_agent: str) -> dict:
+    logger.info(f"{agent_label} finished. Next: {next_agent}")
     result["next_agent"] = next_agent
     return result
 
+# Specific runner functions for each researcher
+def run_tech_researcher(state: AgentState):
+    result = run_research_agent(state, get_agent("tech_researcher"), "Technology Researcher", _topic(state, "tech_researcher"))
+    return _finish_researcher(result, "Tech Researcher", _next_researcher(state, "tech_researcher"))
+
 def run_market_sales_researcher(state: AgentState):
-    topic = "Market, Sales, and Cultural aspects"
-    result = run_research_agent(state, market_sales_researcher_agent, "Market/Sales Researcher", topic)
-    next_agent = "sustainability_quality_researcher"
-    logger.info(f"Market/Sales Researcher finished. Next: {next_agent}")
-    result["next_agent"] = next_agent
-    return result
+    result = run_research_agent(state, get_agent("market_sales_researcher"), "Market/Sales Researcher", _topic(state, "market_sales_researcher"))
+    return _finish_researcher(result, "Market/Sales Researcher", _next_researcher(state, "market_sales_researcher"))
 
 def run_sustainability_quality_researcher(state: AgentState):
-    topic = "Sustainability and Quality aspects"
-    result = run_research_agent(state, sustainability_quality_researcher_agent, "Sustainability/Quality Researcher", topic)
-    next_agent = "writer" # All research done, move to writer
-    logger.info(f"Sustainability/Quality Researcher finished. Next: {next_agent}")
-    result["next_agent"] = next_agent
-    return result
+    result = run_research_agent(state, get_agent("sustainability_quality_researcher"), "Sustainability/Quality Researcher", _topic(state, "sustainability_quality_researcher"))
+    return _finish_researcher(result, "Sustainability/Quality Researcher", _next_researcher(state, "sustainability_quality_researcher"))
+
+# Async runner functions for each researcher
+async def arun_tech_researcher(state: AgentState):
+    result = await arun_research_agent(state, get_agent("tech_researcher"), "Technology Researcher", _topic(state, "tech_researcher"))
+    return _finish_researcher(result, "Tech Researcher", _next_researcher(state, "tech_researcher"))
+
+async def arun_market_sales_researcher(state: AgentState):
+    result = await arun_research_agent(state, get_agent("market_sales_researcher"), "Market/Sales Researcher", _topic(state, "market_sales_researcher"))
+    return _finish_researcher(result, "Market/Sales Researcher", _next_researcher(state, "market_sales_researcher"))
+
+async def arun_sustainability_quality_researcher(state: AgentState):
+    result = await arun_research_agent(state, get_agent("sustainability_quality_researcher"), "Sustainability/Quality Researcher", _topic(state, "sustainability_quality_researcher"))
+    return _finish_researcher(result, "Sustainability/Quality Researcher", _next_researcher(state, "sustainability_quality_researcher"))
+
+# The AgentState field each researcher owns
+RESEARCH_FIELDS = {
+    "tech_researcher": "tech_research",
+    "market_sales_researcher": "market_sales_research",
+    "sustainability_quality_researcher": "sustainability_quality_research",
+}
+
+# --- Research Tasks --- #
+# In parallel mode the planner's tasks run in waves: every task whose dependencies
+# are done is dispatched at once (see graph.route_research_tasks), and the join
+# after each wave folds the results into the research fields the writer reads.
+
+def ready_research_tasks(state: AgentState) -> List[dict]:
+    """Planned tasks that haven't run yet and whose dependencies have all finished."""
+    done = state.get('task_results') or {}
+    pending = [task for task in state.get('research_tasks') or [] if task["id"] not in done]
+    ready = [task for task in pending if all(dep in done for dep in task["depends_on"])]
+    if pending and not ready:
+        # Unreachable after sanitize_tasks, but never leave tasks stranded
+        logger.warning("No research task is ready; dispatching the remaining tasks anyway")
+        return pending
+    return ready
+
+def research_task_input(state: AgentState, task: dict) -> ResearchTaskInput:
+    """The input a dispatched task runs on: the prompt, the plan, the task and its dependencies' results."""
+    done = state.get('task_results') or {}
+    questions = {other["id"]: other["question"] for other in state.get('research_tasks') or []}
+    return {
+        "prompt": state['prompt'],
+        "plan": state.get('plan'),
+        "research_task": task,
+        "dependencies": [(questions[dep], done[dep]) for dep in task["depends_on"] if dep in done],
+    }
+
+def run_research_task(task_input: ResearchTaskInput):
+    task = task_input["research_task"]
+    logger.info(f"--- Running research task {task['id']} ({task['agent']}): {task['question']} ---")
+    messages = _research_messages(task_input, task["question"], task_input.get("dependencies"))
+    response = _research(get_agent(task["agent"]), messages, task["question"])
+    # Only this task's result: tasks of the same wave run in one step and must not write shared keys
+    return {"task_results": {task["id"]: str(response.content)}}
+
+async def arun_research_task(task_input: ResearchTaskInput):
+    task = task_input["research_task"]
+    logger.info(f"--- Running research task {task['id']} ({task['agent']}): {task['question']} ---")
+    messages = _research_messages(task_input, task["question"], task_input.get("dependencies"))
+    response = await _aresearch(get_agent(task["agent"]), messages, task["question"])
+    return {"task_results": {task["id"]: str(response.content)}}
+
+def join_research_tasks(state: AgentState) -> dict:
+    """Fold the finished tasks' results into each researcher's research field."""
+    done = state.get('task_results') or {}
+    update = {}
+    for researcher, field in RESEARCH_FIELDS.items():
+        findings = [
+            f"Spørgsmål: {task['question']}\n{done[task['id']]}"
+            for task in state.get('research_tasks') or [] if task["agent"] == researcher and task["id"] in done
+        ]
+        if findings:
+            update[field] = "\n\n".join(findings)
+    return update
 
 # 5. Synthesizer & Writer Agent
 writer_system_prompt = (
@@ -186,15 +549,84 @@ writer_system_prompt = (
     "Formatér outputtet som et komplet rapportudkast. "
     "VIGTIGT: Du skal altid skrive på dansk."
 )
-writer_agent = create_agent_runnable(llm, writer_system_prompt)
+define_agent("writer", writer_system_prompt)
+
+# "sections" revises only the sections the reviewer flagged and has the reviewer
+# re-check only those; "full" rewrites and re-reviews the whole report every time
+REVISION_MODE = os.getenv("REVISION_MODE", "sections").lower()
 
 def run_writer_agent(state: AgentState):
     """Run the writer agent to generate a draft report based on the research findings."""
     logger.info("--- Running Writer Agent ---")
-    
-    # Get the current revision count
-    current_revision = state.get('revision_count', 0)
-    
+    revision = _section_revision(state)
+    if revision:
+        sections, section_feedback, current_revision = revision
+        flagged = [section for section in sections if section["id"] in section_feedback]
+        # Rewrite the flagged sections concurrently; the rest are reused verbatim
+        responses = get_agent("writer").batch([
+            {"messages": _section_messages(state, sections, section, section_feedback[section["id"]])}
+            for section in flagged
+        ])
+        revised = {section["id"]: response.content for section, response in zip(flagged, responses)}
+        update = _section_writer_update(sections, revised, current_revision)
+        if update:
+            return update
+
+    messages, current_revision = _writer_messages(state)
+
+    # Run the writer agent
+    response = get_agent("writer").invoke({"messages": messages})
+    return _writer_update(response, current_revision)
+
+async def arun_writer_agent(state: AgentState):
+    """Async version of run_writer_agent that streams the draft as it is written.
+
+    Each token is emitted on the graph's custom stream as a `token` event tagged
+    with the node and revision, so clients can render the draft progressively.
+    """
+    logger.info("--- Running Writer Agent ---")
+    write_token = _stream_writer()
+
+    revision = _section_revision(state)
+    if revision:
+        sections, section_feedback, current_revision = revision
+        flagged = [section for section in sections if section["id"] in section_feedback]
+        # Rewrite the flagged sections concurrently; their token events carry the section id
+        responses = await asyncio.gather(*(
+            _astream_writer(
+                _section_messages(state, sections, section, section_feedback[section["id"]]),
+                write_token,
+                {"revision": current_revision, "section": section["id"]},
+            )
+            for section in flagged
+        ))
+        revised = {section["id"]: response.content for section, response in zip(flagged, responses)}
+        update = _section_writer_update(sections, revised, current_revision)
+        if update:
+            return update
+
+    messages, current_revision = _writer_messages(state)
+
+    # Stream the writer agent and accumulate the chunks into the full response
+    response = await _astream_writer(messages, write_token, {"revision": current_revision})
+    return _writer_update(response, current_revision)
+
+async def _astream_writer(messages: List[BaseMessage], write_token, tags: dict):
+    response = None
+    async for chunk in get_agent("writer").astream({"messages": messages}):
+        response = chunk if response is None else response + chunk
+        if chunk.content:
+            write_token({"type": "token", "node": "writer", **tags, "token": chunk.content})
+    return response
+
+def _stream_writer():
+    # Outside a graph run there is no custom stream to write tokens to
+    try:
+        return get_stream_writer()
+    except (RuntimeError, KeyError):
+        return lambda _: None
+
+def _research_context(state: AgentState) -> str:
     # Prepare context for the writer
     context = f"User Prompt: {state['prompt']}\n\n"
     
@@ -206,72 +638,374 @@ def run_writer_agent(state: AgentState):
         context += f"--- Market & Sales Research ---\n{state['market_sales_research']}\n\n"
     if state.get('sustainability_quality_research'):
         context += f"--- Sustainability & Quality Research ---\n{state['sustainability_quality_research']}\n\n"
+    return context
+
+def _writer_messages(state: AgentState):
+    # Get the current revision count
+    current_revision = state.get('revision_count', 0)
     
+    context = _research_context(state)
+    
+    # The research context is shared by the first draft and every revision; the feedback goes after it
+    messages = [HumanMessage(content=context)]
+    instruction = "Synthesize the information above into a research report."
+
     # Check if we need to revise an existing draft based on reviewer feedback
     if 'review_feedback' in state and state['review_feedback']:
         logger.info(f"--- Revising draft (Revision {current_revision}) ---")
-        # Add feedback to context and then clear it
-        context += f"\nReviewer Feedback (Please address this):\n{state['review_feedback']}\n"
+        instruction += f"\n\nReviewer Feedback (Please address this):\n{state['review_feedback']}"
         # Increment revision count
         current_revision += 1
-    
-    # Prepare the messages for the writer
-    messages = [
-        SystemMessage(content=writer_system_prompt),
-        HumanMessage(content=f"Synthesize the following information into a research report:\n\n{context}")
-    ]
-    
-    # Run the writer agent
-    response = writer_agent.invoke({"messages": messages})
-    
+
+    messages.append(HumanMessage(content=instruction))
+    return messages, current_revision
+
+def _writer_update(response, current_revision: int) -> dict:
     # Extract the report content
     report_content = response.content
     
     # Update the state with the draft report
     logger.info(f"Writer finished (Revision {current_revision}). Next: reviewer")
     
-    # Return updated state
+    # Return updated state. A full draft is reviewed as a whole, so no sections are marked revised.
     return {
         "draft_report": report_content,
+        "draft_sections": split_sections(report_content),
+        "section_feedback": None,
+        "revised_sections": None,
         "next_agent": "reviewer",
         "revision_count": current_revision
     }
 
+def _sections_match_draft(state: AgentState) -> bool:
+    # False if the draft was edited since the writer stored its sections (e.g. by a human before resuming)
+    sections = state.get('draft_sections')
+    return bool(sections) and join_sections(sections) == state.get('draft_report')
+
+def _current_sections(state: AgentState) -> List[Section]:
+    if _sections_match_draft(state):
+        return state['draft_sections']
+    return split_sections(state.get('draft_report') or "")
+
+def _section_revision(state: AgentState):
+    """Return (sections, feedback by section id, revision) if this revision can be done per section."""
+    if REVISION_MODE != "sections" or not state.get('review_feedback') or not state.get('section_feedback'):
+        return None
+    sections = _current_sections(state)
+    section_feedback = {section_id: feedback for section_id, feedback in state['section_feedback'].items()
+                        if any(section["id"] == section_id for section in sections)}
+    if not section_feedback:
+        return None
+    current_revision = state.get('revision_count', 0) + 1
+    logger.info(f"--- Revising sections {', '.join(section_feedback)} (Revision {current_revision}) ---")
+    return sections, section_feedback, current_revision
+
+def _section_messages(state: AgentState, sections: List[Section], section: Section, feedback: str) -> List[BaseMessage]:
+    outline = "\n".join(f"[{other['id']}] {other['title']}" for other in sections)
+    # The research context is the same as in the first draft; the outline changes with each revision
+    return [
+        HumanMessage(content=_research_context(state)),
+        HumanMessage(content=(
+            "Revise one section of an existing research report. Keep its heading and return only the "
+            "revised section, without its label; the other sections stay as they are.\n\n"
+            f"Report outline:\n{outline}\n\n"
+            f"Section to revise ([{section['id']}]):\n{section['content']}\n\n"
+            f"Reviewer Feedback for this section (Please address this):\n{feedback}"
+        )),
+    ]
+
+def _section_writer_update(sections: List[Section], revised: Dict[str, str], current_revision: int) -> Optional[dict]:
+    # None if a revision isn't just its section (e.g. the whole report again); the writer then rewrites in full
+    updated = replace_sections(sections, revised)
+    if updated is None:
+        logger.warning(f"Section revisions {', '.join(revised)} don't match their sections; rewriting the full report")
+        return None
+    sections = updated
+    logger.info(f"Writer revised sections {', '.join(revised)} (Revision {current_revision}). Next: reviewer")
+    return {
+        "draft_report": join_sections(sections),
+        "draft_sections": sections,
+        "section_feedback": None,
+        "revised_sections": list(revised),
+        "next_agent": "reviewer",
+        "revision_count": current_revision
+    }
+
+# --- Speculative Writing --- #
+# RESEARCH_MODE=speculative: the writer doesn't wait for all research. The plan's
+# research areas are the section skeleton; the introduction is written right away
+# and each area's section as soon as that area's tasks finish, while the rest of
+# the research is still running. The conclusion follows the last section.
+
+SECTION_TITLES = {
+    "tech_researcher": "Teknologi og produktudvikling",
+    "market_sales_researcher": "Marked, salg og kultur",
+    "sustainability_quality_researcher": "Bæredygtighed og kvalitet",
+}
+INTRODUCTION_TITLE = "Indledning"
+CONCLUSION_TITLE = "Konklusion"
+
+def _merged_seconds(intervals: List[Tuple[float, float]], until: Optional[float] = None) -> float:
+    """Total length of the union of (start, end) intervals, counting only time before `until`."""
+    total, covered_to = 0.0, float("-inf")
+    for start, end in sorted(intervals):
+        if until is not None:
+            end = min(end, until)
+        start = max(start, covered_to)
+        if end > start:
+            total += end - start
+            covered_to = end
+    return total
+
+def _speculative_section_messages(state: AgentState, outline: List[str], title: str, instructions: str, context: str) -> List[BaseMessage]:
+    outline_text = "\n".join(f"- {section_title}" for section_title in outline)
+    # Prompt, plan and outline are the same for every section of the draft
+    return [
+        HumanMessage(content=(
+            f"User Prompt: {state['prompt']}\n\nResearch plan:\n{state.get('plan') or ''}\n\n"
+            f"Report outline:\n{outline_text}"
+        )),
+        HumanMessage(content=(
+            f"Write only the section '{title}' of the research report outlined above. "
+            f"Start with the heading '## {title}' and write nothing outside this section. {instructions}\n\n{context}"
+        )),
+    ]
+
+async def arun_speculative_writer(state: AgentState):
+    """Run the planned research tasks and write the draft section by section as research lands."""
+    logger.info("--- Running Speculative Research and Writer ---")
+    write_token = _stream_writer()
+    research_tasks = state.get('research_tasks') or default_tasks(state.get('plan') or "")
+    areas = list(dict.fromkeys(task["agent"] for task in research_tasks))
+    outline = [INTRODUCTION_TITLE, *(SECTION_TITLES[area] for area in areas), CONCLUSION_TITLE]
+    task_results: Dict[str, str] = dict(state.get('task_results') or {})
+    started = time.perf_counter()
+    research_done_at: Dict[str, float] = {}
+    writing: List[Tuple[float, float]] = []
+
+    # Research: each task starts once the tasks it depends on have finished
+    running: Dict[str, asyncio.Task] = {}
+
+    async def research(task: dict) -> str:
+        if task["id"] in task_results:
+            return task_results[task["id"]]
+        await asyncio.gather(*(running[dep] for dep in task["depends_on"] if dep in running))
+        task_input = research_task_input({**state, "research_tasks": research_tasks, "task_results": task_results}, task)
+        update = await arun_research_task(task_input)
+        task_results.update(update["task_results"])
+        research_done_at[task["id"]] = time.perf_counter()
+        return task_results[task["id"]]
+
+    for task in research_tasks:
+        running[task["id"]] = asyncio.create_task(research(task))
+
+    async def write(section_key: str, messages: List[BaseMessage]) -> str:
+        start = time.perf_counter()
+        response = await _astream_writer(messages, write_token, {"revision": 0, "section": section_key})
+        writing.append((start, time.perf_counter()))
+        logger.info(f"Speculative writer finished section {section_key} after {time.perf_counter() - started:.2f}s")
+        return str(response.content).strip()
+
+    async def write_area(area: str) -> str:
+        area_tasks = [task for task in research_tasks if task["agent"] == area]
+        findings = await asyncio.gather(*(running[task["id"]] for task in area_tasks))
+        context = "Research Findings:\n" + "\n\n".join(
+            f"--- {task['question']} ---\n{finding}" for task, finding in zip(area_tasks, findings)
+        )
+        return await write(area, _speculative_section_messages(
+            state, outline, SECTION_TITLES[area], "Base it on the research findings below and refer to them precisely.", context
+        ))
+
+    introduction = None
+    try:
+        introduction = asyncio.create_task(write("introduction", _speculative_section_messages(
+            state, outline, INTRODUCTION_TITLE,
+            "Introduce the topic, the research questions and the structure of the report; the findings are still being researched.",
+            "",
+        )))
+        body = await asyncio.gather(*(write_area(area) for area in areas))
+        conclusion = await write("conclusion", _speculative_section_messages(
+            state, outline, CONCLUSION_TITLE, "Conclude on the sections below without repeating them.", "Report sections:\n" + "\n\n".join(body)
+        ))
+        sections = [await introduction, *body, conclusion]
+    finally:
+        # Only left running if a section or research task failed
+        for task in [*running.values(), introduction]:
+            if task is not None:
+                task.cancel()
+
+    # How much of the writing ran while research was still in progress
+    research_end = max(research_done_at.values(), default=started)
+    speculation = {
+        "research_seconds": research_end - started,
+        "writing_seconds": _merged_seconds(writing),
+        "overlap_seconds": _merged_seconds(writing, until=research_end),
+        "wall_seconds": time.perf_counter() - started,
+    }
+    metrics.record_speculation(_current_thread_id(), speculation)
+    logger.info(
+        f"Speculative writer finished: {speculation['overlap_seconds']:.2f}s of {speculation['writing_seconds']:.2f}s "
+        f"writing overlapped {speculation['research_seconds']:.2f}s of research. Next: reviewer"
+    )
+
+    # The outline is the skeleton, so the draft's sections are the ones just written
+    draft_sections: List[Section] = [
+        {"id": f"S{i}", "title": title, "content": content}
+        for i, (title, content) in enumerate(zip(outline, sections), start=1)
+    ]
+    report = join_sections(draft_sections)
+    research_state = {**state, "research_tasks": research_tasks, "task_results": task_results}
+    return {
+        **join_research_tasks(research_state),
+        "task_results": task_results,
+        "draft_report": report,
+        "draft_sections": draft_sections,
+        "section_feedback": None,
+        "revised_sections": None,
+        "speculation": speculation,
+        "next_agent": "reviewer",
+        "revision_count": state.get('revision_count', 0),
+    }
+
+def _current_thread_id() -> Optional[str]:
+    config = var_child_runnable_config.get() or {}
+    return config.get("configurable", {}).get("thread_id")
+
 # 6. Reviewer & Editor Agent
 reviewer_system_prompt = (
     "Du er Korrekturlæser-agenten. Din opgave er at kritisk evaluere rapportudkastet baseret på den oprindelige brugerprompt, planen og forskningsresultaterne. "
     "Tjek for: \n1. Nøjagtighed og relevans i forhold til prompten/planen. \n2. Fuldstændighed - er alle planlagte sektioner dækket? \n3. Sammenhæng og klarhed. \n4. Konsistens i tone og stil (akademisk). \n5. Grammatik og stavning. "
-    "Hvis rapporten er tilfredsstillende og fuldt ud adresserer prompten/planen, svar KUN med ordet 'GODKEND'. "
-    "Ellers, giv konstruktiv feedback der detaljerer de nødvendige revisioner. Giv IKKE generel ros. "
+    "Svar med værktøjet ReviewVerdict: sæt approved til true, hvis rapporten er tilfredsstillende og fuldt ud adresserer prompten/planen. "
+    "Angiv severity for det alvorligste problem (none, minor, major eller critical) og list hvert problem som et issue med konstruktiv feedback "
+    "og mærkaten for den sektion, det gælder (f.eks. S2). Giv IKKE generel ros. "
     "VIGTIGT: Du skal altid svare på dansk."
 )
-reviewer_agent = create_agent_runnable(llm, reviewer_system_prompt)
+
+class ReviewIssue(BaseModel):
+    section: str = Field(default="", description="Label of the section the issue concerns, e.g. S2. Empty if it concerns the whole report.")
+    issue: str = Field(description="The revision needed, in Danish.")
+
+class ReviewVerdict(BaseModel):
+    """The reviewer's verdict on a draft report."""
+    approved: bool = Field(description="True if the report is ready as it is.")
+    severity: Literal["none", "minor", "major", "critical"] = Field(description="Severity of the worst issue; none if there are no issues.")
+    issues: List[ReviewIssue] = Field(default_factory=list, description="Concrete revisions needed, one per issue.")
+
+define_agent("reviewer", reviewer_system_prompt, output_schema=ReviewVerdict)
+
+SEVERITY_RANKS = {"none": 0, "minor": 1, "major": 2, "critical": 3}
+# Drafts whose worst issue is at or below this severity are accepted without another revision,
+# so minor nits don't cost a full writer and reviewer pass
+REVIEW_APPROVAL_SEVERITY = os.getenv("REVIEW_APPROVAL_SEVERITY", "minor").lower()
+if REVIEW_APPROVAL_SEVERITY not in SEVERITY_RANKS:
+    raise ValueError(f"Unknown REVIEW_APPROVAL_SEVERITY '{REVIEW_APPROVAL_SEVERITY}'. Use one of: {', '.join(SEVERITY_RANKS)}.")
+
+def verdict_accepts(verdict: dict) -> bool:
+    """True if the verdict approves the draft or only has issues within REVIEW_APPROVAL_SEVERITY."""
+    return bool(verdict.get("approved")) or SEVERITY_RANKS.get(verdict.get("severity"), 3) <= SEVERITY_RANKS[REVIEW_APPROVAL_SEVERITY]
 
 def run_reviewer_agent(state: AgentState):
     logger.info("--- Running Reviewer Agent ---")
-    context = f"User Prompt: {state['prompt']}\n\nDraft Report:\n{state['draft_report']}"
-    
-    messages = [HumanMessage(content=f"Review the following draft report based on the prompt:\n\n{context}")]
-    
-    response = reviewer_agent.invoke({"messages": messages})
-    # Ensure response is AIMessage
-    if not isinstance(response, AIMessage):
-         response = AIMessage(content=str(response))
+    messages = _reviewer_messages(state)
     
-    feedback = response.content
+    response = get_agent("reviewer").invoke({"messages": messages})
+    return _reviewer_update(state, response)
+
+async def arun_reviewer_agent(state: AgentState):
+    logger.info("--- Running Reviewer Agent ---")
+    messages = _reviewer_messages(state)
+
+    response = await get_agent("reviewer").ainvoke({"messages": messages})
+    return _reviewer_update(state, response)
 
-    if feedback.strip().upper() == "APPROVE":
-        logger.info("--- Reviewer Approved ---")
+def _reviewer_messages(state: AgentState) -> List[BaseMessage]:
+    # The user prompt is the same for every review of the run, so it comes before the draft
+    prompt_message = HumanMessage(content=f"User Prompt: {state['prompt']}")
+    if REVISION_MODE != "sections":
+        return [prompt_message, HumanMessage(content=f"Review the following draft report based on the prompt:\n\nDraft Report:\n{state['draft_report']}")]
+
+    sections = _current_sections(state)
+    # An edited draft is reviewed in full
+    revised = set(state.get('revised_sections') or []) if _sections_match_draft(state) else set()
+    instructions = "Set each issue's section to the label of the section it concerns, e.g. S2."
+    changed = [section for section in sections if section["id"] in revised]
+    if changed and len(changed) < len(sections):
+        # Re-check: the other sections were already reviewed and haven't changed
+        unchanged = "\n".join(f"[{section['id']}] {section['title']}" for section in sections if section["id"] not in revised)
+        context = (
+            f"Unchanged sections (already reviewed):\n{unchanged}\n\n"
+            f"Your earlier issues:\n{state.get('review_feedback') or ''}\n\n"
+            f"Revised sections:\n{label_sections(changed)}"
+        )
+        return [prompt_message, HumanMessage(content=(
+            "Review the revised sections of the following draft report based on the prompt and your "
+            f"earlier issues. Only the revised sections are shown. {instructions}\n\n{context}"
+        ))]
+
+    context = f"Draft Report:\n{label_sections(sections)}"
+    return [prompt_message, HumanMessage(content=f"Review the following draft report based on the prompt. {instructions}\n\n{context}")]
+
+def _parse_verdict(response, sections: List[Section]) -> dict:
+    """The ReviewVerdict from the reviewer's tool call.
+
+    A plain text answer (a model ignoring the tool) is read the old way: "GODKEND" or
+    "APPROVE" approves, anything else is major feedback, tagged by section label if possible.
+    """
+    for tool_call in getattr(response, "tool_calls", None) or []:
+        if tool_call["name"] == ReviewVerdict.__name__:
+            try:
+                return ReviewVerdict.model_validate(tool_call["args"]).model_dump()
+            except ValidationError as e:
+                logger.warning(f"Invalid review verdict, treating it as text feedback: {e}")
+
+    text = str(response.content).strip()
+    if text.strip(" .'\"").upper() in ("GODKEND", "APPROVE"):
+        return {"approved": True, "severity": "none", "issues": []}
+    section_feedback = parse_section_feedback(text, sections) or {"": text}
+    issues = [{"section": section_id, "issue": feedback} for section_id, feedback in section_feedback.items()]
+    return {"approved": False, "severity": "major", "issues": issues}
+
+def _format_issues(issues: List[dict]) -> str:
+    return "\n".join(f"[{issue['section']}] {issue['issue']}" if issue.get("section") else issue["issue"] for issue in issues)
+
+def _section_feedback(issues: List[dict], sections: List[Section]) -> Optional[Dict[str, str]]:
+    # Issues for the report as a whole go with every flagged section; with none flagged
+    # (or outside section mode) the writer does a full rewrite
+    if REVISION_MODE != "sections":
+        return None
+    known = {section["id"] for section in sections}
+    general = [issue["issue"] for issue in issues if issue.get("section", "").upper() not in known]
+    by_section: Dict[str, List[str]] = {}
+    for issue in issues:
+        section_id = issue.get("section", "").upper()
+        if section_id in known:
+            by_section.setdefault(section_id, []).append(issue["issue"])
+    if not by_section:
+        return None
+    return {section_id: "\n".join(points + general) for section_id, points in by_section.items()}
+
+def _reviewer_update(state: AgentState, response) -> dict:
+    sections = _current_sections(state)
+    verdict = _parse_verdict(response, sections)
+    feedback = _format_issues(verdict["issues"])
+    # The shared history gets the verdict as text rather than a dangling tool call
+    message = AIMessage(content=json.dumps(verdict, ensure_ascii=False), name="reviewer")
+
+    if verdict_accepts(verdict):
+        logger.info(f"--- Reviewer Approved (approved: {verdict['approved']}, severity: {verdict['severity']}) ---")
         return {
-            "final_report": state['draft_report'], 
-            "messages": [response], 
+            "final_report": state['draft_report'],
+            "review_verdict": verdict,
+            "messages": [message],
             "next_agent": "END",
             "draft_report": state['draft_report']  # Keep the draft in the state
         }
     else:
-        logger.info("--- Reviewer Requested Revisions ---")
+        logger.info(f"--- Reviewer Requested Revisions (severity: {verdict['severity']}, issues: {len(verdict['issues'])}) ---")
         return {
-            "review_feedback": feedback,
-            "messages": [response],
+            "review_feedback": feedback or "Revidér rapporten.",
+            "review_verdict": verdict,
+            "section_feedback": _section_feedback(verdict["issues"], sections),
+            "messages": [message],
             "next_agent": "writer"
-        } 
\ No newline at end of file
+        }
@@ -0,0 +1,225 @@
+"""Batch report generation for cohorts of prompts.
+
+A batch runs its unique prompts with bounded concurrency, reuses one report for
+identical prompts and appends each result to a JSONL file as soon as it is
+done, so a crash loses at most the items in flight. Rerunning a batch with the
+same output file skips the items already written.
+
+    python -m backend.batch prompts.jsonl --output results.jsonl --concurrency 8
+
+The input is JSONL with one prompt per line, either a JSON string or an object
+with "prompt" and an optional "id"; a plain text line is taken as the prompt.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Set
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration --- #
+# Reports of one batch generated at the same time
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Batches the API runs at the same time; further batches wait in their own queue
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "2"))
+# Job queue priority of batch items; interactive reports (priority 0) go first
+BATCH_PRIORITY = int(os.getenv("BATCH_PRIORITY", "10"))
+BATCH_MAX_PROMPTS = int(os.getenv("BATCH_MAX_PROMPTS", "500"))
+# Where the API writes each batch's results (<batch_id>.jsonl)
+BATCH_OUTPUT_DIR = os.getenv("BATCH_OUTPUT_DIR", ".cache/batches")
+
+@dataclass
+class BatchItem:
+    id: str
+    prompt: str
+
+def parse_prompt_lines(lines: Iterable[str]) -> List[BatchItem]:
+    """Batch items from JSONL lines; items without an id are numbered by line."""
+    items = []
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            value = json.loads(line)
+        except json.JSONDecodeError:
+            value = line
+        if isinstance(value, dict):
+            prompt, item_id = value.get("prompt"), value.get("id")
+        else:
+            prompt, item_id = value, None
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise ValueError(f"Line {number} has no prompt")
+        items.append(BatchItem(id=str(item_id if item_id is not None else number), prompt=prompt))
+    ids = [item.id for item in items]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Item ids must be unique within a batch")
+    return items
+
+def normalize_prompt(prompt: str) -> str:
+    # Prompts that differ only in whitespace produce the same report
+    return " ".join(prompt.split())
+
+def completed_item_ids(output_path: str) -> Set[str]:
+    """Ids of the items already written to an output file, for resuming a batch."""
+    if not os.path.exists(output_path):
+        return set()
+    done = set()
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                done.add(str(json.loads(line)["id"]))
+            except (ValueError, KeyError, TypeError):
+                # A line cut off by a crash; that item runs again
+                continue
+    return done
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+# Runs one report and returns its final (or error) event
+RunReport = Callable[[str, str], Awaitable[dict]]
+
+async def run_batch(
+    items: List[BatchItem],
+    output_path: str,
+    run_report: RunReport,
+    concurrency: int = BATCH_CONCURRENCY,
+) -> AsyncIterator[dict]:
+    """Run a batch and yield its progress events.
+
+    Events: "batch_started", "item_started", "item_finished" (per item, including
+    duplicates) and a final "batch_finished". Each finished item is appended to
+    output_path right away.
+    """
+    done = completed_item_ids(output_path)
+    pending = [item for item in items if item.id not in done]
+    # Identical prompts run once; the first item with a prompt owns its report
+    groups: Dict[str, List[BatchItem]] = {}
+    for item in pending:
+        groups.setdefault(normalize_prompt(item.prompt), []).append(item)
+    counts = {"completed": 0, "failed": 0}
+    yield {
+        "type": "batch_started",
+        "items": len(items),
+        "skipped": len(items) - len(pending),
+        "unique_prompts": len(groups),
+        "output": output_path,
+    }
+
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    events: "asyncio.Queue[dict]" = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_group(group: List[BatchItem]) -> None:
+        owner = group[0]
+        async with semaphore:
+            thread_id = str(uuid.uuid4())
+            await events.put({"type": "item_started", "id": owner.id, "thread_id": thread_id})
+            start = time.perf_counter()
+            try:
+                event = await run_report(owner.prompt, thread_id)
+            except Exception as e:
+                logger.exception(f"Batch item {owner.id} failed")
+                event = {"type": "error", "message": f"Error generating report: {e}"}
+            seconds = time.perf_counter() - start
+        for item in group:
+            result = {
+                "id": item.id,
+                "prompt": item.prompt,
+                "status": "completed" if event.get("type") == "final" else "failed",
+                "report": event.get("report"),
+                "error": event.get("message") if event.get("type") != "final" else None,
+                "thread_id": thread_id,
+                "duplicate_of": owner.id if item is not owner else None,
+                "seconds": round(seconds, 3),
+                "metrics": event.get("metrics") if item is owner else None,
+            }
+            await events.put({"type": "item_finished", "result": result})
+
+    tasks = [asyncio.create_task(run_group(group)) for group in groups.values()]
+    finished = asyncio.gather(*tasks)
+    remaining = len(pending)
+    try:
+        with open(output_path, "a", encoding="utf-8") as output:
+            if output.tell() and not _ends_with_newline(output_path):
+                # Terminate a line cut off by a crash so the next result starts on its own line
+                output.write("\n")
+            while remaining:
+                event = await events.get()
+                if event["type"] == "item_finished":
+                    result = event["result"]
+                    # One line per item, flushed at once so a crash loses at most the items in flight
+                    output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    output.flush()
+                    counts[result["status"]] += 1
+                    remaining -= 1
+                    # Progress events stay small; the report is in the output file
+                    event = {"type": "item_finished", **{key: value for key, value in result.items() if key not in ("report", "metrics")}}
+                yield event
+        await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+    yield {"type": "batch_finished", **counts, "skipped": len(items) - len(pending), "output": output_path}
+
+# --- Command Line --- #
+
+def _load_items(path: str) -> List[BatchItem]:
+    if path == "-":
+        return parse_prompt_lines(sys.stdin)
+    with open(path, encoding="utf-8") as f:
+        return parse_prompt_lines(f)
+
+async def _run_in_process(prompt: str, thread_id: str) -> dict:
+    # Imported here: the graph and its clients are only needed once a batch runs
+    from .main import run_graph_events
+
+    final = {"type": "error", "message": "The run produced no events."}
+    async for event in run_graph_events(prompt, thread_id):
+        if event.get("type") in ("final", "error"):
+            final = event
+    return final
+
+async def _main(args) -> int:
+    from .clients import aclose_http_clients
+
+    items = _load_items(args.input)
+    if len(items) > args.max_prompts:
+        print(f"The batch has {len(items)} prompts; the limit is {args.max_prompts} (--max-prompts)", file=sys.stderr)
+        return 2
+    failed = 0
+    try:
+        async for event in run_batch(items, args.output, _run_in_process, concurrency=args.concurrency):
+            if event["type"] == "item_finished":
+                failed += event["status"] == "failed"
+                note = f" (same prompt as {event['duplicate_of']})" if event["duplicate_of"] else ""
+                print(f"[{event['status']}] {event['id']} in {event['seconds']:.1f}s{note}", file=sys.stderr)
+            elif event["type"] in ("batch_started", "batch_finished"):
+                print(json.dumps(event, ensure_ascii=False), file=sys.stderr)
+    finally:
+        await aclose_http_clients()
+    return 1 if failed else 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate reports for a JSONL file of prompts.")
+    parser.add_argument("input", help="JSONL file of prompts, or - for stdin")
+    parser.add_argument("--output", "-o", required=True, help="JSONL file results are appended to; items already in it are skipped")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="reports generated at the same time")
+    parser.add_argument("--max-prompts", type=int, default=BATCH_MAX_PROMPTS)
+    args = parser.parse_args(argv)
+    # The graph's progress logs would drown out the per-item lines
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    return asyncio.run(_main(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
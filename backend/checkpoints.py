@@ -0,0 +1,382 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+
+from .state_backend import STATE_BACKEND, StateBackend, state_backend
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration --- #
+# "memory", "sqlite", "shared" (the STATE_BACKEND store) or "none"; defaults to "shared" when STATE_BACKEND is set
+CHECKPOINTER = os.getenv("CHECKPOINTER", "memory" if STATE_BACKEND == "memory" else "shared").lower()
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", ".cache/checkpoints.sqlite3")
+# Threads with no new checkpoint for this long are deleted
+CHECKPOINT_TTL_SECONDS = float(os.getenv("CHECKPOINT_TTL_SECONDS", str(24 * 60 * 60)))
+# Checkpoints kept per thread when compacting; resuming only needs the latest
+CHECKPOINT_KEEP_LAST = int(os.getenv("CHECKPOINT_KEEP_LAST", "2"))
+CHECKPOINT_PRUNE_INTERVAL_SECONDS = float(os.getenv("CHECKPOINT_PRUNE_INTERVAL_SECONDS", "600"))
+
+# Offset between the UUID (Gregorian, 100ns) epoch and the Unix epoch
+_UUID_EPOCH_OFFSET = 0x01B21DD213814000
+
+def checkpoint_timestamp(checkpoint_id: str) -> float:
+    """Unix time a checkpoint was created, decoded from its time-ordered UUIDv6 id."""
+    value = uuid.UUID(checkpoint_id).int
+    timestamp = ((value >> 80) << 12) | ((value >> 64) & 0xFFF)
+    return (timestamp - _UUID_EPOCH_OFFSET) / 1e7
+
+async def open_checkpointer(kind: str = CHECKPOINTER) -> Optional[BaseCheckpointSaver]:
+    """Create the configured checkpointer. Must be called from a running event loop."""
+    if kind == "none":
+        return None
+    if kind == "memory":
+        return InMemorySaver()
+    if kind == "sqlite":
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+        if os.path.dirname(CHECKPOINT_DB_PATH):
+            os.makedirs(os.path.dirname(CHECKPOINT_DB_PATH), exist_ok=True)
+        conn = await aiosqlite.connect(CHECKPOINT_DB_PATH)
+        checkpointer = AsyncSqliteSaver(conn)
+        await checkpointer.setup()
+        return checkpointer
+    if kind == "shared":
+        if state_backend is None:
+            raise ValueError("CHECKPOINTER=shared needs STATE_BACKEND set to 'sqlite' or 'redis'.")
+        return SharedCheckpointSaver(state_backend)
+    raise ValueError(f"Unknown CHECKPOINTER '{kind}'. Use 'memory', 'sqlite', 'shared' or 'none'.")
+
+async def close_checkpointer(checkpointer: Optional[BaseCheckpointSaver]) -> None:
+    conn = getattr(checkpointer, "conn", None)
+    if conn is not None:
+        await conn.close()
+
+async def prune_checkpoints(
+    checkpointer: Optional[BaseCheckpointSaver],
+    ttl_seconds: float = CHECKPOINT_TTL_SECONDS,
+    keep_last: int = CHECKPOINT_KEEP_LAST,
+) -> Dict[str, int]:
+    """Delete expired threads and compact the rest down to their last keep_last checkpoints."""
+    if checkpointer is None:
+        return {"expired_threads": 0, "compacted_checkpoints": 0}
+    keep_last = max(1, keep_last)
+    if isinstance(checkpointer, SharedCheckpointSaver):
+        # Compacted on every put and expired by the backend
+        return {"expired_threads": 0, "compacted_checkpoints": 0}
+    if isinstance(checkpointer, InMemorySaver):
+        result = _prune_memory(checkpointer, ttl_seconds, keep_last)
+    elif hasattr(checkpointer, "conn"):
+        result = await _prune_sqlite(checkpointer, ttl_seconds, keep_last)
+    else:
+        logger.warning(f"Pruning is not supported for {type(checkpointer).__name__}")
+        return {"expired_threads": 0, "compacted_checkpoints": 0}
+    if any(result.values()):
+        logger.info(f"Pruned checkpoints: {result}")
+    return result
+
+def _prune_memory(checkpointer: InMemorySaver, ttl_seconds: float, keep_last: int) -> Dict[str, int]:
+    cutoff = time.time() - ttl_seconds
+    expired = [
+        thread_id for thread_id, namespaces in checkpointer.storage.items()
+        if all(checkpoint_timestamp(max(checkpoints)) < cutoff for checkpoints in namespaces.values() if checkpoints)
+    ]
+    for thread_id in expired:
+        checkpointer.delete_thread(thread_id)
+
+    compacted = 0
+    for thread_id, namespaces in checkpointer.storage.items():
+        for checkpoint_ns, checkpoints in namespaces.items():
+            stale = sorted(checkpoints)[:-keep_last]
+            if not stale:
+                continue
+            for checkpoint_id in stale:
+                del checkpoints[checkpoint_id]
+                checkpointer.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            compacted += len(stale)
+
+            # Drop channel blobs no remaining checkpoint refers to
+            referenced = set()
+            for checkpoint, _, _ in checkpoints.values():
+                channel_versions = checkpointer.serde.loads_typed(checkpoint)["channel_versions"]
+                referenced.update(channel_versions.items())
+            for key in [k for k in checkpointer.blobs if k[0] == thread_id and k[1] == checkpoint_ns]:
+                if (key[2], key[3]) not in referenced:
+                    del checkpointer.blobs[key]
+    return {"expired_threads": len(expired), "compacted_checkpoints": compacted}
+
+async def _prune_sqlite(checkpointer, ttl_seconds: float, keep_last: int) -> Dict[str, int]:
+    await checkpointer.setup()
+    cutoff = time.time() - ttl_seconds
+    async with checkpointer.lock:
+        async with checkpointer.conn.execute(
+            "SELECT thread_id, MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id"
+        ) as cursor:
+            latest = await cursor.fetchall()
+    expired = [thread_id for thread_id, checkpoint_id in latest if checkpoint_timestamp(checkpoint_id) < cutoff]
+    for thread_id in expired:
+        await checkpointer.adelete_thread(thread_id)
+
+    async with checkpointer.lock:
+        cursor = await checkpointer.conn.execute(
+            "DELETE FROM checkpoints WHERE (thread_id, checkpoint_ns, checkpoint_id) IN ("
+            "SELECT thread_id, checkpoint_ns, checkpoint_id FROM ("
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, ROW_NUMBER() OVER ("
+            "PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS position "
+            "FROM checkpoints) WHERE position > ?)",
+            (keep_last,),
+        )
+        compacted = cursor.rowcount
+        await checkpointer.conn.execute(
+            "DELETE FROM writes WHERE NOT EXISTS (SELECT 1 FROM checkpoints c WHERE "
+            "c.thread_id = writes.thread_id AND c.checkpoint_ns = writes.checkpoint_ns "
+            "AND c.checkpoint_id = writes.checkpoint_id)"
+        )
+        await checkpointer.conn.commit()
+    return {"expired_threads": len(expired), "compacted_checkpoints": compacted}
+
+# --- Shared Checkpoints --- #
+
+def _pack(*parts) -> bytes:
+    """Join str/bytes parts with NUL bytes; only the last part may contain NULs."""
+    return b"\0".join(part if isinstance(part, bytes) else part.encode("utf-8") for part in parts)
+
+def _unpack(value: bytes, count: int) -> List[bytes]:
+    return value.split(b"\0", count - 1)
+
+class SharedCheckpointSaver(BaseCheckpointSaver):
+    """Checkpointer on the shared state backend, so any worker can resume any run.
+
+    Per thread and namespace, an index hash maps checkpoint ids to their parents;
+    each checkpoint (with its channel values inline) and its pending writes are
+    hashes of their own. Every put renews the thread's ttl and compacts it down to
+    its last keep_last checkpoints, so no separate pruning pass is needed.
+    """
+
+    def __init__(
+        self,
+        backend: StateBackend,
+        ttl_seconds: float = CHECKPOINT_TTL_SECONDS,
+        keep_last: int = CHECKPOINT_KEEP_LAST,
+    ):
+        super().__init__()
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.keep_last = max(1, keep_last)
+
+    # --- Keys --- #
+
+    @staticmethod
+    def _namespaces_key(thread_id: str) -> str:
+        return f"checkpoint-threads:{thread_id}"
+
+    @staticmethod
+    def _index_key(thread_id: str, checkpoint_ns: str) -> str:
+        return f"checkpoints:{thread_id}:index:{checkpoint_ns}"
+
+    @staticmethod
+    def _checkpoint_key(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> str:
+        return f"checkpoints:{thread_id}:checkpoint:{checkpoint_ns}:{checkpoint_id}"
+
+    @staticmethod
+    def _writes_key(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> str:
+        return f"checkpoints:{thread_id}:writes:{checkpoint_ns}:{checkpoint_id}"
+
+    # --- Reading --- #
+
+    def _load(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> Optional[CheckpointTuple]:
+        stored = self.backend.hgetall(self._checkpoint_key(thread_id, checkpoint_ns, checkpoint_id))
+        if not stored:
+            return None
+        checkpoint_type, checkpoint = _unpack(stored["checkpoint"], 2)
+        metadata_type, metadata = _unpack(stored["metadata"], 2)
+        writes = []
+        for value in self.backend.hgetall(self._writes_key(thread_id, checkpoint_ns, checkpoint_id)).values():
+            task_id, channel, task_path, idx, value_type, data = _unpack(value, 6)
+            writes.append((task_path.decode(), task_id.decode(), int(idx), channel.decode(), (value_type.decode(), data)))
+        writes.sort(key=lambda write: write[:3])
+        parent_id = stored.get("parent", b"").decode()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=self.serde.loads_typed((checkpoint_type.decode(), checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type.decode(), metadata)),
+            pending_writes=[(task_id, channel, self.serde.loads_typed(value)) for _, task_id, _, channel, value in writes],
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+        )
+
+    def _checkpoint_ids(self, thread_id: str, checkpoint_ns: str) -> List[str]:
+        return sorted(self.backend.hgetall(self._index_key(thread_id, checkpoint_ns)), reverse=True)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        if checkpoint_id := get_checkpoint_id(config):
+            return self._load(thread_id, checkpoint_ns, checkpoint_id)
+        # Newest first; an entry whose checkpoint already expired is skipped
+        for checkpoint_id in self._checkpoint_ids(thread_id, checkpoint_ns):
+            if (checkpoint := self._load(thread_id, checkpoint_ns, checkpoint_id)) is not None:
+                return checkpoint
+        return None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        if config:
+            thread_ids = [config["configurable"]["thread_id"]]
+        else:
+            prefix = self._namespaces_key("")
+            thread_ids = [key[len(prefix):] for key in self.backend.keys(prefix)]
+        config_ns = config["configurable"].get("checkpoint_ns") if config else None
+        config_checkpoint_id = get_checkpoint_id(config) if config else None
+        before_id = get_checkpoint_id(before) if before else None
+        for thread_id in thread_ids:
+            for checkpoint_ns in self.backend.hgetall(self._namespaces_key(thread_id)):
+                if config_ns is not None and checkpoint_ns != config_ns:
+                    continue
+                for checkpoint_id in self._checkpoint_ids(thread_id, checkpoint_ns):
+                    if config_checkpoint_id and checkpoint_id != config_checkpoint_id:
+                        continue
+                    if before_id and checkpoint_id >= before_id:
+                        continue
+                    checkpoint = self._load(thread_id, checkpoint_ns, checkpoint_id)
+                    if checkpoint is None:
+                        continue
+                    if filter and not all(checkpoint.metadata.get(key) == value for key, value in filter.items()):
+                        continue
+                    if limit is not None and limit <= 0:
+                        return
+                    if limit is not None:
+                        limit -= 1
+                    yield checkpoint
+
+    # --- Writing --- #
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        parent_id = config["configurable"].get("checkpoint_id") or ""
+        self.backend.hset(
+            self._checkpoint_key(thread_id, checkpoint_ns, checkpoint["id"]),
+            {
+                "checkpoint": _pack(*self.serde.dumps_typed(checkpoint)),
+                "metadata": _pack(*self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))),
+                "parent": parent_id,
+            },
+            ttl=self.ttl_seconds,
+        )
+        self.backend.hset(self._index_key(thread_id, checkpoint_ns), {checkpoint["id"]: parent_id}, ttl=self.ttl_seconds)
+        self.backend.hset(self._namespaces_key(thread_id), {checkpoint_ns: "1"}, ttl=self.ttl_seconds)
+        self._compact(thread_id, checkpoint_ns)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = self._writes_key(thread_id, checkpoint_ns, config["configurable"]["checkpoint_id"])
+        existing = self.backend.hgetall(key)
+        mapping = {}
+        for i, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, i)
+            field = f"{task_id}:{idx}"
+            # Regular writes are stored once; special ones (errors, interrupts) replace earlier ones
+            if idx >= 0 and field in existing:
+                continue
+            mapping[field] = _pack(task_id, channel, task_path, str(idx), *self.serde.dumps_typed(value))
+        if mapping:
+            self.backend.hset(key, mapping, ttl=self.ttl_seconds)
+
+    def _compact(self, thread_id: str, checkpoint_ns: str) -> None:
+        stale = self._checkpoint_ids(thread_id, checkpoint_ns)[self.keep_last:]
+        if not stale:
+            return
+        self.backend.delete(*(
+            key for checkpoint_id in stale for key in (
+                self._checkpoint_key(thread_id, checkpoint_ns, checkpoint_id),
+                self._writes_key(thread_id, checkpoint_ns, checkpoint_id),
+            )
+        ))
+        self.backend.hdel(self._index_key(thread_id, checkpoint_ns), *stale)
+
+    def delete_thread(self, thread_id: str) -> None:
+        keys = [self._namespaces_key(thread_id)]
+        for checkpoint_ns in self.backend.hgetall(self._namespaces_key(thread_id)):
+            keys.append(self._index_key(thread_id, checkpoint_ns))
+            for checkpoint_id in self._checkpoint_ids(thread_id, checkpoint_ns):
+                keys.append(self._checkpoint_key(thread_id, checkpoint_ns, checkpoint_id))
+                keys.append(self._writes_key(thread_id, checkpoint_ns, checkpoint_id))
+        self.backend.delete(*keys)
+
+    # --- Async --- #
+    # The backend is blocking, so the async methods run the sync ones in a thread
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        checkpoints = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
@@ -0,0 +1,131 @@
+import os
+import logging
+import threading
+from typing import Dict, Optional
+
+import httpx
+
+from .resilience import (
+    AsyncResilientTransport,
+    CircuitBreaker,
+    RateLimiter,
+    ResiliencePolicy,
+    ResilientTransport,
+    estimate_request_tokens,
+)
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration --- #
+# Defaults for every upstream's connection pool; override per upstream with
+# <UPSTREAM>_HTTP_MAX_CONNECTIONS etc. (e.g. OPENAI_HTTP_MAX_CONNECTIONS)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+# Seconds an idle keep-alive connection is kept open
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "120"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "10"))
+
+# Retries with jittered exponential backoff; Retry-After is honoured up to the max delay
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "4"))
+HTTP_BACKOFF_BASE_SECONDS = float(os.getenv("HTTP_BACKOFF_BASE_SECONDS", "0.5"))
+HTTP_BACKOFF_MAX_SECONDS = float(os.getenv("HTTP_BACKOFF_MAX_SECONDS", "30"))
+# Consecutive failures (5xx or connection errors) that open an upstream's circuit, and for how long
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Quotas shared by every concurrent report in this process; 0 disables a limit
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "200000"))
+# Completion tokens assumed for requests that don't set max_tokens
+OPENAI_COMPLETION_TOKEN_ESTIMATE = int(os.getenv("OPENAI_COMPLETION_TOKEN_ESTIMATE", "1000"))
+TAVILY_RPM = float(os.getenv("TAVILY_RPM", "100"))
+
+UPSTREAMS = ("openai", "tavily")
+
+def _setting(upstream: str, name: str, default):
+    value = os.getenv(f"{upstream.upper()}_{name}")
+    return type(default)(value) if value else default
+
+def _limits(upstream: str) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=_setting(upstream, "HTTP_MAX_CONNECTIONS", HTTP_MAX_CONNECTIONS),
+        max_keepalive_connections=_setting(upstream, "HTTP_MAX_KEEPALIVE_CONNECTIONS", HTTP_MAX_KEEPALIVE_CONNECTIONS),
+        keepalive_expiry=_setting(upstream, "HTTP_KEEPALIVE_EXPIRY", HTTP_KEEPALIVE_EXPIRY),
+    )
+
+def http_timeout(upstream: str) -> httpx.Timeout:
+    return httpx.Timeout(
+        _setting(upstream, "HTTP_TIMEOUT_SECONDS", HTTP_TIMEOUT_SECONDS),
+        connect=_setting(upstream, "HTTP_CONNECT_TIMEOUT_SECONDS", HTTP_CONNECT_TIMEOUT_SECONDS),
+    )
+
+def _build_policy(upstream: str) -> ResiliencePolicy:
+    if upstream == "openai":
+        rate_limiter = RateLimiter(OPENAI_RPM, OPENAI_TPM)
+        estimate_tokens = lambda request: estimate_request_tokens(request, OPENAI_COMPLETION_TOKEN_ESTIMATE)
+    else:
+        rate_limiter = RateLimiter(TAVILY_RPM)
+        estimate_tokens = None
+    return ResiliencePolicy(
+        upstream,
+        rate_limiter=rate_limiter,
+        circuit_breaker=CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS),
+        max_retries=HTTP_MAX_RETRIES,
+        backoff_base=HTTP_BACKOFF_BASE_SECONDS,
+        backoff_max=HTTP_BACKOFF_MAX_SECONDS,
+        estimate_tokens=estimate_tokens,
+        on_event=metrics.record_upstream_event,
+    )
+
+# One policy per upstream, shared by its sync and async clients
+_policies: Dict[str, ResiliencePolicy] = {}
+_http_clients: Dict[str, httpx.Client] = {}
+_async_http_clients: Dict[str, httpx.AsyncClient] = {}
+_lock = threading.Lock()
+
+def _get_policy(upstream: str) -> ResiliencePolicy:
+    # Callers hold _lock
+    policy = _policies.get(upstream)
+    if policy is None:
+        policy = _policies[upstream] = _build_policy(upstream)
+    return policy
+
+def get_http_client(upstream: str = "openai") -> httpx.Client:
+    """Shared pooled client for sync calls to one upstream (sync graph nodes run on worker threads)."""
+    with _lock:
+        client = _http_clients.get(upstream)
+        if client is None:
+            transport = ResilientTransport(httpx.HTTPTransport(limits=_limits(upstream)), _get_policy(upstream))
+            client = _http_clients[upstream] = httpx.Client(transport=transport, timeout=http_timeout(upstream))
+        return client
+
+def get_async_http_client(upstream: str = "openai") -> httpx.AsyncClient:
+    """Shared pooled client for async calls to one upstream. Bound to the event loop that first uses it."""
+    with _lock:
+        client = _async_http_clients.get(upstream)
+        if client is None:
+            transport = AsyncResilientTransport(httpx.AsyncHTTPTransport(limits=_limits(upstream)), _get_policy(upstream))
+            client = _async_http_clients[upstream] = httpx.AsyncClient(transport=transport, timeout=http_timeout(upstream))
+        return client
+
+def circuit_states() -> Dict[str, Optional[str]]:
+    """Circuit breaker state per upstream ("closed", "open" or "half_open"; None before first use)."""
+    with _lock:
+        return {
+            upstream: _policies[upstream].circuit_breaker.state if upstream in _policies else None
+            for upstream in UPSTREAMS
+        }
+
+async def aclose_http_clients() -> None:
+    """Close the shared clients; they are recreated if used again."""
+    with _lock:
+        http_clients = list(_http_clients.values())
+        async_http_clients = list(_async_http_clients.values())
+        _http_clients.clear()
+        _async_http_clients.clear()
+    for client in async_http_clients:
+        await client.aclose()
+    for client in http_clients:
+        client.close()
@@ -1,29 +1,41 @@
+import os
 import logging # Import logging
 from langgraph.graph import StateGraph, END, START
+from langgraph.types import Send
 from backend.state import AgentState
 from backend.agents import (
-    run_planner_agent,
-    run_tech_researcher,
-    run_market_sales_researcher,
-    run_sustainability_quality_researcher,
-    run_writer_agent,
-    run_reviewer_agent
+    arun_planner_agent,
+    arun_tech_researcher,
+    arun_market_sales_researcher,
+    arun_sustainability_quality_researcher,
+    arun_writer_agent,
+    arun_reviewer_agent,
+    arun_research_task,
+    join_research_tasks,
+    ready_research_tasks,
+    research_task_input,
+    arun_speculative_writer,
 )
+from backend.metrics import instrument_node
 from langchain_core.tracers.langchain import wait_for_all_tracers
 
 # Get the logger configured in main.py
 logger = logging.getLogger(__name__)
 
-# Define the nodes for the graph
+# Define the nodes for the graph. The async runners keep LLM and search I/O
+# off the executor threads, so one worker can serve many concurrent reports.
 nodes = {
-    "planner": run_planner_agent,
-    "tech_researcher": run_tech_researcher,
-    "market_sales_researcher": run_market_sales_researcher,
-    "sustainability_quality_researcher": run_sustainability_quality_researcher,
-    "writer": run_writer_agent,
-    "reviewer": run_reviewer_agent,
+    "planner": arun_planner_agent,
+    "tech_researcher": arun_tech_researcher,
+    "market_sales_researcher": arun_market_sales_researcher,
+    "sustainability_quality_researcher": arun_sustainability_quality_researcher,
+    "writer": arun_writer_agent,
+    "reviewer": arun_reviewer_agent,
 }
 
+# The research nodes of sequential mode
+RESEARCHERS = ("tech_researcher", "market_sales_researcher", "sustainability_quality_researcher")
+
 # Define the conditional routing logic
 def route_after_planner(state: AgentState):
     # Based on the planner's decision (stored in next_agent)
@@ -31,20 +43,17 @@ def route_after_planner(state: AgentState):
     return state['next_agent']
 
 def route_after_research(state: AgentState):
+    # Sequential mode: the next researcher in the planned order, then the writer
     next_agent = state.get('next_agent') # Use .get for safety
     logger.info(f"--- Routing after Research: Next agent is {next_agent} ---")
-    if next_agent == "writer":
-        return "writer"
-    elif next_agent == "market_sales_researcher":
-        return "market_sales_researcher"
-    elif next_agent == "sustainability_quality_researcher":
-        return "sustainability_quality_researcher"
-    else:
-        # Fallback or error case
-        logger.warning(f"Unexpected next_agent '{next_agent}' after research. Defaulting to writer.")
-        return "writer"
+    if next_agent in RESEARCHERS or next_agent == "writer":
+        return next_agent
+    # Fallback or error case
+    logger.warning(f"Unexpected next_agent '{next_agent}' after research. Defaulting to writer.")
+    return "writer"
 
-MAX_REVISIONS = 1
+# Incremental section revisions (REVISION_MODE=sections) make extra rounds cheap enough to raise this
+MAX_REVISIONS = int(os.getenv("MAX_REVISIONS", "1"))
 
 def route_after_review(state: AgentState):
     next_agent = state.get('next_agent') 
@@ -91,78 +100,108 @@ def route_after_review(state: AgentState):
         logger.warning(f"Unexpected next_agent '{next_agent}' after review. Defaulting to END.")
         return END
 
-# Build the graph
-workflow = StateGraph(AgentState)
-
-# Add nodes
-workflow.add_node("planner", run_planner_agent)
-workflow.add_node("tech_researcher", run_tech_researcher)
-workflow.add_node("market_sales_researcher", run_market_sales_researcher)
-workflow.add_node("sustainability_quality_researcher", run_sustainability_quality_researcher)
-workflow.add_node("writer", run_writer_agent)
-workflow.add_node("reviewer", run_reviewer_agent)
-
-# Define edges and conditional routing
-workflow.add_edge(START, "planner")
-
-# Planner decides the first researcher
-workflow.add_conditional_edges(
-    "planner",
-    route_after_planner,
-    {
-        "tech_researcher": "tech_researcher",
-        "market_sales_researcher": "market_sales_researcher",
-        "sustainability_quality_researcher": "sustainability_quality_researcher",
-    }
-)
-
-# Research agents route sequentially or to the writer
-workflow.add_conditional_edges(
-    "tech_researcher",
-    route_after_research,
-    {
-        "market_sales_researcher": "market_sales_researcher",
-        "sustainability_quality_researcher": "sustainability_quality_researcher",
-        "writer": "writer"
-    }
-)
-workflow.add_conditional_edges(
-    "market_sales_researcher",
-    route_after_research,
-    {
-        "sustainability_quality_researcher": "sustainability_quality_researcher",
-        "writer": "writer"
-    }
-)
-workflow.add_conditional_edges(
-    "sustainability_quality_researcher",
-    route_after_research,
-    {
-        "writer": "writer"
-    }
-)
-
-# Writer always goes to reviewer
-workflow.add_edge("writer", "reviewer")
-
-# Reviewer routes back to writer or ends the process
-workflow.add_conditional_edges(
-    "reviewer",
-    route_after_review,
-    {
-        "writer": "writer",
-        END: END
-    }
-)
-
-# Compile the graph with config
-app = workflow.compile(
-    checkpointer=None,  # Disable checkpointing for now
-    interrupt_before=["reviewer"],  # Allow interruption before review for human-in-the-loop
-    interrupt_after=["writer"],    # Allow interruption after writing for human-in-the-loop
-)
-
-logger.info("LangGraph compiled successfully!")
+def route_research_tasks(state: AgentState):
+    # Parallel mode: dispatch every planned task whose dependencies are done, all in the
+    # same step; once none are left, the writer takes over
+    ready = ready_research_tasks(state)
+    if not ready:
+        logger.info("--- All research tasks finished. Next: writer ---")
+        return "writer"
+    logger.info(f"--- Dispatching research tasks: {', '.join(task['id'] for task in ready)} ---")
+    return [Send("research_task", research_task_input(state, task)) for task in ready]
+
+def join_research(state: AgentState):
+    # Runs once per wave, after all of its tasks have finished
+    return {**join_research_tasks(state), "next_agent": "writer"}
+
+# "parallel" runs the planner's research tasks concurrently as their dependencies
+# allow, "sequential" chains the planned researchers and "speculative" runs the tasks
+# while the writer drafts the sections whose research has landed
+RESEARCH_MODE = os.getenv("RESEARCH_MODE", "parallel").lower()
+
+def build_workflow(research_mode: str = RESEARCH_MODE) -> StateGraph:
+    """Build the report workflow with sequential, parallel or speculative research."""
+    if research_mode not in ("sequential", "parallel", "speculative"):
+        raise ValueError(f"Unknown RESEARCH_MODE '{research_mode}'. Use 'sequential', 'parallel' or 'speculative'.")
+
+    workflow = StateGraph(AgentState)
+
+    def add_node(name: str, func):
+        # Every node is timed per thread_id for /metrics and the run summary
+        workflow.add_node(name, instrument_node(name, func))
+
+    # Add nodes
+    add_node("planner", nodes["planner"])
+    add_node("writer", nodes["writer"])
+    add_node("reviewer", nodes["reviewer"])
+
+    # Define edges and conditional routing
+    workflow.add_edge(START, "planner")
+
+    if research_mode == "speculative":
+        # Research and the first draft happen in one node; revisions use the regular writer
+        add_node("speculative_writer", arun_speculative_writer)
+        workflow.add_edge("planner", "speculative_writer")
+        workflow.add_edge("speculative_writer", "reviewer")
+    elif research_mode == "parallel":
+        add_node("research_task", arun_research_task)
+        add_node("research_join", join_research)
+
+        # Planner dispatches the first wave of tasks; each wave feeds the join, which
+        # dispatches the tasks that depended on it or hands over to the writer
+        workflow.add_conditional_edges("planner", route_research_tasks, ["research_task", "writer"])
+        workflow.add_edge("research_task", "research_join")
+        workflow.add_conditional_edges("research_join", route_research_tasks, ["research_task", "writer"])
+    else:
+        for researcher in RESEARCHERS:
+            add_node(researcher, nodes[researcher])
+
+        # The planner's tasks decide which researchers run, and in what order
+        workflow.add_conditional_edges("planner", route_after_planner, {researcher: researcher for researcher in RESEARCHERS})
+
+        # Each researcher hands over to the next one in the plan, the last one to the writer
+        for researcher in RESEARCHERS:
+            workflow.add_conditional_edges(
+                researcher,
+                route_after_research,
+                {**{other: other for other in RESEARCHERS if other != researcher}, "writer": "writer"},
+            )
+
+    # Writer always goes to reviewer
+    workflow.add_edge("writer", "reviewer")
+
+    # Reviewer routes back to writer or ends the process
+    workflow.add_conditional_edges(
+        "reviewer",
+        route_after_review,
+        {
+            "writer": "writer",
+            END: END
+        }
+    )
+    return workflow
+
+# Pause after the writer and before review for human-in-the-loop. Paused runs continue via the resume
+# endpoint, so this needs a checkpointer; without one the run just stops there.
+HUMAN_IN_THE_LOOP = os.getenv("HUMAN_IN_THE_LOOP", "false").lower() == "true"
+
+def compile_graph(research_mode: str = RESEARCH_MODE, checkpointer=None):
+    """Compile the report workflow for the given research mode.
+
+    The API server attaches its checkpointer at startup (see backend.checkpoints),
+    so the module-level app is compiled without one.
+    """
+    return build_workflow(research_mode).compile(
+        checkpointer=checkpointer,
+        interrupt_before=["reviewer"] if HUMAN_IN_THE_LOOP else None,  # Allow interruption before review for human-in-the-loop
+        interrupt_after=["writer"] if HUMAN_IN_THE_LOOP else None,    # Allow interruption after writing for human-in-the-loop
+    )
+
+# Build and compile the graph
+workflow = build_workflow()
+app = compile_graph()
+
+logger.info(f"LangGraph compiled successfully! (research mode: {RESEARCH_MODE})")
 
 # This ensures all traces are properly captured
 def cleanup_traces():
@@ -0,0 +1,395 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import itertools
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+from .state_backend import StateBackend
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration --- #
+# Max number of reports generated at the same time across all requests
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Max number of queued jobs before new submissions are rejected
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "100"))
+# Finished jobs (and their event history) are kept this long for reattaching
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+# How often finished jobs past their retention are dropped (they are also dropped on every submit)
+JOB_EXPIRY_INTERVAL_SECONDS = float(os.getenv("JOB_EXPIRY_INTERVAL_SECONDS", "60"))
+# How often a worker checks the shared backend for new events of a job another worker runs
+STATE_POLL_INTERVAL_SECONDS = float(os.getenv("STATE_POLL_INTERVAL_SECONDS", "0.25"))
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at JOB_QUEUE_MAX."""
+
+@dataclass
+class Job:
+    """A queued or running report generation and the events it has produced."""
+    id: str
+    prompt: str
+    priority: int = 0
+    options: Dict[str, Any] = field(default_factory=dict)
+    sequence: int = 0
+    status: str = "queued"  # queued, running, completed, failed
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+    # None stands in for an event compacted away once the job completed (see JobManager)
+    events: List[Optional[dict]] = field(default_factory=list)
+    changed: asyncio.Condition = field(default_factory=asyncio.Condition, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def record(self) -> Dict[str, Any]:
+        """The job without its events, as stored in the shared backend."""
+        return {
+            "id": self.id,
+            "prompt": self.prompt,
+            "priority": self.priority,
+            "options": self.options,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "wait_seconds": (self.started_at or time.time()) - self.submitted_at,
+            "event_count": len(self.events),
+            "error": self.error,
+        }
+
+class JobManager:
+    """Priority job queue drained by a fixed pool of async workers.
+
+    run_job is an async generator factory producing a job's events (dicts with a
+    "type" key). Lower priority numbers run first; equal priorities run FIFO.
+    Every event is kept on the job so subscribers can reattach and replay, except
+    that events of compact_types (e.g. per-token output a final event repeats) are
+    replaced by None once the job completes, so the other events keep their ids.
+
+    With a shared backend, each job and its events are also copied there as they
+    happen (under namespace), so any worker of the deployment can report on and
+    stream a job another worker runs. Queue positions and metrics stay per worker.
+    """
+
+    def __init__(
+        self,
+        run_job: Callable[[Job], AsyncIterator[dict]],
+        max_workers: int = JOB_WORKERS,
+        max_queue_size: int = JOB_QUEUE_MAX,
+        retention_seconds: float = JOB_RETENTION_SECONDS,
+        backend: Optional[StateBackend] = None,
+        namespace: str = "jobs",
+        poll_interval: float = STATE_POLL_INTERVAL_SECONDS,
+        compact_types: Tuple[str, ...] = (),
+        expiry_interval: float = JOB_EXPIRY_INTERVAL_SECONDS,
+    ):
+        self.run_job = run_job
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.retention_seconds = retention_seconds
+        self.backend = backend
+        self.namespace = namespace
+        self.poll_interval = poll_interval
+        self.compact_types = compact_types
+        self.expiry_interval = expiry_interval
+        self.jobs: Dict[str, Job] = {}
+        # Tasks copying jobs to the shared backend, by job id; referenced here so they aren't garbage collected
+        self._mirrors: Dict[str, asyncio.Task] = {}
+        self._queue: "asyncio.PriorityQueue[Tuple[int, int, str]]" = asyncio.PriorityQueue()
+        self._sequence = itertools.count()
+        self._workers: List[asyncio.Task] = []
+        self._expiry: Optional[asyncio.Task] = None
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        # Recent queue wait times in seconds, for the metrics endpoint
+        self._wait_times: Deque[float] = deque(maxlen=1000)
+
+    def start(self) -> None:
+        """Start the worker pool. Must be called from a running event loop; idempotent."""
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.max_workers)]
+        self._expiry = asyncio.create_task(self._expire_periodically())
+        logger.info(f"Started {self.max_workers} job workers")
+
+    async def stop(self) -> None:
+        tasks = [*self._workers, *([self._expiry] if self._expiry else [])]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers, self._expiry = [], None
+        if self._mirrors:
+            # Jobs that never ran are failed too, so workers following them through the backend stop waiting
+            for job in self.jobs.values():
+                if job.status == "queued":
+                    job.status, job.error, job.finished_at = "failed", "Server shutting down", time.time()
+                    async with job.changed:
+                        job.changed.notify_all()
+            mirrors = list(self._mirrors.values())
+            await asyncio.wait(mirrors, timeout=5)
+            for mirror in mirrors:
+                mirror.cancel()
+
+    def submit(self, prompt: str, priority: int = 0, job_id: Optional[str] = None, **options) -> Job:
+        """Queue a job and return it. Raises QueueFullError if the queue is full.
+
+        The id of a finished job can be given again (e.g. to resume its run); the
+        new job and its events replace the old ones.
+        """
+        # Workers are normally started by the app's lifespan; start them here otherwise
+        self.start()
+        self._expire_finished()
+        existing = self.jobs.get(job_id) if job_id else None
+        if existing is not None and not existing.done:
+            raise ValueError(f"Job {job_id} is still {existing.status}")
+        if self._queue.qsize() >= self.max_queue_size:
+            self._rejected += 1
+            raise QueueFullError(f"Job queue is full ({self.max_queue_size} jobs waiting)")
+        job = Job(id=job_id or str(uuid.uuid4()), prompt=prompt, priority=priority, options=options, sequence=next(self._sequence))
+        self.jobs[job.id] = job
+        if self.backend is not None:
+            # A job replacing a finished one waits for the old job's last writes before taking over its keys
+            mirror = asyncio.create_task(self._mirror(job, after=self._mirrors.get(job.id)))
+            self._mirrors[job.id] = mirror
+            mirror.add_done_callback(lambda task: self._mirrors.pop(job.id) if self._mirrors.get(job.id) is task else None)
+        self._queue.put_nowait((priority, job.sequence, job.id))
+        logger.info(f"Queued job {job.id} (priority {priority}, queue depth {self._queue.qsize()})")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    async def find(self, job_id: str) -> Optional[Job]:
+        """The job, from this worker or else (with a shared backend) as another worker last stored it."""
+        job = self.jobs.get(job_id)
+        if job is None and self.backend is not None:
+            job = await asyncio.to_thread(self._load_shared, job_id)
+        return job
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based position of a queued job in the queue, or None if it isn't queued."""
+        job = self.jobs.get(job_id)
+        if job is None or job.status != "queued":
+            return None
+        return 1 + sum(
+            1 for other in self.jobs.values()
+            if other.status == "queued" and (other.priority, other.sequence) < (job.priority, job.sequence)
+        )
+
+    async def subscribe(self, job_id: str, after: int = -1, heartbeat: Optional[float] = None) -> AsyncIterator[Tuple[Optional[int], Optional[dict]]]:
+        """Yield (event_id, event) for the job's events after the given event id, then live ones.
+
+        Event ids are the events' positions in the job history, so a client that
+        lost its connection can pass its last seen id to pick up where it left off.
+        With heartbeat, (None, None) is yielded after that many seconds without an
+        event, so a stream can show it is still alive.
+        """
+        if job_id not in self.jobs and self.backend is not None:
+            async for item in self._subscribe_shared(job_id, after, heartbeat):
+                yield item
+            return
+        job = self.jobs[job_id]
+        next_index = max(after + 1, 0)
+        while True:
+            async with job.changed:
+                try:
+                    await asyncio.wait_for(job.changed.wait_for(lambda: len(job.events) > next_index or job.done), heartbeat)
+                except asyncio.TimeoutError:
+                    new_events = None
+                else:
+                    new_events = job.events[next_index:]
+            if new_events is None:
+                yield None, None
+                continue
+            for event in new_events:
+                if event is not None:
+                    yield next_index, event
+                next_index += 1
+            if job.done and next_index >= len(job.events):
+                return
+
+    async def _subscribe_shared(self, job_id: str, after: int, heartbeat: Optional[float]) -> AsyncIterator[Tuple[Optional[int], Optional[dict]]]:
+        """subscribe for a job run by another worker, polling the shared backend for its events."""
+        next_index = max(after + 1, 0)
+        idle = 0.0
+        while True:
+            # The record is read before the events: its worker stores events before marking the job done
+            record = await asyncio.to_thread(self.backend.get, self._job_key(job_id))
+            events = await asyncio.to_thread(self.backend.lrange, self._events_key(job_id), next_index)
+            for event in events:
+                event = json.loads(event)
+                if event is not None:
+                    yield next_index, event
+                next_index += 1
+            if record is None or json.loads(record)["status"] in ("completed", "failed"):
+                return
+            idle = 0.0 if events else idle + self.poll_interval
+            if heartbeat is not None and idle >= heartbeat:
+                idle = 0.0
+                yield None, None
+            await asyncio.sleep(self.poll_interval)
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.time()
+        queued = [job for job in self.jobs.values() if job.status == "queued"]
+        waits = sorted(self._wait_times)
+        def percentile(p: float) -> Optional[float]:
+            return waits[min(len(waits) - 1, int(p * len(waits)))] if waits else None
+        return {
+            "workers": self.max_workers,
+            "queue_depth": self._queue.qsize(),
+            "max_queue_size": self.max_queue_size,
+            "running": self._running,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "oldest_queued_seconds": max((now - job.submitted_at for job in queued), default=0.0),
+            "wait_seconds_avg": sum(waits) / len(waits) if waits else None,
+            "wait_seconds_p50": percentile(0.50),
+            "wait_seconds_p95": percentile(0.95),
+            "wait_seconds_max": waits[-1] if waits else None,
+        }
+
+    async def _append_event(self, job: Job, event: dict) -> None:
+        async with job.changed:
+            job.events.append(event)
+            job.changed.notify_all()
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is None:
+                self._queue.task_done()
+                continue
+            job.status = "running"
+            job.started_at = time.time()
+            async with job.changed:
+                job.changed.notify_all()
+            self._wait_times.append(job.started_at - job.submitted_at)
+            self._running += 1
+            logger.info(f"Worker {worker_id} started job {job.id} after {job.started_at - job.submitted_at:.2f}s in queue")
+            try:
+                async for event in self.run_job(job):
+                    await self._append_event(job, event)
+                    if event.get("type") == "error":
+                        job.error = event.get("message")
+                job.status = "failed" if job.error else "completed"
+                if job.status == "completed":
+                    self._compact(job)
+            except asyncio.CancelledError:
+                job.status, job.error = "failed", "Server shutting down"
+                raise
+            except Exception as e:
+                logger.exception(f"Job {job.id} failed")
+                job.status, job.error = "failed", str(e)
+                await self._append_event(job, {"type": "error", "message": f"Error generating report: {e}"})
+            finally:
+                job.finished_at = time.time()
+                self._running -= 1
+                if job.status == "failed":
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                async with job.changed:
+                    job.changed.notify_all()
+                self._queue.task_done()
+
+    def _compactable(self, event: Optional[dict]) -> bool:
+        return event is not None and event.get("type") in self.compact_types
+
+    def _compact(self, job: Job) -> None:
+        """Replace the completed job's events of compact_types with None, keeping the others' ids."""
+        if self.compact_types:
+            job.events[:] = [None if self._compactable(event) else event for event in job.events]
+
+    def _expire_finished(self) -> None:
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [j.id for j in self.jobs.values() if j.done and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    async def _expire_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.expiry_interval)
+            self._expire_finished()
+
+    # --- Shared Backend --- #
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.namespace}:{job_id}"
+
+    def _events_key(self, job_id: str) -> str:
+        return f"{self.namespace}:{job_id}:events"
+
+    def _load_shared(self, job_id: str) -> Optional[Job]:
+        record = self.backend.get(self._job_key(job_id))
+        if record is None:
+            return None
+        events = [json.loads(event) for event in self.backend.lrange(self._events_key(job_id))]
+        return Job(**json.loads(record), events=events)
+
+    def _store_shared(self, job: Job, events: List[dict], record: Optional[Dict[str, Any]], replace: bool = False) -> None:
+        if replace:
+            # Drop the history of an earlier job with the same id
+            self.backend.delete(self._events_key(job.id))
+        # Events first, so a reader that sees the job done has all of its events
+        if events:
+            self.backend.rpush(self._events_key(job.id), *(json.dumps(event) for event in events), ttl=self.retention_seconds)
+        if record is not None:
+            self.backend.set(self._job_key(job.id), json.dumps(record), ttl=self.retention_seconds)
+
+    async def _mirror(self, job: Job, after: Optional[asyncio.Task] = None) -> None:
+        """Copy the job's status and events to the shared backend until it is done.
+
+        Writes go out at most once per poll interval (other workers only poll
+        that often), each with all the events produced since the last one.
+        """
+        if after is not None:
+            await asyncio.wait([after])
+        mirrored, status = 0, None
+        # Indexes of events stored in full that are compacted once the job completes
+        compactable: List[int] = []
+        while True:
+            async with job.changed:
+                await job.changed.wait_for(lambda: len(job.events) > mirrored or job.status != status)
+                events = job.events[mirrored:]
+                record = job.record() if job.status != status else None
+            try:
+                await asyncio.to_thread(self._store_shared, job, events, record, status is None)
+            except Exception:
+                logger.exception(f"Failed to store job {job.id} in the shared backend")
+                await asyncio.sleep(self.poll_interval)
+                continue
+            compactable += [mirrored + i for i, event in enumerate(events) if self._compactable(event)]
+            mirrored += len(events)
+            if record is not None:
+                status = record["status"]
+            if job.done and status == job.status and mirrored >= len(job.events):
+                if compactable and job.status == "completed":
+                    try:
+                        await asyncio.to_thread(self.backend.lset, self._events_key(job.id), {index: "null" for index in compactable})
+                    except Exception:
+                        logger.exception(f"Failed to compact job {job.id} in the shared backend")
+                return
+            await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,330 @@
+import os
+import re
+import json
+import math
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, message_chunk_to_message, message_to_dict, messages_from_dict
+from langchain_core.runnables import Runnable, RunnableConfig, ensure_config
+
+from .state_backend import StateBackend, state_backend
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration --- #
+# Comma-separated agent names (e.g. "planner,writer") or "all"; empty disables the tier
+LLM_CACHE_AGENTS = os.getenv("LLM_CACHE_AGENTS", "")
+LLM_SEMANTIC_CACHE_AGENTS = os.getenv("LLM_SEMANTIC_CACHE_AGENTS", "")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+# Cosine similarity a cached prompt must reach to count as a semantic hit
+LLM_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD", "0.95"))
+# Lifetime of exact-tier entries in the shared state backend (STATE_BACKEND sqlite or redis)
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+
+# Number of buckets in the hashed bag-of-words embedding
+EMBEDDING_DIMENSIONS = 1024
+
+def _parse_agents(value: str) -> frozenset:
+    return frozenset(name.strip() for name in value.split(",") if name.strip())
+
+def embed_text(text: str) -> Dict[int, float]:
+    """Embed text locally as an L2-normalized hashed bag of words and word bigrams.
+
+    Cheap and dependency-free; good enough to match reworded prompts that share
+    most of their vocabulary.
+    """
+    words = re.findall(r"\w+", text.lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    vector: Dict[int, float] = {}
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest, "little") % EMBEDDING_DIMENSIONS
+        vector[index] = vector.get(index, 0.0) + 1.0
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    return {index: weight / norm for index, weight in vector.items()} if norm else {}
+
+def cosine_similarity(a: Dict[int, float], b: Dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(index, 0.0) for index, weight in a.items())
+
+class ResponseCache:
+    """Two-tier, size-bounded LRU cache of LLM responses.
+
+    The exact tier is keyed on the rendered prompt plus model parameters. The
+    semantic tier embeds the prompt's non-system messages and returns a cached
+    response whose embedding is within the similarity threshold, searching only
+    entries with the same agent and model parameters.
+
+    With a shared backend, exact-tier entries are also written there, so a
+    response cached by one worker is an exact hit on every other worker. The
+    semantic tier scans its entries and stays per process.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        threshold: float = LLM_SEMANTIC_CACHE_THRESHOLD,
+        backend: Optional[StateBackend] = None,
+        ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        # key -> (namespace, embedding, response)
+        self._entries: "OrderedDict[str, Tuple[str, Optional[Dict[int, float]], AIMessage]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        # Exact hits served from the shared backend (included in exact_hits)
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Optional[str], namespace: str, embedding: Optional[Dict[int, float]] = None) -> Optional[AIMessage]:
+        """Look up an exact match (if a key is given), then (if an embedding is given) the closest similar prompt."""
+        with self._lock:
+            entry = self._entries.get(key) if key else None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry[2].model_copy()
+        if key and self.backend is not None:
+            shared = self._get_shared(key)
+            if shared is not None:
+                with self._lock:
+                    self._store(key, namespace, shared, embedding)
+                    self.exact_hits += 1
+                    self.shared_hits += 1
+                return shared.model_copy()
+        with self._lock:
+            if embedding:
+                best_key, best_score = None, self.threshold
+                for candidate_key, (candidate_namespace, candidate_embedding, _) in self._entries.items():
+                    if candidate_namespace != namespace or not candidate_embedding:
+                        continue
+                    score = cosine_similarity(embedding, candidate_embedding)
+                    if score >= best_score:
+                        best_key, best_score = candidate_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    logger.info(f"Semantic LLM cache hit in {namespace} (similarity {best_score:.3f})")
+                    return self._entries[best_key][2].model_copy()
+            self.misses += 1
+            return None
+
+    def set(self, key: str, namespace: str, response: AIMessage, embedding: Optional[Dict[int, float]] = None) -> None:
+        with self._lock:
+            self._store(key, namespace, response, embedding)
+        if self.backend is not None:
+            try:
+                self.backend.set(f"llm:{key}", json.dumps(message_to_dict(response)), ttl=self.ttl_seconds)
+            except Exception as e:
+                logger.warning(f"Failed to share LLM cache entry: {e}")
+
+    def _store(self, key: str, namespace: str, response: AIMessage, embedding: Optional[Dict[int, float]]) -> None:
+        self._entries[key] = (namespace, embedding, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _get_shared(self, key: str) -> Optional[AIMessage]:
+        # A backend outage only costs cache hits, never the call
+        try:
+            value = self.backend.get(f"llm:{key}")
+            return messages_from_dict([json.loads(value)])[0] if value is not None else None
+        except Exception as e:
+            logger.warning(f"Shared LLM cache lookup failed: {e}")
+            return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "shared": self.backend is not None,
+            "agents": sorted(exact_cache_agents),
+            "semantic_agents": sorted(semantic_cache_agents),
+        }
+
+exact_cache_agents = _parse_agents(LLM_CACHE_AGENTS)
+semantic_cache_agents = _parse_agents(LLM_SEMANTIC_CACHE_AGENTS)
+
+# Shared response cache (None when no agent has caching enabled)
+response_cache = ResponseCache(backend=state_backend) if exact_cache_agents or semantic_cache_agents else None
+
+def _enabled(agents: frozenset, agent_name: str) -> bool:
+    return "all" in agents or agent_name in agents
+
+def _serialize_message(message: BaseMessage) -> dict:
+    return {
+        "type": message.type,
+        "content": message.content,
+        "tool_calls": getattr(message, "tool_calls", None),
+        "tool_call_id": getattr(message, "tool_call_id", None),
+    }
+
+def _model_params(llm_runnable) -> str:
+    """Model name, sampling parameters and bound tools of a (possibly bound) chat model."""
+    bound = getattr(llm_runnable, "bound", llm_runnable)
+    return json.dumps(
+        {
+            "model": getattr(bound, "model_name", None),
+            "temperature": getattr(bound, "temperature", None),
+            "kwargs": getattr(llm_runnable, "kwargs", {}),
+        },
+        sort_keys=True,
+        default=str,
+    )
+
+def is_cache_bypassed(config: Optional[dict]) -> bool:
+    """True when the run config asks to skip cached responses (see X-Cache-Bypass)."""
+    return bool((config or {}).get("configurable", {}).get("cache_bypass"))
+
+def with_response_cache(llm_runnable, agent_name: str, cache: Optional[ResponseCache] = None):
+    """Put the response cache between a rendered prompt and the model, if enabled for this agent.
+
+    Returns llm_runnable unchanged when neither tier is enabled for agent_name.
+    A run config with configurable.cache_bypass skips lookups but still refreshes the cache.
+    """
+    cache = cache or response_cache
+    use_exact = _enabled(exact_cache_agents, agent_name)
+    use_semantic = _enabled(semantic_cache_agents, agent_name)
+    if cache is None or not (use_exact or use_semantic):
+        return llm_runnable
+    return CachedLLM(llm_runnable, agent_name, cache, use_exact, use_semantic)
+
+def _replay_chunks(message: AIMessage) -> List[AIMessageChunk]:
+    """Split a cached response into word-sized chunks that add back up to the same message."""
+    content = message.content
+    pieces = re.findall(r"\s*\S+", content) if isinstance(content, str) else []
+    if pieces:
+        # Trailing whitespace has no word to attach to
+        pieces[-1] += content[len("".join(pieces)):]
+    else:
+        pieces = [content]
+    chunks = [AIMessageChunk(content=piece, id=message.id) for piece in pieces[:-1]]
+    # Tool calls, usage and metadata arrive with the last chunk, as they do from the model
+    chunks.append(AIMessageChunk(
+        content=pieces[-1],
+        id=message.id,
+        tool_call_chunks=[
+            {"name": call["name"], "args": json.dumps(call["args"]), "id": call.get("id"), "index": i}
+            for i, call in enumerate(message.tool_calls)
+        ],
+        usage_metadata=message.usage_metadata,
+        response_metadata=message.response_metadata,
+        additional_kwargs=message.additional_kwargs,
+    ))
+    return chunks
+
+class CachedLLM(Runnable):
+    """A (possibly bound) chat model behind the response cache.
+
+    Streaming is kept: a miss passes the model's chunks through and caches the
+    aggregated message once the stream ends; a hit replays the cached response
+    as word-sized chunks, so streaming clients still see it arrive progressively.
+    """
+
+    def __init__(self, llm_runnable: Runnable, agent_name: str, cache: ResponseCache, use_exact: bool, use_semantic: bool):
+        self.llm_runnable = llm_runnable
+        self.name = f"{agent_name}_cached_llm"
+        self.cache = cache
+        self.use_exact = use_exact
+        self.use_semantic = use_semantic
+        self.namespace = f"{agent_name}:{hashlib.sha256(_model_params(llm_runnable).encode('utf-8')).hexdigest()}"
+
+    def _cache_keys(self, prompt_value) -> Tuple[str, Optional[Dict[int, float]]]:
+        messages: List[BaseMessage] = prompt_value.to_messages()
+        rendered = json.dumps([_serialize_message(m) for m in messages], sort_keys=True, default=str)
+        key = hashlib.sha256(f"{self.namespace}|{rendered}".encode("utf-8")).hexdigest()
+        embedding = None
+        if self.use_semantic:
+            embedding = embed_text("\n".join(str(m.content) for m in messages if m.type != "system"))
+        return key, embedding
+
+    def _lookup(self, prompt_value, config: RunnableConfig) -> Tuple[str, Optional[Dict[int, float]], Optional[AIMessage]]:
+        key, embedding = self._cache_keys(prompt_value)
+        if is_cache_bypassed(config):
+            return key, embedding, None
+        cached = self.cache.get(key if self.use_exact else None, self.namespace, embedding)
+        return key, embedding, cached
+
+    # The shared backend is blocking I/O, so async callers keep it off the event loop
+    async def _alookup(self, prompt_value, config: RunnableConfig):
+        if self.cache.backend is not None:
+            return await asyncio.to_thread(self._lookup, prompt_value, config)
+        return self._lookup(prompt_value, config)
+
+    async def _aset(self, key: str, response: AIMessage, embedding: Optional[Dict[int, float]]) -> None:
+        if self.cache.backend is not None:
+            await asyncio.to_thread(self.cache.set, key, self.namespace, response, embedding)
+        else:
+            self.cache.set(key, self.namespace, response, embedding)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AIMessage:
+        config = ensure_config(config)
+        key, embedding, cached = self._lookup(input, config)
+        if cached is not None:
+            return cached
+        response = self.llm_runnable.invoke(input, config, **kwargs)
+        self.cache.set(key, self.namespace, response, embedding)
+        return response
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AIMessage:
+        config = ensure_config(config)
+        key, embedding, cached = await self._alookup(input, config)
+        if cached is not None:
+            return cached
+        response = await self.llm_runnable.ainvoke(input, config, **kwargs)
+        await self._aset(key, response, embedding)
+        return response
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[AIMessageChunk]:
+        config = ensure_config(config)
+        key, embedding, cached = self._lookup(input, config)
+        if cached is not None:
+            yield from _replay_chunks(cached)
+            return
+        response = None
+        for chunk in self.llm_runnable.stream(input, config, **kwargs):
+            response = chunk if response is None else response + chunk
+            yield chunk
+        # Only a stream that ran to the end is cached
+        if response is not None:
+            self.cache.set(key, self.namespace, message_chunk_to_message(response), embedding)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[AIMessageChunk]:
+        config = ensure_config(config)
+        key, embedding, cached = await self._alookup(input, config)
+        if cached is not None:
+            for chunk in _replay_chunks(cached):
+                yield chunk
+            return
+        response = None
+        async for chunk in self.llm_runnable.astream(input, config, **kwargs):
+            response = chunk if response is None else response + chunk
+            yield chunk
+        if response is not None:
+            await self._aset(key, message_chunk_to_message(response), embedding)
@@ -1,28 +1,82 @@
 import os
-import uuid
 import logging # Import logging
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware # Allow frontend calls
 from pydantic import BaseModel
-from typing import List, Dict, Any, AsyncGenerator
+from typing import List, Dict, Any, AsyncGenerator, Optional, Tuple
 import asyncio
+import hashlib
 import json
-from fastapi.responses import HTMLResponse, StreamingResponse
+import time
+import uuid
+from contextlib import asynccontextmanager
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, StreamingResponse
 
 from langchain_core.messages import HumanMessage
 
 from .graph import app # Import the compiled LangGraph
+from .tools import search_cache, tavily_tool_ready
+from .search_cache import normalize_query
+from .llm_cache import response_cache
 from .state import AgentState # Import state definition if needed for input/output models
+from .agents import AGENT_SPECS, RESEARCH_FIELDS, client_status
+from .routing import LLM_FALLBACK_MODEL, agent_models, router
+from .clients import aclose_http_clients, circuit_states
+from .checkpoints import open_checkpointer, close_checkpointer, prune_checkpoints, CHECKPOINT_PRUNE_INTERVAL_SECONDS
+from .jobs import Job, JobManager, QueueFullError
+from .state_backend import STATE_BACKEND, state_backend
+from .batch import BATCH_CONCURRENCY, BATCH_MAX_PROMPTS, BATCH_OUTPUT_DIR, BATCH_PRIORITY, BATCH_WORKERS, parse_prompt_lines, run_batch
+from .metrics import metrics, format_gauge
 
 # --- Logging Configuration --- #
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# --- Configuration --- #
+# Idle job and batch event streams send a heartbeat comment this often, so clients can use read timeouts
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# With a shared backend, a run counts as in progress for this long after its last node update,
+# so a run whose worker died can be resumed elsewhere
+RUN_LEASE_SECONDS = float(os.getenv("RUN_LEASE_SECONDS", "300"))
+# Identical /generate-report prompts (ignoring case, whitespace and punctuation) share one run while
+# it is in progress and for this many seconds after it succeeds; 0 disables coalescing
+COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", "600"))
+
+# --- Checkpointing --- #
+async def prune_checkpoints_periodically():
+    """Expire old threads and compact checkpoints so the store stays bounded."""
+    while True:
+        await asyncio.sleep(CHECKPOINT_PRUNE_INTERVAL_SECONDS)
+        try:
+            await prune_checkpoints(app.checkpointer)
+        except Exception:
+            logger.exception("Checkpoint pruning failed")
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # The checkpointer is opened here because the SQLite saver needs a running event loop
+    app.checkpointer = await open_checkpointer()
+    logger.info(f"Checkpointer: {type(app.checkpointer).__name__ if app.checkpointer else 'disabled'}")
+    prune_task = asyncio.create_task(prune_checkpoints_periodically())
+    job_manager.start()
+    batch_manager.start()
+    try:
+        yield
+    finally:
+        await batch_manager.stop()
+        await job_manager.stop()
+        prune_task.cancel()
+        await close_checkpointer(app.checkpointer)
+        await aclose_http_clients()
+        if state_backend is not None:
+            state_backend.close()
+
 # Initialize FastAPI app
 fastapi_app = FastAPI(
     title="LangGraph Multi-Agent Research Report API",
     description="API for generating research reports using a multi-agent LangGraph workflow.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # --- CORS Middleware --- #
@@ -39,38 +93,124 @@ fastapi_app.add_middleware(
 # --- Request and Response Models --- #
 class GenerateRequest(BaseModel):
     prompt: str
+    # Forward the writer's draft token by token as `token` events
+    stream_tokens: bool = False
+    # Join an identical report that is running or just finished; false always starts a fresh run
+    coalesce: bool = True
+
+class JobRequest(GenerateRequest):
+    # Lower numbers run first; jobs with equal priority run in submission order
+    priority: int = 0
+
+class BatchPrompt(BaseModel):
+    prompt: str
+    id: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    # Prompts as strings or {"prompt", "id"} objects; ids default to the 1-based position
+    prompts: List[str | BatchPrompt]
+    concurrency: int = BATCH_CONCURRENCY
 
 # No longer using GenerateResponse, as we stream
 # class GenerateResponse(BaseModel):
 #     final_report: str | None
 #     error: str | None
 
+# --- Run Registry --- #
+# Threads with a run currently streaming in this process
+active_threads = set()
+
+async def set_thread_active(thread_id: str, active: bool) -> None:
+    """Mark a thread's run as in progress or finished, for every worker when state is shared."""
+    if active:
+        active_threads.add(thread_id)
+    else:
+        active_threads.discard(thread_id)
+    if state_backend is None:
+        return
+    if active:
+        await asyncio.to_thread(state_backend.set, f"runs:{thread_id}", "running", ttl=RUN_LEASE_SECONDS)
+    else:
+        await asyncio.to_thread(state_backend.delete, f"runs:{thread_id}")
+
+async def is_thread_active(thread_id: str) -> bool:
+    if thread_id in active_threads:
+        return True
+    return state_backend is not None and await asyncio.to_thread(state_backend.get, f"runs:{thread_id}") is not None
+
+def format_sse(event: dict, event_id: Optional[int] = None) -> str:
+    """Format an event dict as a Server-Sent Event, with an id if given."""
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}data: {json.dumps(event)}\n\n"
+
 # --- Streaming Generator Function --- #
-async def stream_graph_events(prompt: str, thread_id: str):
-    """Runs the graph and yields formatted Server-Sent Events."""
-    initial_state = {
-        "user_prompt": prompt,
+async def run_graph_events(prompt: Optional[str], thread_id: str, cache_bypass: bool = False, stream_tokens: bool = False, resume: bool = False):
+    """Runs the graph and yields its progress as event dicts.
+
+    With stream_tokens, the writer's draft is also forwarded incrementally as
+    `token` events tagged with the node and revision. With resume, the run for
+    thread_id continues from its last checkpoint instead of starting over.
+    The final event carries the run's metrics summary (see backend.metrics).
+    """
+    initial_state = None if resume else {
+        "prompt": prompt,
         "messages": [HumanMessage(content=prompt)],
-        "research_findings": [],
         "plan": None,
+        "research_tasks": None,
+        "task_results": {},
+        "tech_research": None,
+        "market_sales_research": None,
+        "sustainability_quality_research": None,
         "draft_report": None,
+        "draft_sections": None,
+        "section_feedback": None,
+        "revised_sections": None,
         "final_report": None,
         "review_feedback": None,
+        "review_verdict": None,
         "next_agent": None,
         "revision_count": 0,
+        "speculation": None,
     }
 
-    final_report = None
-    error_message = None
+    # thread_id keys the checkpoints; cache_bypass makes the agents skip cached LLM responses
+    config = {"configurable": {"thread_id": thread_id, "cache_bypass": cache_bypass}}
+
+    # Merged graph state, kept up to date from the "values" stream so the final
+    # report is available without running the graph a second time
+    final_state = {}
     current_step = 1
+    stream_modes = ["updates", "values", "custom"] if stream_tokens else ["updates", "values"]
+    await set_thread_active(thread_id, True)
+    # Outcome recorded in the metrics; stays "cancelled" if the client goes away mid-run
+    run_status = "cancelled"
 
     try:
-        async for event in app.astream(initial_state):
-            if isinstance(event, dict):
-                # Determine the current node/step based on the keys
-                node_name = list(event.keys())[0] # Get the primary key indicating the node
-                node_data = event[node_name]
-                
+        yield {"type": "start", "thread_id": thread_id, "resumed": resume}
+
+        if resume:
+            # A None input continues from the last checkpoint; a finished thread just
+            # streams its final values without running any node again
+            snapshot = await app.aget_state(config)
+            logger.info(f"Resuming thread {thread_id} at {snapshot.next or 'end'}")
+
+        async for stream_mode, chunk in app.astream(initial_state, config, stream_mode=stream_modes):
+            if stream_mode == "values":
+                final_state = chunk
+                continue
+            if stream_mode == "custom":
+                if isinstance(chunk, dict) and chunk.get("type") == "token":
+                    yield chunk
+                continue
+
+            # Renews the run's lease in the shared backend
+            await set_thread_active(thread_id, True)
+            for node_name, node_data in chunk.items():
+                if node_name == "__interrupt__":
+                    logger.info(f"Graph interrupted for thread {thread_id}")
+                    continue
+                node_data = node_data or {}
+
                 # Prepare the data payload for the SSE event
                 update_data = {
                     "type": "update",
@@ -81,84 +221,376 @@ async def stream_graph_events(prompt: str, thread_id: str):
                 
                 # Extract useful info from the node data
                 if node_name == "planner" and node_data.get("plan"):
-                    update_data["data"]["summary"] = f"Planner created plan: {node_data['plan'][:100]}..."
-                elif "researcher" in node_name and node_data.get("research_findings"):
-                    last_finding = node_data["research_findings"][-1]
-                    update_data["data"]["summary"] = f"{last_finding.get('agent_name', node_name)} found research on '{last_finding.get('topic')}': {last_finding.get('research', '')[:100]}..."
+                    update_data["data"]["summary"] = f"Planner created plan with {len(node_data.get('research_tasks') or [])} research tasks: {node_data['plan'][:100]}..."
+                    update_data["data"]["research_tasks"] = node_data.get("research_tasks")
+                elif node_name == "research_task" and node_data.get("task_results"):
+                    task_id, research = next(iter(node_data["task_results"].items()))
+                    update_data["data"]["summary"] = f"Research task {task_id} finished: {research[:100]}..."
+                elif node_name in RESEARCH_FIELDS and node_data.get(RESEARCH_FIELDS[node_name]):
+                    research = node_data[RESEARCH_FIELDS[node_name]]
+                    update_data["data"]["summary"] = f"{node_name} finished research: {research[:100]}..."
+                elif node_name == "speculative_writer" and node_data.get("draft_report"):
+                    speculation = node_data.get("speculation") or {}
+                    update_data["data"]["summary"] = (
+                        f"Writer drafted {len(node_data.get('draft_sections') or [])} sections while research ran "
+                        f"({speculation.get('overlap_seconds', 0):.1f}s of writing overlapped research)"
+                    )
+                    update_data["data"]["speculation"] = speculation
+                    update_data["data"]["draft_report_snippet"] = node_data["draft_report"][:200] + "..."
                 elif node_name == "writer" and node_data.get("draft_report"):
                     rev_count = node_data.get("revision_count", 0)
-                    update_data["data"]["summary"] = f"Writer generated draft (Revision {rev_count})"
+                    if node_data.get("revised_sections"):
+                        update_data["data"]["summary"] = f"Writer revised sections {', '.join(node_data['revised_sections'])} (Revision {rev_count})"
+                    else:
+                        update_data["data"]["summary"] = f"Writer generated draft (Revision {rev_count})"
                     update_data["data"]["draft_report_snippet"] = node_data["draft_report"][:200] + "..."
                 elif node_name == "reviewer":
-                    feedback = node_data.get("review_feedback")
-                    if feedback and feedback.strip().upper() == "APPROVE":
-                        update_data["data"]["summary"] = "Reviewer approved the report."
-                    elif feedback:
-                        update_data["data"]["summary"] = f"Reviewer requested revisions: {feedback[:100]}..."
+                    verdict = node_data.get("review_verdict")
+                    if verdict and node_data.get("next_agent") == "END":
+                        update_data["data"]["summary"] = f"Reviewer approved the report (severity: {verdict['severity']})."
+                    elif verdict:
+                        feedback = node_data.get("review_feedback") or ""
+                        update_data["data"]["summary"] = f"Reviewer requested revisions ({verdict['severity']}, {len(verdict['issues'])} issues): {feedback[:100]}..."
                     else: # This case happens when END is forced by max revisions
                          update_data["data"]["summary"] = "Max revisions reached or review finished."
-                         
-                # Check if we reached the final report in this event
-                if node_data.get("final_report"):
-                    final_report = node_data["final_report"]
-                elif node_data.get("draft_report") and node_data.get("next_agent") == "END": # Check if review ended
-                    final_report = node_data["draft_report"] # Use draft if review ended here
-                
-                # Yield the event in SSE format
-                yield f"data: {json.dumps(update_data)}\n\n"
-                await asyncio.sleep(0.1) # Small delay
+                    if verdict:
+                        update_data["data"]["verdict"] = verdict
+
+                yield update_data
                 current_step += 1
-            else:
-                logger.debug(f"Received non-dict event: {type(event)}")
-                
-        # After the stream finishes, determine final outcome
+
+        # The stream is done: emit exactly one final or error event from the merged state.
+        # The draft is the result when the run ends at max revisions or an interrupt.
+        final_report = final_state.get("final_report") or final_state.get("draft_report")
         if final_report:
-            final_event = {"type": "final", "report": final_report}
-            yield f"data: {json.dumps(final_event)}\n\n"
+            run_status = "final"
+            yield {"type": "final", "report": final_report, "metrics": metrics.finish_run(thread_id, run_status)}
         else:
-             # If no final report was explicitly set, try to get it from the last known state
-            # This is a fallback - ideally final_report should be set explicitly
-            logger.warning("Stream finished without explicit final report. Attempting fallback.")
-            # Re-invoke to get the absolute final state (less efficient but robust)
-            try:
-                final_state_check = await app.ainvoke(initial_state)
-                if final_state_check and final_state_check.get("final_report"):
-                     final_event = {"type": "final", "report": final_state_check["final_report"]}
-                     yield f"data: {json.dumps(final_event)}\n\n"
-                elif final_state_check and final_state_check.get("draft_report"):
-                     final_event = {"type": "final", "report": final_state_check["draft_report"]}
-                     yield f"data: {json.dumps(final_event)}\n\n"
-                else:
-                     error_message = "Failed to retrieve final or draft report after execution."
-            except Exception as invoke_err:
-                 error_message = f"Error during final state check: {str(invoke_err)}"
-                 
-        if error_message:
-            error_event = {"type": "error", "message": error_message}
-            yield f"data: {json.dumps(error_event)}\n\n"
+            logger.warning(f"Stream finished without a final or draft report for thread {thread_id}")
+            run_status = "error"
+            metrics.finish_run(thread_id, run_status)
+            yield {"type": "error", "message": "The run finished without producing a report."}
 
     except Exception as e:
         logger.exception(f"Error during graph execution stream for thread {thread_id}")
         error_message = f"Error generating report: {str(e)}"
-        error_event = {"type": "error", "message": error_message}
-        yield f"data: {json.dumps(error_event)}\n\n"
+        if run_status == "cancelled":
+            run_status = "error"
+            metrics.finish_run(thread_id, run_status)
+        yield {"type": "error", "message": error_message}
     finally:
+        if run_status == "cancelled":
+            metrics.finish_run(thread_id, run_status)
+        await set_thread_active(thread_id, False)
         logger.info(f"--- Finished streaming for thread {thread_id} ---")
 
+# --- Job Queue --- #
+def run_report_job(job: Job):
+    # The job id doubles as the checkpoint thread_id, so jobs are resumable too
+    metrics.record_queue_time(job.id, job.started_at - job.submitted_at)
+    options = dict(job.options)
+    key = options.pop("coalesce_key", None)
+    events = run_graph_events(job.prompt, job.id, **options)
+    return settle_after_run(events, key, job.id) if key else events
+
+# Bounded worker pool all report generations go through (see backend.jobs)
+# With a shared backend, every worker can report on and stream jobs any other worker runs
+# The final event carries the whole report, so a completed job's token events are compacted away
+job_manager = JobManager(run_report_job, backend=state_backend, namespace="jobs", compact_types=("token",))
+
+def submit_job(prompt: str, priority: int = 0, **options) -> Job:
+    try:
+        return job_manager.submit(prompt, priority=priority, **options)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except ValueError as e:
+        # The job id belongs to a job that hasn't finished (e.g. a resume of a run still going)
+        raise HTTPException(status_code=409, detail=str(e))
+
+async def stream_job_events(job_id: str, last_event_id: int = -1):
+    """Stream a job's events as SSE with ids, replaying anything after last_event_id."""
+    async for event_id, event in job_manager.subscribe(job_id, after=last_event_id, heartbeat=SSE_HEARTBEAT_SECONDS):
+        # A comment line keeps idle connections (and clients' read timeouts) alive between events
+        yield format_sse(event, event_id) if event is not None else ": heartbeat\n\n"
+
+def parse_last_event_id(http_request: Request, last_event_id: Optional[int]) -> int:
+    # EventSource clients send Last-Event-ID when they reconnect
+    header = http_request.headers.get("last-event-id")
+    if last_event_id is None and header and header.lstrip("-").isdigit():
+        last_event_id = int(header)
+    return -1 if last_event_id is None else last_event_id
+
+# --- Request Coalescing --- #
+# Without a shared backend: coalesce key -> (job id, time it stops being joinable)
+coalesced_jobs: Dict[str, Tuple[str, float]] = {}
+
+def coalesce_key(prompt: str, stream_tokens: bool) -> str:
+    return hashlib.sha256(f"{normalize_query(prompt)}|{stream_tokens}".encode("utf-8")).hexdigest()
+
+async def coalesced_job_id(key: str) -> Optional[str]:
+    if state_backend is not None:
+        job_id = await asyncio.to_thread(state_backend.get, f"coalesce:{key}")
+        return job_id.decode("utf-8") if job_id is not None else None
+    job_id, joinable_until = coalesced_jobs.get(key, (None, 0.0))
+    if joinable_until < time.time():
+        coalesced_jobs.pop(key, None)
+        return None
+    return job_id
+
+async def claim_coalesce_key(key: str, job_id: str) -> bool:
+    """Register job_id as the run for key; False if another request got there first."""
+    # Until the run settles, the key lives as long as the job could be running
+    ttl = job_manager.retention_seconds
+    if state_backend is not None:
+        return await asyncio.to_thread(state_backend.add, f"coalesce:{key}", job_id, ttl)
+    if await coalesced_job_id(key) is not None:
+        return False
+    now = time.time()
+    for stale in [k for k, (_, joinable_until) in coalesced_jobs.items() if joinable_until < now]:
+        del coalesced_jobs[stale]
+    coalesced_jobs[key] = (job_id, now + ttl)
+    return True
+
+async def settle_coalesce_key(key: str, job_id: str, succeeded: bool) -> None:
+    """Keep a successful run joinable for the window; a failed one lets the next request start afresh."""
+    if await coalesced_job_id(key) != job_id:
+        return
+    window = min(COALESCE_WINDOW_SECONDS, job_manager.retention_seconds)
+    if state_backend is not None:
+        if succeeded:
+            await asyncio.to_thread(state_backend.set, f"coalesce:{key}", job_id, window)
+        else:
+            await asyncio.to_thread(state_backend.delete, f"coalesce:{key}")
+    elif succeeded:
+        coalesced_jobs[key] = (job_id, time.time() + window)
+    else:
+        coalesced_jobs.pop(key, None)
+
+async def settle_after_run(events, key: str, job_id: str):
+    succeeded = False
+    try:
+        async for event in events:
+            succeeded = event.get("type") == "final"
+            yield event
+    finally:
+        await settle_coalesce_key(key, job_id, succeeded)
+
+async def submit_report(prompt: str, stream_tokens: bool, cache_bypass: bool, coalesce: bool, priority: int = 0) -> Tuple[Job, bool]:
+    """Queue a report, or join an identical one in progress or recently finished.
+
+    Returns the job and whether it was joined. Joiners follow the same job
+    events, so a late joiner gets the earlier events replayed (and keeps the
+    priority the job was queued with). Cache-bypassing requests always run fresh.
+    """
+    if coalesce and not cache_bypass and COALESCE_WINDOW_SECONDS > 0:
+        key = coalesce_key(prompt, stream_tokens)
+        # A few tries: another worker may have claimed the key before its job is visible here
+        for _ in range(3):
+            job_id = await coalesced_job_id(key)
+            job = await job_manager.find(job_id) if job_id else None
+            if job is not None and job.status != "failed":
+                metrics.record_report_request("joined")
+                logger.info(f"Joining job {job.id} ({job.status}) for an identical prompt")
+                return job, True
+            job_id = str(uuid.uuid4())
+            if await claim_coalesce_key(key, job_id):
+                try:
+                    job = submit_job(prompt, priority=priority, job_id=job_id, cache_bypass=cache_bypass, stream_tokens=stream_tokens, coalesce_key=key)
+                except HTTPException:
+                    await settle_coalesce_key(key, job_id, succeeded=False)
+                    raise
+                metrics.record_report_request("started")
+                return job, False
+            await asyncio.sleep(job_manager.poll_interval)
+    metrics.record_report_request("fresh" if coalesce else "opted_out")
+    return submit_job(prompt, priority=priority, cache_bypass=cache_bypass, stream_tokens=stream_tokens), False
+
+# --- Batches --- #
+async def run_queued_report(prompt: str, thread_id: str) -> dict:
+    """Run one batch item through the shared job queue and return its final or error event."""
+    # Batch items queue behind interactive reports; a full queue just delays them
+    while True:
+        try:
+            job = job_manager.submit(prompt, priority=BATCH_PRIORITY, job_id=thread_id)
+            break
+        except QueueFullError:
+            await asyncio.sleep(1)
+    final = {"type": "error", "message": "The run produced no events."}
+    async for _, event in job_manager.subscribe(job.id):
+        if event.get("type") in ("final", "error"):
+            final = event
+    return final
+
+def run_batch_job(job: Job):
+    return run_batch(job.options["items"], job.options["output_path"], run_queued_report, concurrency=job.options["concurrency"])
+
+# Batches get their own small queue; their items share the report job queue (see run_queued_report)
+batch_manager = JobManager(run_batch_job, max_workers=BATCH_WORKERS, backend=state_backend, namespace="batches")
+
+def batch_status(job: Job) -> dict:
+    finished = [event for event in job.events if event["type"] == "item_finished"]
+    started = next((event for event in job.events if event["type"] == "batch_started"), {})
+    return {
+        **job.summary(),
+        "batch_id": job.id,
+        "items": len(job.options["items"]),
+        "unique_prompts": started.get("unique_prompts"),
+        "finished": len(finished),
+        "failed": sum(1 for event in finished if event["status"] == "failed"),
+    }
+
 # --- API Endpoints --- #
 @fastapi_app.post("/generate-report") # Remove response_model
-async def generate_report_endpoint(request: GenerateRequest):
-    """Receives a prompt and streams the LangGraph agent flow execution."""
+async def generate_report_endpoint(request: GenerateRequest, http_request: Request):
+    """Receives a prompt and streams the LangGraph agent flow execution.
+
+    Send the header `X-Cache-Bypass: true` to skip cached LLM responses. An
+    identical prompt already running (or finished within COALESCE_WINDOW_SECONDS)
+    is joined instead of run again, from its first event; the X-Coalesced header
+    says so. Set "coalesce": false in the body for a fresh run.
+    """
     if not request.prompt:
         raise HTTPException(status_code=400, detail="Prompt cannot be empty")
 
-    thread_id = str(uuid.uuid4())
-    logger.info(f"Received request for prompt: '{request.prompt[:50]}...' (Thread ID: {thread_id})")
+    cache_bypass = http_request.headers.get("x-cache-bypass", "").lower() in ("1", "true", "yes")
+    # Runs go through the job queue so bursts are bounded by the worker pool
+    job, joined = await submit_report(request.prompt, request.stream_tokens, cache_bypass, request.coalesce)
+    thread_id = job.id
+    logger.info(f"Received request for prompt: '{request.prompt[:50]}...' (Thread ID: {thread_id}, cache bypass: {cache_bypass}, joined: {joined})")
 
-    # Return a StreamingResponse that uses the async generator
+    # Return a StreamingResponse that follows the job's events
     return StreamingResponse(
-        stream_graph_events(request.prompt, thread_id),
-        media_type="text/event-stream"
+        stream_job_events(job.id),
+        media_type="text/event-stream",
+        headers={"X-Thread-ID": thread_id, "X-Job-ID": job.id, "X-Coalesced": str(joined).lower()},
+    )
+
+@fastapi_app.post("/jobs")
+async def submit_job_endpoint(request: JobRequest, http_request: Request):
+    """Queues a report generation and returns its job id right away.
+
+    Follow it with GET /jobs/{job_id} (status) or GET /jobs/{job_id}/events (SSE).
+    Identical prompts are coalesced as for /generate-report; "coalesced" in the
+    response says the id belongs to an existing job.
+    """
+    if not request.prompt:
+        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
+    cache_bypass = http_request.headers.get("x-cache-bypass", "").lower() in ("1", "true", "yes")
+    job, joined = await submit_report(request.prompt, request.stream_tokens, cache_bypass, request.coalesce, priority=request.priority)
+    return {**job.summary(), "position": job_manager.position(job.id), "coalesced": joined}
+
+@fastapi_app.get("/jobs/metrics")
+async def job_metrics():
+    """Queue depth, worker utilisation and queue wait times."""
+    return job_manager.metrics()
+
+@fastapi_app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = await job_manager.find(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return {**job.summary(), "position": job_manager.position(job_id)}
+
+@fastapi_app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, http_request: Request, last_event_id: Optional[int] = None):
+    """Streams a job's events as SSE. Reattach after a disconnect by sending the
+    last received event id (Last-Event-ID header or last_event_id query parameter).
+    """
+    if await job_manager.find(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return StreamingResponse(
+        stream_job_events(job_id, parse_last_event_id(http_request, last_event_id)),
+        media_type="text/event-stream",
+    )
+
+@fastapi_app.post("/batches")
+async def submit_batch_endpoint(http_request: Request):
+    """Queues a batch of prompts and returns its batch id right away.
+
+    The body is a BatchRequest as JSON, or JSONL with one prompt per line
+    (Content-Type application/x-ndjson or application/jsonl). Identical prompts
+    run once. Follow the batch with GET /batches/{batch_id}/events and fetch the
+    results, written as each item finishes, from GET /batches/{batch_id}/results.
+    """
+    body = (await http_request.body()).decode("utf-8")
+    concurrency = BATCH_CONCURRENCY
+    try:
+        if any(kind in http_request.headers.get("content-type", "") for kind in ("ndjson", "jsonl")):
+            items = parse_prompt_lines(body.splitlines())
+        else:
+            request = BatchRequest.model_validate_json(body)
+            concurrency = request.concurrency
+            items = parse_prompt_lines(json.dumps(prompt if isinstance(prompt, str) else prompt.model_dump()) for prompt in request.prompts)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not items:
+        raise HTTPException(status_code=400, detail="The batch has no prompts")
+    if len(items) > BATCH_MAX_PROMPTS:
+        raise HTTPException(status_code=413, detail=f"The batch has {len(items)} prompts; the limit is {BATCH_MAX_PROMPTS}")
+
+    batch_id = str(uuid.uuid4())
+    try:
+        job = batch_manager.submit(
+            f"Batch of {len(items)} prompts",
+            job_id=batch_id,
+            items=items,
+            output_path=os.path.join(BATCH_OUTPUT_DIR, f"{batch_id}.jsonl"),
+            concurrency=max(1, concurrency),
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return batch_status(job)
+
+async def get_batch(batch_id: str) -> Job:
+    job = await batch_manager.find(batch_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    return job
+
+@fastapi_app.get("/batches/{batch_id}")
+async def batch_status_endpoint(batch_id: str):
+    return batch_status(await get_batch(batch_id))
+
+@fastapi_app.get("/batches/{batch_id}/events")
+async def batch_events(batch_id: str, http_request: Request, last_event_id: Optional[int] = None):
+    """Streams a batch's per-item progress as SSE, with the same replay as job events."""
+    await get_batch(batch_id)
+    async def stream():
+        async for event_id, event in batch_manager.subscribe(batch_id, after=parse_last_event_id(http_request, last_event_id), heartbeat=SSE_HEARTBEAT_SECONDS):
+            yield format_sse(event, event_id) if event is not None else ": heartbeat\n\n"
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+@fastapi_app.get("/batches/{batch_id}/results")
+async def batch_results(batch_id: str):
+    """The batch's results as JSONL, one line per finished item (partial while it runs)."""
+    path = (await get_batch(batch_id)).options["output_path"]
+    if not os.path.exists(path):
+        return PlainTextResponse("", media_type="application/x-ndjson")
+    return FileResponse(path, media_type="application/x-ndjson")
+
+@fastapi_app.get("/reports/{thread_id}/resume")
+async def resume_report_endpoint(thread_id: str, stream_tokens: bool = False, priority: int = 0):
+    """Continues a run from its last completed node and streams the rest of it.
+
+    Use the thread_id from the `start` event (or X-Thread-ID header) of the
+    original /generate-report stream. A finished run just streams its final event.
+    The resumed run is queued as a job under the thread_id, so it goes through the
+    same worker pool as new reports; reattach with GET /jobs/{thread_id}/events.
+    """
+    if app.checkpointer is None:
+        raise HTTPException(status_code=501, detail="Checkpointing is disabled (CHECKPOINTER=none)")
+    job = await job_manager.find(thread_id)
+    if (job is not None and not job.done) or await is_thread_active(thread_id):
+        raise HTTPException(status_code=409, detail="This run is still in progress")
+    snapshot = await app.aget_state({"configurable": {"thread_id": thread_id}})
+    if not snapshot.values:
+        raise HTTPException(status_code=404, detail=f"No checkpoint found for thread {thread_id}")
+
+    job = submit_job(snapshot.values.get("prompt") or "", priority=priority, job_id=thread_id, stream_tokens=stream_tokens, resume=True)
+    return StreamingResponse(
+        stream_job_events(job.id),
+        media_type="text/event-stream",
+        headers={"X-Thread-ID": thread_id, "X-Job-ID": job.id},
     )
 
 # --- Root Endpoint (Optional) --- #
@@ -169,7 +601,75 @@ async def root():
 # --- Health Check --- #
 @fastapi_app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    """Always answers while the server is up; status is "degraded" when a report can't run yet.
+
+    Clients are built on the first report, so a missing API key shows up here
+    instead of crashing the server at import time.
+    """
+    circuits = circuit_states()
+    checks = {
+        "openai_api_key": bool(os.getenv("OPENAI_API_KEY")) or client_status()["llm"] == "ready",
+        "tavily_api_key": bool(os.getenv("TAVILY_API_KEY")) or tavily_tool_ready(),
+        # An open circuit means the upstream kept failing and calls are being rejected
+        "upstreams_available": all(state != "open" for state in circuits.values()),
+    }
+    if state_backend is not None:
+        try:
+            await asyncio.to_thread(state_backend.get, "health")
+            checks["state_backend_available"] = True
+        except Exception as e:
+            logger.warning(f"Shared state backend unavailable: {e}")
+            checks["state_backend_available"] = False
+    return {
+        "status": "healthy" if all(checks.values()) else "degraded",
+        "checks": checks,
+        "clients": {**client_status(), "search_tool": "ready" if tavily_tool_ready() else "not_initialized"},
+        "circuits": circuits,
+        "checkpointer": type(app.checkpointer).__name__ if app.checkpointer else None,
+        "state_backend": STATE_BACKEND,
+    }
+
+# --- Metrics --- #
+@fastapi_app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus text exposition of node, LLM, tool and queue metrics."""
+    queue = job_manager.metrics()
+    gauges = [
+        format_gauge("job_queue_depth", "Report jobs waiting for a worker.", queue["queue_depth"]),
+        format_gauge("job_workers_busy", "Job workers currently running a report.", queue["running"]),
+        format_gauge("job_workers", "Size of the job worker pool.", queue["workers"]),
+    ]
+    if search_cache is not None:
+        gauges.append(format_gauge("search_cache_hit_ratio", "Search cache hit rate since start.", search_cache.stats()["hit_rate"]))
+    if response_cache is not None:
+        gauges.append(format_gauge("llm_cache_hit_ratio", "LLM response cache hit rate since start.", response_cache.stats()["hit_rate"]))
+    return PlainTextResponse(metrics.render() + "\n".join(gauges) + "\n", media_type="text/plain; version=0.0.4")
+
+# --- Search Cache Monitoring --- #
+@fastapi_app.get("/search-cache/stats")
+async def search_cache_stats():
+    """Hit/miss counters and size of the persistent search-result cache."""
+    if search_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **search_cache.stats()}
+
+@fastapi_app.get("/llm-cache/stats")
+async def llm_cache_stats():
+    """Hit/miss counters and size of the opt-in LLM response cache."""
+    if response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **response_cache.stats()}
+
+@fastapi_app.get("/models/routing")
+async def model_routing_stats():
+    """Each agent's model tiers and the router's calls, latency and cost per agent and model."""
+    return {
+        "latency_target_seconds": router.latency_target or None,
+        "cost_budget_usd": router.cost_budget or None,
+        "fallback_model": LLM_FALLBACK_MODEL or None,
+        "tiers": {name: agent_models(name) for name in AGENT_SPECS},
+        "routes": router.stats(),
+    }
 
 # --- How to Run (Instructions) --- #
 # 1. Make sure you have .env file with OPENAI_API_KEY and TAVILY_API_KEY
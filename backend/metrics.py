@@ -0,0 +1,436 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict, field, fields
+from typing import Dict, Iterable, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables.config import var_child_runnable_config
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration --- #
+# Per-run stats are kept for at most this many threads (oldest dropped first)
+METRICS_MAX_TRACKED_RUNS = int(os.getenv("METRICS_MAX_TRACKED_RUNS", "1000"))
+
+# USD per million (prompt, completion) tokens, matched on the longest model name prefix
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+}
+
+# Share of the prompt price charged for prompt tokens served from the provider's prompt cache
+CACHED_PROMPT_PRICE_FACTOR = float(os.getenv("CACHED_PROMPT_PRICE_FACTOR", "0.5"))
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0) -> float:
+    """Estimated USD cost of a call, or 0.0 for models not in MODEL_PRICES.
+
+    cached_prompt_tokens (part of prompt_tokens) are charged at CACHED_PROMPT_PRICE_FACTOR.
+    """
+    prefixes = [prefix for prefix in MODEL_PRICES if model and model.startswith(prefix)]
+    if not prefixes:
+        return 0.0
+    prompt_price, completion_price = MODEL_PRICES[max(prefixes, key=len)]
+    billed_prompt_tokens = prompt_tokens - cached_prompt_tokens * (1 - CACHED_PROMPT_PRICE_FACTOR)
+    return (billed_prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+def cached_tokens(usage: Optional[dict]) -> int:
+    """Prompt tokens served from the provider's prompt cache, from a message's usage_metadata."""
+    return ((usage or {}).get("input_token_details") or {}).get("cache_read") or 0
+
+# --- Prometheus primitives --- #
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    pairs = [f'{name}="{escape(value)}"' for name, value in labels]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(zip(self.labelnames, key))} {value}")
+        return "\n".join(lines)
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (bucket counts, sum, count)
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                labels = list(zip(self.labelnames, key))
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', bound)])} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines)
+
+def format_gauge(name: str, documentation: str, value: Optional[float]) -> str:
+    """Render a single unlabelled gauge, e.g. for values read from other components at scrape time."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    if value is not None:
+        lines.append(f"{name} {float(value)}")
+    return "\n".join(lines)
+
+# --- Per-run stats --- #
+@dataclass
+class NodeStats:
+    """What one node spent in a run, summed over its executions."""
+    runs: int = 0
+    errors: int = 0
+    wall_seconds: float = 0.0
+    llm_calls: int = 0
+    llm_seconds: float = 0.0
+    prompt_tokens: int = 0
+    # Prompt tokens the provider served from its prompt cache
+    cached_prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    retries: int = 0
+    tool_calls: int = 0
+    tool_errors: int = 0
+    tool_seconds: float = 0.0
+
+    def add(self, other: "NodeStats") -> None:
+        for stat in fields(self):
+            setattr(self, stat.name, getattr(self, stat.name) + getattr(other, stat.name))
+
+@dataclass
+class RunStats:
+    started_at: float
+    queue_seconds: float = 0.0
+    nodes: Dict[str, NodeStats] = field(default_factory=dict)
+    # Research/writing overlap of a speculative run (see agents.arun_speculative_writer)
+    speculation: Optional[Dict[str, float]] = None
+
+    def node(self, name: str) -> NodeStats:
+        return self.nodes.setdefault(name, NodeStats())
+
+class MetricsRegistry:
+    """Process-wide metrics: Prometheus series plus per-thread_id run stats.
+
+    Node timings come from instrument_node, LLM and tool calls from the
+    MetricsCallbackHandler, queue time from the job queue.
+    """
+
+    def __init__(self, max_tracked_runs: int = METRICS_MAX_TRACKED_RUNS):
+        self.max_tracked_runs = max_tracked_runs
+        self._runs: "OrderedDict[str, RunStats]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.reports = Counter("report_runs_total", "Report runs by outcome.", ("status",))
+        self.report_seconds = Histogram("report_run_duration_seconds", "End-to-end duration of report runs.", ("status",))
+        self.queue_seconds = Histogram("report_queue_wait_seconds", "Time report jobs waited for a worker.")
+        self.node_runs = Counter("report_node_runs_total", "Graph node executions.", ("node", "status"))
+        self.node_seconds = Histogram("report_node_duration_seconds", "Wall time of graph node executions.", ("node",))
+        self.llm_calls = Counter("llm_calls_total", "LLM calls by agent and model.", ("agent", "model", "status"))
+        self.llm_seconds = Histogram("llm_call_duration_seconds", "Duration of LLM calls.", ("agent",))
+        self.llm_tokens = Counter("llm_tokens_total", "LLM tokens by agent and kind (prompt, cached_prompt or completion).", ("agent", "kind"))
+        self.llm_cost = Counter("llm_cost_usd_total", "Estimated LLM cost in USD.", ("agent", "model"))
+        self.llm_retries = Counter("llm_retries_total", "LLM call retries.", ("agent",))
+        self.tool_calls = Counter("tool_calls_total", "Tool calls by tool and outcome.", ("tool", "status"))
+        self.tool_seconds = Histogram("tool_call_duration_seconds", "Duration of tool calls.", ("tool",))
+        self._series = [
+            self.reports, self.report_seconds, self.queue_seconds, self.node_runs, self.node_seconds,
+            self.llm_calls, self.llm_seconds, self.llm_tokens, self.llm_cost, self.llm_retries,
+            self.tool_calls, self.tool_seconds,
+        ]
+        self.upstream_retries = Counter("upstream_retries_total", "HTTP retries by upstream.", ("upstream",))
+        self.upstream_rate_limit_wait = Histogram(
+            "upstream_rate_limit_wait_seconds", "Time requests waited for rate limit capacity.", ("upstream",)
+        )
+        self.upstream_circuit_rejections = Counter(
+            "upstream_circuit_rejections_total", "Requests rejected while an upstream's circuit was open.", ("upstream",)
+        )
+        self._series += [self.upstream_retries, self.upstream_rate_limit_wait, self.upstream_circuit_rejections]
+        self.speculative_overlap_seconds = Histogram(
+            "speculative_writer_overlap_seconds", "Writing time that overlapped research in speculative runs."
+        )
+        self._series.append(self.speculative_overlap_seconds)
+        self.llm_routes = Counter(
+            "llm_route_calls_total", "Routed LLM calls by agent, chosen model, why it was chosen and outcome.",
+            ("agent", "model", "reason", "status"),
+        )
+        self._series.append(self.llm_routes)
+        self.report_requests = Counter(
+            "report_requests_total", "Report requests by whether they started a run, joined an identical one or opted out.",
+            ("outcome",),
+        )
+        self._series.append(self.report_requests)
+
+    def _run(self, thread_id: Optional[str]) -> Optional[RunStats]:
+        # Callers hold self._lock
+        if thread_id is None:
+            return None
+        run = self._runs.get(thread_id)
+        if run is None:
+            run = self._runs[thread_id] = RunStats(started_at=time.time())
+            while len(self._runs) > self.max_tracked_runs:
+                self._runs.popitem(last=False)
+        return run
+
+    def _update_node(self, thread_id: Optional[str], node: Optional[str], **deltas) -> None:
+        with self._lock:
+            run = self._run(thread_id)
+            if run is not None:
+                run.node(node or "unknown").add(NodeStats(**deltas))
+
+    def record_queue_time(self, thread_id: str, seconds: float) -> None:
+        self.queue_seconds.observe(seconds)
+        with self._lock:
+            self._run(thread_id).queue_seconds += seconds
+
+    def record_node(self, thread_id: Optional[str], node: str, seconds: float, error: bool = False) -> None:
+        status = "error" if error else "ok"
+        self.node_runs.inc(node=node, status=status)
+        self.node_seconds.observe(seconds, node=node)
+        self._update_node(thread_id, node, runs=1, errors=int(error), wall_seconds=seconds)
+
+    def record_llm_call(
+        self, thread_id: Optional[str], node: Optional[str], agent: str, model: Optional[str],
+        seconds: float, prompt_tokens: int = 0, completion_tokens: int = 0, error: bool = False,
+        cached_prompt_tokens: int = 0,
+    ) -> None:
+        model = model or "unknown"
+        cost = estimate_cost(model, prompt_tokens, completion_tokens, cached_prompt_tokens)
+        self.llm_calls.inc(agent=agent, model=model, status="error" if error else "ok")
+        self.llm_seconds.observe(seconds, agent=agent)
+        self.llm_tokens.inc(prompt_tokens, agent=agent, kind="prompt")
+        self.llm_tokens.inc(cached_prompt_tokens, agent=agent, kind="cached_prompt")
+        self.llm_tokens.inc(completion_tokens, agent=agent, kind="completion")
+        self.llm_cost.inc(cost, agent=agent, model=model)
+        self._update_node(
+            thread_id, node or agent, llm_calls=1, llm_seconds=seconds, prompt_tokens=prompt_tokens,
+            cached_prompt_tokens=cached_prompt_tokens, completion_tokens=completion_tokens, cost_usd=cost,
+        )
+
+    def record_retry(self, thread_id: Optional[str], node: Optional[str], agent: str) -> None:
+        self.llm_retries.inc(agent=agent)
+        self._update_node(thread_id, node or agent, retries=1)
+
+    def record_tool_call(self, thread_id: Optional[str], node: Optional[str], tool: str, seconds: float, error: bool = False) -> None:
+        self.tool_calls.inc(tool=tool, status="error" if error else "ok")
+        self.tool_seconds.observe(seconds, tool=tool)
+        self._update_node(thread_id, node, tool_calls=1, tool_errors=int(error), tool_seconds=seconds)
+
+    def record_upstream_event(self, upstream: str, event: str, value: float) -> None:
+        """Record a retry, rate limit wait or circuit rejection from the HTTP client layer.
+
+        Retries are also added to the current run's node, found through the
+        runnable config of the LLM or tool call making the request.
+        """
+        if event == "rate_limited":
+            self.upstream_rate_limit_wait.observe(value, upstream=upstream)
+        elif event == "circuit_open":
+            self.upstream_circuit_rejections.inc(upstream=upstream)
+        elif event == "retry":
+            self.upstream_retries.inc(upstream=upstream)
+            metadata = (var_child_runnable_config.get() or {}).get("metadata", {})
+            node = metadata.get("langgraph_node")
+            if upstream == "openai":
+                self.record_retry(metadata.get("thread_id"), node, metadata.get("agent") or node or "unknown")
+            else:
+                self._update_node(metadata.get("thread_id"), node, retries=1)
+
+    def record_route(self, agent: str, model: str, reason: str, status: str) -> None:
+        self.llm_routes.inc(agent=agent, model=model, reason=reason, status=status)
+
+    def record_report_request(self, outcome: str) -> None:
+        self.report_requests.inc(outcome=outcome)
+
+    def record_speculation(self, thread_id: Optional[str], speculation: Dict[str, float]) -> None:
+        self.speculative_overlap_seconds.observe(speculation["overlap_seconds"])
+        with self._lock:
+            run = self._run(thread_id)
+            if run is not None:
+                run.speculation = speculation
+
+    def finish_run(self, thread_id: str, status: str) -> dict:
+        """Record the run's outcome and return (and forget) its per-node summary."""
+        with self._lock:
+            run = self._runs.pop(thread_id, None) or RunStats(started_at=time.time())
+        wall_seconds = time.time() - run.started_at
+        self.reports.inc(status=status)
+        self.report_seconds.observe(wall_seconds, status=status)
+
+        nodes = {name: asdict(stats) for name, stats in run.nodes.items()}
+        totals = NodeStats()
+        for stats in run.nodes.values():
+            totals.add(stats)
+        summary = {
+            "wall_seconds": wall_seconds,
+            "queue_seconds": run.queue_seconds,
+            "totals": asdict(totals),
+            "nodes": nodes,
+        }
+        if run.speculation is not None:
+            summary["speculation"] = run.speculation
+        return summary
+
+    def render(self) -> str:
+        return "\n".join(series.render() for series in self._series) + "\n"
+
+metrics = MetricsRegistry()
+
+# --- Instrumentation --- #
+def _thread_id(config: Optional[dict]) -> Optional[str]:
+    return (config or {}).get("configurable", {}).get("thread_id")
+
+def instrument_node(name: str, func):
+    """Wrap a graph node so each execution's wall time and outcome are recorded under its thread_id."""
+    if asyncio.iscoroutinefunction(func):
+        async def instrumented_node(state, config):
+            start = time.perf_counter()
+            error = False
+            try:
+                return await func(state)
+            except BaseException:
+                error = True
+                raise
+            finally:
+                metrics.record_node(_thread_id(config), name, time.perf_counter() - start, error)
+    else:
+        def instrumented_node(state, config):
+            start = time.perf_counter()
+            error = False
+            try:
+                return func(state)
+            except BaseException:
+                error = True
+                raise
+            finally:
+                metrics.record_node(_thread_id(config), name, time.perf_counter() - start, error)
+
+    instrumented_node.__name__ = getattr(func, "__name__", name)
+    return instrumented_node
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Records LLM and tool calls, attributed via the run metadata LangGraph sets (thread_id, langgraph_node)."""
+    run_inline = True
+
+    def __init__(self, registry: MetricsRegistry = metrics):
+        self.registry = registry
+        # run_id -> (start time, thread_id, node, agent, model)
+        self._calls: Dict[object, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, metadata: Optional[dict], label: Optional[str], model: Optional[str] = None) -> None:
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        with self._lock:
+            self._calls[run_id] = (time.perf_counter(), metadata.get("thread_id"), node, label or node or "unknown", model)
+
+    def _start_llm(self, run_id, metadata: Optional[dict], kwargs: dict) -> None:
+        # Calls are labelled with the agent name instrument_llm put in the metadata
+        params = kwargs.get("invocation_params") or {}
+        label = (metadata or {}).get("agent") or kwargs.get("name")
+        model = params.get("model") or params.get("model_name") or (metadata or {}).get("ls_model_name")
+        self._start(run_id, metadata, label, model)
+
+    def _pop(self, run_id) -> Optional[tuple]:
+        with self._lock:
+            return self._calls.pop(run_id, None)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start_llm(run_id, metadata, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start_llm(run_id, metadata, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        call = self._pop(run_id)
+        if call is None:
+            return
+        start, thread_id, node, agent, model = call
+        prompt_tokens = completion_tokens = cached_prompt_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                prompt_tokens += usage.get("input_tokens", 0)
+                cached_prompt_tokens += cached_tokens(usage)
+                completion_tokens += usage.get("output_tokens", 0)
+        model = model or (response.llm_output or {}).get("model_name")
+        self.registry.record_llm_call(
+            thread_id, node, agent, model, time.perf_counter() - start, prompt_tokens, completion_tokens,
+            cached_prompt_tokens=cached_prompt_tokens,
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        call = self._pop(run_id)
+        if call is not None:
+            start, thread_id, node, agent, model = call
+            self.registry.record_llm_call(thread_id, node, agent, model, time.perf_counter() - start, error=True)
+
+    def on_retry(self, retry_state, *, run_id, metadata=None, **kwargs):
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        self.registry.record_retry(metadata.get("thread_id"), node, metadata.get("agent") or node or "unknown")
+
+    def on_tool_start(self, serialized, input_str, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, metadata, kwargs.get("name") or (serialized or {}).get("name"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        call = self._pop(run_id)
+        if call is not None:
+            start, thread_id, node, tool, _ = call
+            self.registry.record_tool_call(thread_id, node, tool, time.perf_counter() - start)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        call = self._pop(run_id)
+        if call is not None:
+            start, thread_id, node, tool, _ = call
+            self.registry.record_tool_call(thread_id, node, tool, time.perf_counter() - start, error=True)
+
+metrics_handler = MetricsCallbackHandler()
+
+def instrument_llm(llm_runnable, agent_name: Optional[str] = None):
+    """Attach the metrics handler to a (possibly bound) chat model, labelling its calls with agent_name."""
+    config = {"callbacks": [metrics_handler]}
+    if agent_name:
+        config["metadata"] = {"agent": agent_name}
+    return llm_runnable.with_config(config)
+
+def instrument_tool(tool):
+    """Attach the metrics handler to a tool, in place, and return it."""
+    tool.callbacks = [*(tool.callbacks or []), metrics_handler]
+    return tool
@@ -0,0 +1,256 @@
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying: timeouts, conflicts, rate limits and transient server errors
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of sending a request while an upstream's circuit is open."""
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate` per second up to `capacity`.
+
+    reserve() always succeeds and returns how long the caller must wait before
+    using what it reserved, so sync and async callers can share one bucket.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Requests bigger than the bucket wait for a full bucket instead of forever
+            self._tokens -= min(amount, self.capacity)
+            return max(0.0, -self._tokens / self.rate)
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits; 0 disables a limit."""
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.requests = TokenBucket(requests_per_minute / 60, requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Reserve one request and `tokens` tokens; returns the seconds to wait before sending."""
+        wait = self.requests.reserve(1) if self.requests else 0.0
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and rejects calls for `reset_seconds`.
+
+    After that one probe call is let through (half-open): success closes the
+    circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"Circuit opened after {self._failures} consecutive failures")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+def parse_retry_after(headers: httpx.Headers) -> Optional[float]:
+    """Seconds to wait from retry-after-ms or Retry-After (seconds or an HTTP date), if present."""
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def estimate_request_tokens(request: httpx.Request, completion_tokens: int) -> int:
+    """Rough token count of an OpenAI request for the tokens-per-minute budget.
+
+    About 4 characters per token for the prompt, plus the requested max tokens
+    or completion_tokens when the request doesn't set one.
+    """
+    try:
+        body = json.loads(request.content or b"{}")
+    except (ValueError, httpx.RequestNotRead):
+        return completion_tokens
+    if not isinstance(body, dict):
+        return completion_tokens
+    prompt_chars = len(json.dumps(body.get("messages") or body.get("input") or ""))
+    return prompt_chars // 4 + int(body.get("max_completion_tokens") or body.get("max_tokens") or completion_tokens)
+
+class ResiliencePolicy:
+    """Rate limiting, retries with jittered exponential backoff and circuit breaking for one upstream."""
+
+    def __init__(
+        self,
+        name: str,
+        rate_limiter: Optional[RateLimiter] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        estimate_tokens: Optional[Callable[[httpx.Request], int]] = None,
+        on_event: Optional[Callable[[str, str, float], None]] = None,
+    ):
+        self.name = name
+        self.rate_limiter = rate_limiter
+        self.circuit_breaker = circuit_breaker
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.estimate_tokens = estimate_tokens
+        # Called with (upstream, event, value) for "retry", "rate_limited" and "circuit_open"
+        self.on_event = on_event or (lambda upstream, event, value: None)
+
+    def before_attempt(self, request: httpx.Request) -> float:
+        """Check the circuit and reserve rate limit capacity; returns the seconds to wait."""
+        if self.circuit_breaker and not self.circuit_breaker.allow():
+            self.on_event(self.name, "circuit_open", 1)
+            raise CircuitOpenError(f"Circuit for {self.name} is open after repeated failures", request=request)
+        if not self.rate_limiter:
+            return 0.0
+        wait = self.rate_limiter.reserve(self.estimate_tokens(request) if self.estimate_tokens else 0)
+        if wait:
+            self.on_event(self.name, "rate_limited", wait)
+        return wait
+
+    def backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Full-jitter exponential backoff, or the server's Retry-After if that is longer."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def record(self, response: Optional[httpx.Response]) -> None:
+        # Rate limits and client errors say nothing about the upstream's health
+        if not self.circuit_breaker:
+            return
+        if response is None or response.status_code >= 500:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+
+    def should_retry(self, attempt: int, response: Optional[httpx.Response]) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return response is None or response.status_code in RETRYABLE_STATUS_CODES
+
+class ResilientTransport(httpx.BaseTransport):
+    """Sync transport applying a ResiliencePolicy around a pooled transport."""
+
+    def __init__(self, transport: httpx.BaseTransport, policy: ResiliencePolicy):
+        self.transport = transport
+        self.policy = policy
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            time.sleep(self.policy.before_attempt(request))
+            try:
+                response = self.transport.handle_request(request)
+                error = None
+            except httpx.TransportError as e:
+                response, error = None, e
+            self.policy.record(response)
+            if not self.policy.should_retry(attempt, response):
+                if error is not None:
+                    raise error
+                return response
+            delay = self.policy.backoff(attempt, parse_retry_after(response.headers) if response is not None else None)
+            logger.warning(f"{self.policy.name} request failed ({error or response.status_code}); retry {attempt + 1} in {delay:.2f}s")
+            self.policy.on_event(self.policy.name, "retry", delay)
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self) -> None:
+        self.transport.close()
+
+class AsyncResilientTransport(httpx.AsyncBaseTransport):
+    """Async transport applying a ResiliencePolicy around a pooled transport."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, policy: ResiliencePolicy):
+        self.transport = transport
+        self.policy = policy
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            wait = self.policy.before_attempt(request)
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                response = await self.transport.handle_async_request(request)
+                error = None
+            except httpx.TransportError as e:
+                response, error = None, e
+            self.policy.record(response)
+            if not self.policy.should_retry(attempt, response):
+                if error is not None:
+                    raise error
+                return response
+            delay = self.policy.backoff(attempt, parse_retry_after(response.headers) if response is not None else None)
+            logger.warning(f"{self.policy.name} request failed ({error or response.status_code}); retry {attempt + 1} in {delay:.2f}s")
+            self.policy.on_event(self.policy.name, "retry", delay)
+            if response is not None:
+                await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
@@ -0,0 +1,260 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from .metrics import cached_tokens, estimate_cost, metrics
+from .search_results import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration --- #
+# Model used by every agent without its own <AGENT>_MODELS setting
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+# Model a call is retried on after it times out ("" disables the fallback)
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+# Per-attempt timeout for async calls (and a streaming call's first chunk); 0 leaves it to the HTTP client
+ROUTER_TIMEOUT_SECONDS = float(os.getenv("ROUTER_TIMEOUT_SECONDS", "0"))
+# A model is skipped when its observed latency for the agent exceeds this (0 disables)
+ROUTER_LATENCY_TARGET_SECONDS = float(os.getenv("ROUTER_LATENCY_TARGET_SECONDS", "0"))
+# A model is skipped when a call's estimated cost exceeds this many USD (0 disables)
+ROUTER_COST_BUDGET_USD = float(os.getenv("ROUTER_COST_BUDGET_USD", "0"))
+# Completion tokens assumed for cost estimates until an agent/model pair has been observed
+ROUTER_DEFAULT_OUTPUT_TOKENS = int(os.getenv("ROUTER_DEFAULT_OUTPUT_TOKENS", "500"))
+# Every Nth call that skips a tier for its latency probes it instead, so a tier that got faster comes back (0 disables)
+ROUTER_PROBE_EVERY = int(os.getenv("ROUTER_PROBE_EVERY", "20"))
+# Weight of the latest call in the moving averages the router decides on
+ROUTER_SMOOTHING = 0.2
+
+def agent_models(agent: str) -> List[str]:
+    """The agent's model tiers from <AGENT>_MODELS (e.g. WRITER_MODELS), cheapest first."""
+    models = [model.strip() for model in os.getenv(f"{agent.upper()}_MODELS", LLM_MODEL).split(",") if model.strip()]
+    return models or [LLM_MODEL]
+
+def is_timeout(error: BaseException) -> bool:
+    # openai raises APITimeoutError; checked by name so this module doesn't import openai
+    return isinstance(error, (TimeoutError, httpx.TimeoutException)) or any(
+        cls.__name__ == "APITimeoutError" for cls in type(error).__mro__
+    )
+
+# --- Routing Decisions --- #
+
+@dataclass
+class RouteStats:
+    """What the router has seen of one agent/model pair."""
+    calls: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    fallbacks: int = 0
+    seconds_total: float = 0.0
+    cost_usd_total: float = 0.0
+    # Moving averages the routing decisions are based on
+    avg_seconds: Optional[float] = None
+    avg_completion_tokens: Optional[float] = None
+    # Calls that skipped this model for its latency since it was last used
+    skipped: int = 0
+
+class ModelRouter:
+    """Picks a model per call from an agent's tiers.
+
+    The strongest tier is preferred; a tier is skipped when the call's estimated
+    cost (its input size plus the completion length seen so far) is over the cost
+    budget, or when its observed latency is over the latency target. If no tier
+    fits, the cheapest is used. Every `probe_every`th call that would skip a tier
+    for its latency uses it instead; the probe's latency replaces the tier's
+    average, so a tier that recovered is preferred again.
+    """
+
+    def __init__(
+        self,
+        latency_target: float = ROUTER_LATENCY_TARGET_SECONDS,
+        cost_budget: float = ROUTER_COST_BUDGET_USD,
+        default_output_tokens: int = ROUTER_DEFAULT_OUTPUT_TOKENS,
+        probe_every: int = ROUTER_PROBE_EVERY,
+    ):
+        self.latency_target = latency_target
+        self.cost_budget = cost_budget
+        self.default_output_tokens = default_output_tokens
+        self.probe_every = probe_every
+        self._stats: Dict[Tuple[str, str], RouteStats] = {}
+        self._lock = threading.Lock()
+
+    def _route_stats(self, agent: str, model: str) -> RouteStats:
+        return self._stats.setdefault((agent, model), RouteStats())
+
+    def estimated_cost(self, agent: str, model: str, input_tokens: int) -> float:
+        with self._lock:
+            completion_tokens = self._route_stats(agent, model).avg_completion_tokens
+        return estimate_cost(model, input_tokens, int(completion_tokens or self.default_output_tokens))
+
+    def choose(self, agent: str, models: List[str], input_tokens: int) -> Tuple[str, str]:
+        """Return (model, reason) for a call of `input_tokens` tokens."""
+        for model in reversed(models):
+            if self.cost_budget and self.estimated_cost(agent, model, input_tokens) > self.cost_budget:
+                continue
+            with self._lock:
+                stats = self._route_stats(agent, model)
+                if self.latency_target and stats.avg_seconds is not None and stats.avg_seconds > self.latency_target:
+                    stats.skipped += 1
+                    if not self.probe_every or stats.skipped < self.probe_every:
+                        continue
+                    stats.skipped = 0
+                    return model, "probe"
+            return model, "preferred" if model == models[-1] else "downgraded"
+        return models[0], "cheapest"
+
+    def record(self, agent: str, model: str, reason: str, seconds: float, response: Optional[BaseMessage] = None, error: Optional[BaseException] = None) -> None:
+        """Record a call's outcome; `reason` is why the model was used (see choose, or "fallback")."""
+        usage = getattr(response, "usage_metadata", None) or {}
+        cost = estimate_cost(model, usage.get("input_tokens", 0), usage.get("output_tokens", 0), cached_tokens(usage))
+        timed_out = error is not None and is_timeout(error)
+        with self._lock:
+            stats = self._route_stats(agent, model)
+            stats.calls += 1
+            stats.errors += error is not None
+            stats.timeouts += timed_out
+            stats.fallbacks += reason == "fallback"
+            stats.seconds_total += seconds
+            stats.cost_usd_total += cost
+            # Failed calls other than timeouts say nothing about the model's speed;
+            # a probe's latency replaces the average that kept the model skipped
+            if error is None or timed_out:
+                stats.avg_seconds = seconds if reason == "probe" else _smooth(stats.avg_seconds, seconds)
+            if usage.get("output_tokens"):
+                stats.avg_completion_tokens = _smooth(stats.avg_completion_tokens, usage["output_tokens"])
+        status = "timeout" if timed_out else "error" if error is not None else "ok"
+        metrics.record_route(agent, model, reason, status)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {"agent": agent, "model": model, **asdict(stats)}
+                for (agent, model), stats in sorted(self._stats.items())
+            ]
+
+def _smooth(average: Optional[float], value: float) -> float:
+    return value if average is None else (1 - ROUTER_SMOOTHING) * average + ROUTER_SMOOTHING * value
+
+router = ModelRouter()
+
+# --- Routed Agents --- #
+
+class RoutedAgent(Runnable):
+    """An agent runnable that routes each call to one of its model tiers.
+
+    build(model) returns the agent's runnable on that model. A call that times
+    out is retried once on the fallback model, unless a streamed call has
+    already produced output.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        models: List[str],
+        build: Callable[[str], Runnable],
+        system_prompt: str = "",
+        fallback_model: str = LLM_FALLBACK_MODEL,
+        timeout: float = ROUTER_TIMEOUT_SECONDS,
+        model_router: ModelRouter = router,
+    ):
+        self.name = name
+        self.models = models
+        self.fallback_model = fallback_model
+        self.timeout = timeout or None
+        self.router = model_router
+        self._build = build
+        self._runnables: Dict[str, Runnable] = {}
+        self._lock = threading.Lock()
+        self._system_tokens = count_tokens(system_prompt)
+
+    def _runnable(self, model: str) -> Runnable:
+        with self._lock:
+            if model not in self._runnables:
+                self._runnables[model] = self._build(model)
+            return self._runnables[model]
+
+    def _attempts(self, input: Any) -> List[Tuple[str, str]]:
+        messages = input.get("messages", []) if isinstance(input, dict) else []
+        input_tokens = self._system_tokens + sum(count_tokens(str(message.content)) for message in messages)
+        model, reason = self.router.choose(self.name, self.models, input_tokens)
+        logger.debug(f"Routing {self.name} call ({input_tokens} input tokens) to {model} ({reason})")
+        attempts = [(model, reason)]
+        if self.fallback_model and self.fallback_model != model:
+            attempts.append((self.fallback_model, "fallback"))
+        return attempts
+
+    def _failed(self, model: str, reason: str, start: float, error: BaseException, last_attempt: bool) -> None:
+        self.router.record(self.name, model, reason, time.perf_counter() - start, error=error)
+        if last_attempt or not is_timeout(error):
+            raise error
+        logger.warning(f"{self.name} call on {model} timed out after {time.perf_counter() - start:.1f}s; falling back to {self.fallback_model}")
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        attempts = self._attempts(input)
+        for i, (model, reason) in enumerate(attempts):
+            start = time.perf_counter()
+            try:
+                response = self._runnable(model).invoke(input, config, **kwargs)
+            except Exception as e:
+                self._failed(model, reason, start, e, i == len(attempts) - 1)
+                continue
+            self.router.record(self.name, model, reason, time.perf_counter() - start, response)
+            return response
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        attempts = self._attempts(input)
+        for i, (model, reason) in enumerate(attempts):
+            start = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(self._runnable(model).ainvoke(input, config, **kwargs), self.timeout)
+            except Exception as e:
+                self._failed(model, reason, start, e, i == len(attempts) - 1)
+                continue
+            self.router.record(self.name, model, reason, time.perf_counter() - start, response)
+            return response
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        attempts = self._attempts(input)
+        for i, (model, reason) in enumerate(attempts):
+            start = time.perf_counter()
+            response, started = None, False
+            try:
+                for chunk in self._runnable(model).stream(input, config, **kwargs):
+                    started = True
+                    response = chunk if response is None else response + chunk
+                    yield chunk
+            except Exception as e:
+                # Output already sent can't be taken back, so only a call that produced nothing falls back
+                self._failed(model, reason, start, e, started or i == len(attempts) - 1)
+                continue
+            self.router.record(self.name, model, reason, time.perf_counter() - start, response)
+            return
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        attempts = self._attempts(input)
+        for i, (model, reason) in enumerate(attempts):
+            start = time.perf_counter()
+            response, started = None, False
+            chunks = self._runnable(model).astream(input, config, **kwargs).__aiter__()
+            try:
+                # The timeout covers the wait for the first chunk
+                chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                while True:
+                    started = True
+                    response = chunk if response is None else response + chunk
+                    yield chunk
+                    chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                self.router.record(self.name, model, reason, time.perf_counter() - start, response)
+                return
+            except Exception as e:
+                self._failed(model, reason, start, e, started or i == len(attempts) - 1)
+            finally:
+                await chunks.aclose()
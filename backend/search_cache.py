@@ -0,0 +1,182 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from .state_backend import StateBackend
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration --- #
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", ".cache/search_cache.sqlite3")
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "5000"))
+
+def normalize_query(query: str) -> str:
+    """Lowercase the query, collapse whitespace and drop surrounding punctuation."""
+    query = re.sub(r"\s+", " ", query.lower()).strip()
+    return query.strip(" .,;:!?\"'")
+
+class SearchCache:
+    """Persistent search-result cache stored in a local SQLite file.
+
+    Entries are keyed on the normalized query plus max_results, expire after
+    ttl_seconds and are evicted least-recently-used once the cache holds more
+    than max_entries. Hit/miss counters are kept per process for monitoring.
+    """
+
+    def __init__(self, path: str = SEARCH_CACHE_PATH, ttl_seconds: float = SEARCH_CACHE_TTL_SECONDS, max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # One connection shared across threads, serialized by the lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                "key TEXT PRIMARY KEY, query TEXT NOT NULL, max_results INTEGER NOT NULL, "
+                "value TEXT NOT NULL, created_at REAL NOT NULL, last_accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_lru ON search_cache (last_accessed)")
+
+    @staticmethod
+    def make_key(query: str, max_results: int) -> str:
+        return hashlib.sha256(f"{normalize_query(query)}|{max_results}".encode("utf-8")).hexdigest()
+
+    def get(self, query: str, max_results: int) -> Optional[Any]:
+        """Return the cached value for the query, or None on a miss or expired entry."""
+        key = self.make_key(query, max_results)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value, created_at FROM search_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE search_cache SET last_accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, query: str, max_results: int, value: Any) -> None:
+        """Store a JSON-serializable value and evict the least recently used entries if full."""
+        key = self.make_key(query, max_results)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, query, max_results, value, created_at, last_accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, normalize_query(query), max_results, json.dumps(value), now, now),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+            if count > self.max_entries:
+                overflow = count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM search_cache WHERE key IN "
+                    "(SELECT key FROM search_cache ORDER BY last_accessed ASC LIMIT ?)",
+                    (overflow,),
+                )
+                self.evictions += overflow
+
+    def seed(self, query: str, max_results: int, results: Any, raw_results: Optional[Dict] = None) -> None:
+        """Pre-seed search results in the format the cached search tool stores, e.g. for offline runs."""
+        self.set(query, max_results, {"content": results, "artifact": raw_results or {"query": query, "results": results}})
+
+    def purge_expired(self) -> int:
+        """Delete every expired entry and return how many were removed."""
+        with self._lock, self._conn:
+            removed = self._conn.execute(
+                "DELETE FROM search_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+        self.expirations += removed
+        return removed
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM search_cache")
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for monitoring: hits, misses, hit rate, evictions and current size."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+class SharedSearchCache(SearchCache):
+    """Search-result cache in the shared state backend, for workers on several hosts.
+
+    Entries expire through the backend's ttl. The backend bounds the size itself
+    (for Redis, set a maxmemory policy such as allkeys-lru), so max_entries is
+    only reported. Hit/miss counters are still per process.
+    """
+
+    def __init__(self, backend: StateBackend, ttl_seconds: float = SEARCH_CACHE_TTL_SECONDS, max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        # No local SQLite file, so SearchCache.__init__ is not called
+        self.backend = backend
+        self.path = None
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+
+    def get(self, query: str, max_results: int) -> Optional[Any]:
+        value = self.backend.get(f"search:{self.make_key(query, max_results)}")
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, query: str, max_results: int, value: Any) -> None:
+        self.backend.set(f"search:{self.make_key(query, max_results)}", json.dumps(value), ttl=self.ttl_seconds)
+
+    def purge_expired(self) -> int:
+        # The backend drops expired entries itself
+        return 0
+
+    def clear(self) -> None:
+        self.backend.delete(*self.backend.keys("search:"))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "entries": len(self.backend.keys("search:")),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "shared": True,
+        }
@@ -0,0 +1,163 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from typing import List, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+from langchain_core.messages import ToolMessage
+
+from .llm_cache import embed_text, cosine_similarity
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration --- #
+# Tokens of search results one researcher turn may add to the context (0 disables the budget)
+SEARCH_RESULT_TOKEN_BUDGET = int(os.getenv("SEARCH_RESULT_TOKEN_BUDGET", "3000"))
+# Each result's content is trimmed to its most relevant sentences within this many tokens
+SEARCH_RESULT_MAX_TOKENS = int(os.getenv("SEARCH_RESULT_MAX_TOKENS", "400"))
+# tiktoken encoding used to count tokens; falls back to an estimate if it can't be loaded
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+
+# --- Token Counting --- #
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            _encoding_loaded = True
+            try:
+                import tiktoken
+
+                _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+            except Exception as e:
+                # tiktoken downloads encodings on first use; offline, estimate instead
+                logger.warning(f"Tokenizer '{TOKENIZER_ENCODING}' unavailable ({type(e).__name__}); estimating token counts")
+        return _encoding
+
+def count_tokens(text: str) -> int:
+    """Token count of text with the local tokenizer, or an estimate of it.
+
+    The estimate counts words and punctuation, with long words counted per 4 characters.
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(max(1, len(piece) // 4) for piece in re.findall(r"\w+|[^\w\s]", text))
+
+# --- Result Processing --- #
+# Between the search tool and the message history: drop results the researcher has
+# already seen, trim each to its relevant text, rank by relevance to the research
+# question and pack them into the turn's token budget.
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+
+def normalize_url(url: str) -> str:
+    """Lowercase scheme and host, drop the fragment, "www." and trailing slashes."""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower().removeprefix("www.")
+    return urlunsplit((parts.scheme.lower(), host, parts.path.rstrip("/"), parts.query, ""))
+
+def content_hash(text: str) -> str:
+    normalized = re.sub(r"\s+", " ", text.lower()).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+def trim_content(text: str, query_embedding: dict, max_tokens: int) -> str:
+    """Keep the sentences most relevant to the query, in their original order, within max_tokens."""
+    text = re.sub(r"[ \t]+", " ", text).strip()
+    if max_tokens <= 0 or count_tokens(text) <= max_tokens:
+        return text
+    sentences = [sentence.strip() for sentence in SENTENCE_PATTERN.split(text) if sentence.strip()]
+    ranked = sorted(range(len(sentences)), key=lambda i: cosine_similarity(query_embedding, embed_text(sentences[i])), reverse=True)
+    kept, used = set(), 0
+    for i in ranked:
+        tokens = count_tokens(sentences[i])
+        if used + tokens > max_tokens:
+            continue
+        kept.add(i)
+        used += tokens
+    if not kept:
+        # Not even one sentence fits: cut the most relevant one
+        return sentences[ranked[0]][:max_tokens * 4]
+    return " ".join(sentences[i] for i in sorted(kept))
+
+class SearchResultProcessor:
+    """Processes the search results of one research conversation, turn by turn.
+
+    Remembers the URLs and contents it has already passed on, so repeated hits
+    across the conversation's calls and turns are sent only once.
+    """
+
+    def __init__(self, question: str, token_budget: int = SEARCH_RESULT_TOKEN_BUDGET, max_result_tokens: int = SEARCH_RESULT_MAX_TOKENS):
+        self.question = question
+        self.token_budget = token_budget
+        self.max_result_tokens = max_result_tokens
+        self._seen_urls = set()
+        self._seen_contents = set()
+
+    def process(self, tool_calls: List[dict], tool_messages: List[ToolMessage]) -> List[ToolMessage]:
+        """Return the turn's tool messages with their results deduplicated, trimmed, ranked and packed.
+
+        Messages without a list of results in their artifact (errors, other tools)
+        are passed through unchanged.
+        """
+        candidates: List[Tuple[float, int, dict, str, str]] = []
+        processed = set()
+        # Duplicates within the turn are dropped too; results only count as seen once sent
+        turn_urls, turn_contents = set(), set()
+        for index, (tool_call, message) in enumerate(zip(tool_calls, tool_messages)):
+            results = getattr(message, "artifact", None)
+            if message.status == "error" or not isinstance(results, list):
+                continue
+            processed.add(index)
+            query = str(tool_call.get("args", {}).get("query", ""))
+            query_embedding = embed_text(f"{self.question} {query}")
+            for result in results:
+                if not isinstance(result, dict) or not result.get("content"):
+                    continue
+                url = normalize_url(str(result.get("url", "")))
+                digest = content_hash(str(result["content"]))
+                if (url and url in self._seen_urls | turn_urls) or digest in self._seen_contents | turn_contents:
+                    continue
+                turn_urls.add(url)
+                turn_contents.add(digest)
+                score, compact = self._compact(result, query_embedding)
+                candidates.append((score, index, compact, url, digest))
+
+        # Best results first, across all of the turn's calls, until the budget is used up
+        selected = {index: [] for index in processed}
+        used = dropped = 0
+        for score, index, result, url, digest in sorted(candidates, key=lambda candidate: candidate[0], reverse=True):
+            tokens = count_tokens(json.dumps(result, ensure_ascii=False))
+            if self.token_budget and used + tokens > self.token_budget:
+                dropped += 1
+                continue
+            used += tokens
+            selected[index].append(result)
+            self._seen_urls.add(url)
+            self._seen_contents.add(digest)
+        if processed:
+            logger.info(f"Search results: {sum(len(results) for results in selected.values())} kept ({used} tokens), {dropped} over budget")
+
+        return [
+            self._message(message, selected[index]) if index in processed else message
+            for index, message in enumerate(tool_messages)
+        ]
+
+    def _compact(self, result: dict, query_embedding: dict) -> Tuple[float, dict]:
+        """The result's relevance score and its url, title and trimmed content."""
+        content = trim_content(str(result["content"]), query_embedding, self.max_result_tokens)
+        compact = {key: result[key] for key in ("url", "title") if result.get(key)}
+        compact["content"] = content
+        return cosine_similarity(query_embedding, embed_text(f"{result.get('title', '')} {content}")), compact
+
+    @staticmethod
+    def _message(message: ToolMessage, results: List[dict]) -> ToolMessage:
+        content = json.dumps(results, ensure_ascii=False) if results else "No new results (all were duplicates of earlier results or over the context budget)."
+        return ToolMessage(content=content, tool_call_id=message.tool_call_id, name=message.name, artifact=message.artifact)
@@ -0,0 +1,104 @@
+import re
+from typing import Dict, List, Optional, TypedDict
+
+# --- Report Sections --- #
+# Drafts are kept as addressable sections so a revision can rewrite only the
+# sections the reviewer flagged and the reviewer can re-check only those.
+
+class Section(TypedDict):
+    id: str
+    title: str
+    content: str
+
+# Markdown headings start a new section; text before the first heading is its own section
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$", re.MULTILINE)
+# Reviewer feedback points start with the label of the section they concern, e.g. "[S2] ..."
+SECTION_LABEL_PATTERN = re.compile(r"^\W*\[(S\d+)\]\W*", re.IGNORECASE)
+
+def _title(content: str) -> str:
+    heading = HEADING_PATTERN.match(content)
+    return heading.group(2) if heading else content.splitlines()[0][:80]
+
+def split_sections(report: str) -> List[Section]:
+    """Split a report into sections at its Markdown headings, labelled S1, S2, ..."""
+    starts = [match.start() for match in HEADING_PATTERN.finditer(report)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    sections = []
+    for start, end in zip(starts, starts[1:] + [len(report)]):
+        content = report[start:end].strip()
+        if not content:
+            continue
+        sections.append({"id": f"S{len(sections) + 1}", "title": _title(content), "content": content})
+    return sections
+
+def join_sections(sections: List[Section]) -> str:
+    return "\n\n".join(section["content"] for section in sections)
+
+def label_sections(sections: List[Section]) -> str:
+    """The report with each section prefixed by its label, for the reviewer."""
+    return "\n\n".join(f"[{section['id']}]\n{section['content']}" for section in sections)
+
+def parse_section_feedback(feedback: str, sections: List[Section]) -> Optional[Dict[str, str]]:
+    """Group reviewer feedback by the section labels it starts its points with.
+
+    Lines without a label belong to the point above them. Returns None when the
+    feedback names no known section, so the caller can fall back to a full rewrite.
+    """
+    known = {section["id"] for section in sections}
+    by_section: Dict[str, List[str]] = {}
+    current = None
+    for line in feedback.splitlines():
+        match = SECTION_LABEL_PATTERN.match(line)
+        if match and match.group(1).upper() in known:
+            current = match.group(1).upper()
+            line = line[match.end():]
+        if current and line.strip():
+            by_section.setdefault(current, []).append(line.strip())
+    if not by_section:
+        return None
+    return {section_id: "\n".join(lines) for section_id, lines in by_section.items()}
+
+def _normalize(title: str) -> str:
+    return " ".join(title.casefold().rstrip(":.").split())
+
+def revised_section(section: Section, revised: str) -> Optional[str]:
+    """The revised content for section, or None if the text isn't a revision of just that section.
+
+    The text must start with the original's heading (any level) and may add
+    subsections below it; a later heading at the same or a higher level, or
+    text before the heading, can't be attributed to the section. Text before
+    the report's first heading has no heading, so its revision may have none.
+    """
+    text = (revised or "").strip()
+    headings = list(HEADING_PATTERN.finditer(text))
+    original = HEADING_PATTERN.match(section["content"])
+    if original is None:
+        return text if text and not headings else None
+    if not headings or headings[0].start() != 0 or _normalize(headings[0].group(2)) != _normalize(original.group(2)):
+        return None
+    level = len(headings[0].group(1))
+    if any(len(heading.group(1)) <= level for heading in headings[1:]):
+        return None
+    return text
+
+def replace_sections(sections: List[Section], revised: Dict[str, str]) -> Optional[List[Section]]:
+    """Return the sections with the revised content swapped in; ids and order are kept.
+
+    Returns None when a revision doesn't match its section (see revised_section),
+    so the caller can fall back to a full rewrite.
+    """
+    updated = []
+    for section in sections:
+        if section["id"] not in revised:
+            updated.append(section)
+            continue
+        content = revised_section(section, revised[section["id"]])
+        if content is None:
+            return None
+        # A subsection repeating another section (e.g. one the model pulled in) would duplicate it
+        subheadings = {_normalize(heading.group(2)) for heading in list(HEADING_PATTERN.finditer(content))[1:]}
+        if any(_normalize(other["title"]) in subheadings for other in sections if other["id"] != section["id"]):
+            return None
+        updated.append({**section, "title": _title(content), "content": content})
+    return updated
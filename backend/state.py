@@ -1,14 +1,28 @@
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 from typing_extensions import TypedDict, Annotated
 import operator
 from langchain_core.messages import BaseMessage
 from typing import Sequence
 
+def merge_dicts(current: Optional[dict], update: Optional[dict]) -> dict:
+    return {**(current or {}), **(update or {})}
+
+# Input of one dispatched research task (sent with langgraph's Send, not part of the graph state)
+class ResearchTaskInput(TypedDict):
+    prompt: str
+    plan: Optional[str]
+    research_task: dict
+    # (question, result) of each task it depends on
+    dependencies: List[Tuple[str, str]]
+
 # Define the structure for the overall state of the graph
 class AgentState(TypedDict):
     # User's initial request
     prompt: str
 
+    # The planner's research plan, shared with every researcher
+    plan: Optional[str]
+
     # Store research results from each researcher
     tech_research: Optional[str]
     market_sales_research: Optional[str]
@@ -17,12 +31,37 @@ class AgentState(TypedDict):
     # Review feedback on drafts
     review_feedback: Optional[str]
 
+    # The reviewer's structured verdict: approved, severity and issues (see agents.ReviewVerdict)
+    review_verdict: Optional[dict]
+
     # The draft report for review
     draft_report: Optional[str]
 
+    # The draft split into labelled sections (see backend.sections), so revisions
+    # can rewrite only the sections the reviewer flagged
+    draft_sections: Optional[List[dict]]
+
+    # Reviewer feedback per section id, for the next incremental revision
+    section_feedback: Optional[Dict[str, str]]
+
+    # Ids of the sections the last revision rewrote; the reviewer re-checks only these
+    revised_sections: Optional[List[str]]
+
+    # Speculative mode: seconds of research and writing, and how much of the writing overlapped research
+    speculation: Optional[Dict[str, float]]
+
     # The final report to return to the user
     final_report: Optional[str]
 
+    # Researchers the planner's tasks use
+    research_agents: Optional[List[str]]
+
+    # The planner's research tasks: {"id", "agent", "question", "depends_on"}
+    research_tasks: Optional[List[dict]]
+
+    # Result per finished research task id; parallel tasks each merge in their own
+    task_results: Annotated[Dict[str, str], merge_dicts]
+
     # Keep track of the next agent to run
     next_agent: Optional[str]
 
@@ -30,5 +69,6 @@ class AgentState(TypedDict):
     revision_count: int
 
     # Messages history for context (especially for agent interactions)
-    # Using Annotated sequence with operator.add allows messages to be appended
+    # Using Annotated sequence with operator.add allows messages to be appended,
+    # so nodes must return only their new messages, never the whole history
     messages: Annotated[Sequence[BaseMessage], operator.add] 
\ No newline at end of file
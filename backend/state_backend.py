@@ -0,0 +1,339 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration --- #
+# "memory" keeps run state in each process; "sqlite" shares it between the workers on one host,
+# "redis" between every worker and node of a deployment
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory").lower()
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", ".cache/state.sqlite3")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Prepended to every key, so several deployments can share one store
+STATE_KEY_PREFIX = os.getenv("STATE_KEY_PREFIX", "report:")
+
+class StateBackend(ABC):
+    """Key/value, hash and list store shared by all workers of a deployment.
+
+    Values are bytes (str is encoded as UTF-8). A ttl in seconds makes a key
+    expire; writing a key again with a ttl renews it. All methods are blocking
+    and thread-safe, so async callers run them with asyncio.to_thread.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def add(self, key: str, value, ttl: Optional[float] = None) -> bool:
+        """Set the key only if it doesn't exist; returns whether it was set."""
+
+    @abstractmethod
+    def delete(self, *keys: str) -> None:
+        ...
+
+    @abstractmethod
+    def hset(self, key: str, mapping: Mapping[str, object], ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def hgetall(self, key: str) -> Dict[str, bytes]:
+        ...
+
+    @abstractmethod
+    def hdel(self, key: str, *fields: str) -> None:
+        ...
+
+    @abstractmethod
+    def rpush(self, key: str, *values, ttl: Optional[float] = None) -> int:
+        """Append values to a list and return its new length."""
+
+    @abstractmethod
+    def lrange(self, key: str, start: int = 0, end: int = -1) -> List[bytes]:
+        """List items from start to end, both inclusive; negative indexes count from the end."""
+
+    @abstractmethod
+    def lset(self, key: str, items: Mapping[int, object]) -> None:
+        """Overwrite list items by index; indexes past the end of the list are ignored."""
+
+    @abstractmethod
+    def keys(self, prefix: str) -> List[str]:
+        """Every live key starting with prefix (without the store's key prefix)."""
+
+    def close(self) -> None:
+        """Release connections; the default has none."""
+
+def _to_bytes(value) -> bytes:
+    return value if isinstance(value, bytes) else str(value).encode("utf-8")
+
+# --- SQLite --- #
+
+class SQLiteStateBackend(StateBackend):
+    """State in a local SQLite file, shared by every process that opens it.
+
+    The file is in WAL mode so readers don't block the writer. Expired keys are
+    dropped when read and swept every so often on writes.
+    """
+
+    # Writes between sweeps of expired keys
+    SWEEP_EVERY = 500
+
+    def __init__(self, path: str = STATE_DB_PATH, prefix: str = STATE_KEY_PREFIX):
+        self.path = path
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._writes = 0
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Autocommit mode; writes open their own transactions
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS strings (key TEXT PRIMARY KEY, value BLOB NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS hashes (key TEXT NOT NULL, field TEXT NOT NULL, value BLOB NOT NULL, PRIMARY KEY (key, field));"
+                "CREATE TABLE IF NOT EXISTS lists (key TEXT NOT NULL, position INTEGER NOT NULL, value BLOB NOT NULL, PRIMARY KEY (key, position));"
+                "CREATE TABLE IF NOT EXISTS expiry (key TEXT PRIMARY KEY, expires_at REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS idx_expiry_at ON expiry (expires_at);"
+            )
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """One write transaction; BEGIN IMMEDIATE serializes writers across processes."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            self._writes += 1
+            if self._writes % self.SWEEP_EVERY == 0:
+                self._sweep()
+
+    def _sweep(self) -> None:
+        self._conn.execute("BEGIN IMMEDIATE")
+        expired = [row[0] for row in self._conn.execute("SELECT key FROM expiry WHERE expires_at <= ?", (time.time(),))]
+        for key in expired:
+            self._drop(key)
+        self._conn.execute("COMMIT")
+
+    def _drop(self, key: str) -> None:
+        for table in ("strings", "hashes", "lists", "expiry"):
+            self._conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+
+    def _expired(self, key: str) -> bool:
+        row = self._conn.execute("SELECT expires_at FROM expiry WHERE key = ?", (key,)).fetchone()
+        return row is not None and row[0] <= time.time()
+
+    def _clear_expired(self, key: str) -> None:
+        # Called inside a write, so a key that lapsed isn't revived with its old contents
+        if self._expired(key):
+            self._drop(key)
+
+    def _set_ttl(self, conn: sqlite3.Connection, key: str, ttl: Optional[float]) -> None:
+        if ttl:
+            conn.execute("INSERT OR REPLACE INTO expiry (key, expires_at) VALUES (?, ?)", (key, time.time() + ttl))
+
+    def get(self, key: str) -> Optional[bytes]:
+        key = self.prefix + key
+        with self._lock:
+            if self._expired(key):
+                return None
+            row = self._conn.execute("SELECT value FROM strings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value, ttl: Optional[float] = None) -> None:
+        key = self.prefix + key
+        with self._write() as conn:
+            conn.execute("INSERT OR REPLACE INTO strings (key, value) VALUES (?, ?)", (key, _to_bytes(value)))
+            conn.execute("DELETE FROM expiry WHERE key = ?", (key,))
+            self._set_ttl(conn, key, ttl)
+
+    def add(self, key: str, value, ttl: Optional[float] = None) -> bool:
+        key = self.prefix + key
+        with self._write() as conn:
+            self._clear_expired(key)
+            if conn.execute("SELECT 1 FROM strings WHERE key = ?", (key,)).fetchone():
+                return False
+            conn.execute("INSERT INTO strings (key, value) VALUES (?, ?)", (key, _to_bytes(value)))
+            self._set_ttl(conn, key, ttl)
+            return True
+
+    def delete(self, *keys: str) -> None:
+        with self._write():
+            for key in keys:
+                self._drop(self.prefix + key)
+
+    def hset(self, key: str, mapping: Mapping[str, object], ttl: Optional[float] = None) -> None:
+        key = self.prefix + key
+        with self._write() as conn:
+            self._clear_expired(key)
+            conn.executemany(
+                "INSERT OR REPLACE INTO hashes (key, field, value) VALUES (?, ?, ?)",
+                [(key, field, _to_bytes(value)) for field, value in mapping.items()],
+            )
+            self._set_ttl(conn, key, ttl)
+
+    def hgetall(self, key: str) -> Dict[str, bytes]:
+        key = self.prefix + key
+        with self._lock:
+            if self._expired(key):
+                return {}
+            return dict(self._conn.execute("SELECT field, value FROM hashes WHERE key = ?", (key,)).fetchall())
+
+    def hdel(self, key: str, *fields: str) -> None:
+        key = self.prefix + key
+        with self._write() as conn:
+            conn.executemany("DELETE FROM hashes WHERE key = ? AND field = ?", [(key, field) for field in fields])
+
+    def rpush(self, key: str, *values, ttl: Optional[float] = None) -> int:
+        key = self.prefix + key
+        with self._write() as conn:
+            self._clear_expired(key)
+            length = conn.execute("SELECT COUNT(*) FROM lists WHERE key = ?", (key,)).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO lists (key, position, value) VALUES (?, ?, ?)",
+                [(key, length + i, _to_bytes(value)) for i, value in enumerate(values)],
+            )
+            self._set_ttl(conn, key, ttl)
+            return length + len(values)
+
+    def lrange(self, key: str, start: int = 0, end: int = -1) -> List[bytes]:
+        key = self.prefix + key
+        with self._lock:
+            if self._expired(key):
+                return []
+            if start < 0 or end < 0:
+                length = self._conn.execute("SELECT COUNT(*) FROM lists WHERE key = ?", (key,)).fetchone()[0]
+                start = max(0, start + length) if start < 0 else start
+                end = end + length if end < 0 else end
+            rows = self._conn.execute(
+                "SELECT value FROM lists WHERE key = ? AND position BETWEEN ? AND ? ORDER BY position",
+                (key, start, end),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def lset(self, key: str, items: Mapping[int, object]) -> None:
+        key = self.prefix + key
+        with self._write() as conn:
+            self._clear_expired(key)
+            conn.executemany(
+                "UPDATE lists SET value = ? WHERE key = ? AND position = ?",
+                [(_to_bytes(value), key, index) for index, value in items.items()],
+            )
+
+    def keys(self, prefix: str) -> List[str]:
+        pattern = (self.prefix + prefix).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key FROM (SELECT key FROM strings UNION SELECT key FROM hashes UNION SELECT key FROM lists) "
+                "WHERE key LIKE ? ESCAPE '\\' AND key NOT IN (SELECT key FROM expiry WHERE expires_at <= ?)",
+                (pattern, time.time()),
+            ).fetchall()
+        return [row[0][len(self.prefix):] for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+# --- Redis --- #
+
+class RedisStateBackend(StateBackend):
+    """State in Redis (or any server speaking its protocol), shared across hosts.
+
+    Multi-step writes (a value plus its ttl) go out as one MULTI/EXEC
+    transaction, so no reader sees a key without its expiry.
+    """
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = STATE_KEY_PREFIX):
+        # Imported here so the dependency is only needed when STATE_BACKEND=redis
+        import redis
+
+        self.url = url
+        self.prefix = prefix
+        # RESP2 is spoken by every Redis version and Redis-compatible server
+        self._client = redis.Redis.from_url(url, protocol=2)
+
+    def _expire(self, pipe, key: str, ttl: Optional[float]) -> None:
+        if ttl:
+            pipe.pexpire(key, int(ttl * 1000))
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(self.prefix + key)
+
+    def set(self, key: str, value, ttl: Optional[float] = None) -> None:
+        self._client.set(self.prefix + key, _to_bytes(value), px=int(ttl * 1000) if ttl else None)
+
+    def add(self, key: str, value, ttl: Optional[float] = None) -> bool:
+        return bool(self._client.set(self.prefix + key, _to_bytes(value), px=int(ttl * 1000) if ttl else None, nx=True))
+
+    def delete(self, *keys: str) -> None:
+        if keys:
+            self._client.delete(*(self.prefix + key for key in keys))
+
+    def hset(self, key: str, mapping: Mapping[str, object], ttl: Optional[float] = None) -> None:
+        key = self.prefix + key
+        with self._client.pipeline() as pipe:
+            pipe.hset(key, mapping={field: _to_bytes(value) for field, value in mapping.items()})
+            self._expire(pipe, key, ttl)
+            pipe.execute()
+
+    def hgetall(self, key: str) -> Dict[str, bytes]:
+        return {field.decode("utf-8"): value for field, value in self._client.hgetall(self.prefix + key).items()}
+
+    def hdel(self, key: str, *fields: str) -> None:
+        if fields:
+            self._client.hdel(self.prefix + key, *fields)
+
+    def rpush(self, key: str, *values, ttl: Optional[float] = None) -> int:
+        key = self.prefix + key
+        with self._client.pipeline() as pipe:
+            pipe.rpush(key, *(_to_bytes(value) for value in values))
+            self._expire(pipe, key, ttl)
+            return pipe.execute()[0]
+
+    def lrange(self, key: str, start: int = 0, end: int = -1) -> List[bytes]:
+        return self._client.lrange(self.prefix + key, start, end)
+
+    def lset(self, key: str, items: Mapping[int, object]) -> None:
+        key = self.prefix + key
+        with self._client.pipeline() as pipe:
+            for index, value in items.items():
+                pipe.lset(key, index, _to_bytes(value))
+            # An index past the end (or a list that expired) fails on its own and is skipped
+            pipe.execute(raise_on_error=False)
+
+    def keys(self, prefix: str) -> List[str]:
+        pattern = "".join("\\" + c if c in "*?[]\\" else c for c in self.prefix + prefix) + "*"
+        return [key.decode("utf-8")[len(self.prefix):] for key in self._client.scan_iter(match=pattern, count=500)]
+
+    def close(self) -> None:
+        self._client.close()
+
+def open_state_backend(kind: str = STATE_BACKEND) -> Optional[StateBackend]:
+    """Create the configured backend, or None for process-local state."""
+    if kind == "memory":
+        return None
+    if kind == "sqlite":
+        return SQLiteStateBackend()
+    if kind == "redis":
+        return RedisStateBackend()
+    raise ValueError(f"Unknown STATE_BACKEND '{kind}'. Use 'memory', 'sqlite' or 'redis'.")
+
+# Shared by the checkpointer, job manager and caches (None when STATE_BACKEND=memory)
+state_backend = open_state_backend()
+if state_backend is not None:
+    logger.info(f"Shared state backend: {type(state_backend).__name__}")
@@ -0,0 +1,85 @@
+import os
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from langchain_community.tools.tavily_search import TavilySearchResults
+from langchain_community.utilities import tavily_search
+
+from .clients import get_http_client, get_async_http_client
+from .search_cache import SearchCache
+
+logger = logging.getLogger(__name__)
+
+# Point at a local mock server for testing
+TAVILY_API_URL = os.getenv("TAVILY_API_URL", tavily_search.TAVILY_API_URL)
+
+class PooledTavilySearchAPIWrapper(tavily_search.TavilySearchAPIWrapper):
+    """Tavily API wrapper that sends requests through the shared "tavily" HTTP clients.
+
+    The stock wrapper opens a new connection per search (requests, or a new aiohttp
+    session); these clients pool connections and apply the retry, rate limit and
+    circuit breaker policy from backend.clients.
+    """
+
+    def _params(self, query: str, max_results, search_depth, include_domains, exclude_domains,
+                include_answer, include_raw_content, include_images) -> Dict:
+        return {
+            "api_key": self.tavily_api_key.get_secret_value(),
+            "query": query,
+            "max_results": max_results,
+            "search_depth": search_depth,
+            "include_domains": include_domains or [],
+            "exclude_domains": exclude_domains or [],
+            "include_answer": include_answer,
+            "include_raw_content": include_raw_content,
+            "include_images": include_images,
+        }
+
+    def raw_results(self, query: str, max_results: Optional[int] = 5, search_depth: Optional[str] = "advanced",
+                    include_domains: Optional[List[str]] = None, exclude_domains: Optional[List[str]] = None,
+                    include_answer: Optional[bool] = False, include_raw_content: Optional[bool] = False,
+                    include_images: Optional[bool] = False) -> Dict:
+        params = self._params(query, max_results, search_depth, include_domains, exclude_domains,
+                              include_answer, include_raw_content, include_images)
+        response = get_http_client("tavily").post(f"{TAVILY_API_URL}/search", json=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def raw_results_async(self, query: str, max_results: Optional[int] = 5, search_depth: Optional[str] = "advanced",
+                                include_domains: Optional[List[str]] = None, exclude_domains: Optional[List[str]] = None,
+                                include_answer: Optional[bool] = False, include_raw_content: Optional[bool] = False,
+                                include_images: Optional[bool] = False) -> Dict:
+        params = self._params(query, max_results, search_depth, include_domains, exclude_domains,
+                              include_answer, include_raw_content, include_images)
+        response = await get_async_http_client("tavily").post(f"{TAVILY_API_URL}/search", json=params)
+        response.raise_for_status()
+        return response.json()
+
+class CachedTavilySearchResults(TavilySearchResults):
+    """TavilySearchResults with a persistent SearchCache in front of the API.
+
+    Failed searches are not cached, so a transient error is retried next time.
+    """
+    cache: Optional[SearchCache] = None
+
+    def _run(self, query: str, run_manager=None):
+        cached = self.cache.get(query, self.max_results) if self.cache else None
+        if cached is not None:
+            logger.info(f"Search cache hit for '{query}'")
+            return cached["content"], cached["artifact"]
+        content, artifact = super()._run(query, run_manager)
+        if self.cache and artifact:
+            self.cache.set(query, self.max_results, {"content": content, "artifact": artifact})
+        return content, artifact
+
+    async def _arun(self, query: str, run_manager=None):
+        # Cache lookups block (SQLite reads and writes, or a round trip to the shared cache), so they run off the event loop
+        cached = await asyncio.to_thread(self.cache.get, query, self.max_results) if self.cache else None
+        if cached is not None:
+            logger.info(f"Search cache hit for '{query}'")
+            return cached["content"], cached["artifact"]
+        content, artifact = await super()._arun(query, run_manager)
+        if self.cache and artifact:
+            await asyncio.to_thread(self.cache.set, query, self.max_results, {"content": content, "artifact": artifact})
+        return content, artifact
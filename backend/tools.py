@@ -1,20 +1,138 @@
 import os
-from langchain_community.tools.tavily_search import TavilySearchResults
-from dotenv import load_dotenv
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List
 
-# Load environment variables from .env file
-load_dotenv()
+from langchain_core.messages import ToolMessage
+
+from .search_cache import SearchCache, SharedSearchCache, SEARCH_CACHE_ENABLED
+from .state_backend import STATE_BACKEND, state_backend
+from .metrics import instrument_tool
+
+logger = logging.getLogger(__name__)
+
+# Max number of tool calls from one model turn that run at the same time
+TOOL_CALL_CONCURRENCY = int(os.getenv("TOOL_CALL_CONCURRENCY", "5"))
+# Seconds the tool calls from one model turn may take; calls still running then are reported as errors
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "30"))
+
+# Shared search cache (None when SEARCH_CACHE_ENABLED is false). Workers on one host already
+# share the SQLite file; with STATE_BACKEND=redis the cache lives there for every host
+if not SEARCH_CACHE_ENABLED:
+    search_cache = None
+elif STATE_BACKEND == "redis":
+    search_cache = SharedSearchCache(state_backend)
+else:
+    search_cache = SearchCache()
+
+# Name the search tool is exposed to the agents under
+TAVILY_TOOL_NAME = "tavily_search_results_json"
+
+_tavily_tool = None
+_tavily_lock = threading.Lock()
 
 def get_tavily_tool():
-    """Initializes and returns the Tavily search tool."""
-    tavily_api_key = os.getenv("TAVILY_API_KEY")
-    if not tavily_api_key:
-        raise ValueError("TAVILY_API_KEY not found in environment variables. Please add it to your .env file.")
-    
-    # You can adjust max_results if needed
-    search_tool = TavilySearchResults(max_results=5, api_key=tavily_api_key)
-    search_tool.description = "A search engine optimized for comprehensive, accurate, and trusted results. Useful for researching complex topics, facts, and finding specific information online."
-    return search_tool
-
-# Instantiate the tool for easy import
-tavily_tool = get_tavily_tool() 
\ No newline at end of file
+    """Returns the shared Tavily search tool, creating it on first use."""
+    global _tavily_tool
+    with _tavily_lock:
+        if _tavily_tool is None:
+            tavily_api_key = os.getenv("TAVILY_API_KEY")
+            if not tavily_api_key:
+                raise ValueError("TAVILY_API_KEY not found in environment variables. Please add it to your .env file.")
+            # Imported here: langchain_community is slow to import and only needed once a report runs
+            from .tavily import CachedTavilySearchResults, PooledTavilySearchAPIWrapper
+
+            # You can adjust max_results if needed
+            search_tool = CachedTavilySearchResults(
+                name=TAVILY_TOOL_NAME,
+                max_results=5,
+                api_wrapper=PooledTavilySearchAPIWrapper(tavily_api_key=tavily_api_key),
+                cache=search_cache,
+            )
+            search_tool.description = "A search engine optimized for comprehensive, accurate, and trusted results. Useful for researching complex topics, facts, and finding specific information online."
+            _tavily_tool = instrument_tool(search_tool)
+        return _tavily_tool
+
+def set_tavily_tool(tool) -> None:
+    """Replace the shared search tool, e.g. with a fake for offline runs."""
+    global _tavily_tool
+    with _tavily_lock:
+        _tavily_tool = tool
+
+def tavily_tool_ready() -> bool:
+    return _tavily_tool is not None
+
+def _tool_message(tool_call: dict, output) -> ToolMessage:
+    # The raw output is kept as the artifact for post-processing (see backend.search_results)
+    return ToolMessage(content=str(output), tool_call_id=tool_call["id"], name=tool_call.get("name"), artifact=output)
+
+def _tool_error_message(tool_call: dict, error: str) -> ToolMessage:
+    logger.warning(f"Tool call {tool_call.get('name')} ({tool_call['id']}) failed: {error}")
+    return ToolMessage(
+        content=f"Error: {error}",
+        tool_call_id=tool_call["id"],
+        name=tool_call.get("name"),
+        status="error",
+    )
+
+def execute_tool_calls(
+    tool,
+    tool_calls: List[dict],
+    max_concurrency: int = TOOL_CALL_CONCURRENCY,
+    timeout: float = TOOL_CALL_TIMEOUT,
+) -> List[ToolMessage]:
+    """Run the tool calls from one model turn concurrently on a thread pool.
+
+    Returns one ToolMessage per call in the original order. The timeout covers
+    all of the calls, counted from when they are submitted; calls that fail or
+    haven't finished by then come back as error ToolMessages instead of raising.
+    """
+    if not tool_calls:
+        return []
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(tool_calls))))
+    try:
+        futures = [executor.submit(tool.invoke, tool_call["args"]) for tool_call in tool_calls]
+        wait(futures, timeout=timeout)
+        tool_messages = []
+        for tool_call, future in zip(tool_calls, futures):
+            if not future.done():
+                tool_messages.append(_tool_error_message(tool_call, f"timed out after {timeout}s"))
+            elif future.exception() is not None:
+                tool_messages.append(_tool_error_message(tool_call, str(future.exception())))
+            else:
+                tool_messages.append(_tool_message(tool_call, future.result()))
+        return tool_messages
+    finally:
+        # Don't wait on calls that timed out; their results are discarded
+        executor.shutdown(wait=False, cancel_futures=True)
+
+async def aexecute_tool_calls(
+    tool,
+    tool_calls: List[dict],
+    max_concurrency: int = TOOL_CALL_CONCURRENCY,
+    timeout: float = TOOL_CALL_TIMEOUT,
+) -> List[ToolMessage]:
+    """Async version of execute_tool_calls, bounded by a semaphore."""
+    if not tool_calls:
+        return []
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run_tool_call(tool_call: dict):
+        async with semaphore:
+            return await tool.ainvoke(tool_call["args"])
+
+    tasks = [asyncio.ensure_future(run_tool_call(tool_call)) for tool_call in tool_calls]
+    await asyncio.wait(tasks, timeout=timeout)
+    tool_messages = []
+    # Built from the task list, so the results stay in the same order as the tool calls
+    for tool_call, task in zip(tool_calls, tasks):
+        if not task.done():
+            task.cancel()
+            tool_messages.append(_tool_error_message(tool_call, f"timed out after {timeout}s"))
+        elif task.exception() is not None:
+            tool_messages.append(_tool_error_message(tool_call, str(task.exception())))
+        else:
+            tool_messages.append(_tool_message(tool_call, task.result()))
+    return tool_messages
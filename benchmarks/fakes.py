@@ -0,0 +1,320 @@
+import math
+import time
+import random
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Type
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import BaseModel, Field
+
+# Words the fake responses are made of. The research keywords are included so
+# select_researchers behaves as it would on a real plan.
+VOCABULARY = (
+    "teknologi produktudvikling marked salg marketing bæredygtighed kvalitet eksport "
+    "analyse strategi kunde produktion materialer certificering kultur forbrugere vækst "
+    "konkurrence innovation leverandører logistik omkostninger standarder data rapport"
+).split()
+
+@dataclass(frozen=True)
+class LatencyDistribution:
+    """A latency distribution in seconds, parsed from a spec such as "uniform:0.1,0.3".
+
+    Supported specs: "0.2" or "fixed:0.2", "uniform:low,high", "normal:mean,stddev"
+    and "lognormal:median,sigma". Samples are never negative.
+    """
+    kind: str
+    params: tuple
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        kind, _, values = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+        params = tuple(float(value) for value in values.split(",") if value.strip())
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if kind not in expected or len(params) != expected[kind]:
+            raise ValueError(f"Invalid latency spec '{spec}'. Use fixed:s, uniform:low,high, normal:mean,sd or lognormal:median,sigma.")
+        return cls(kind, params)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(*self.params)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.params)
+        else:
+            median, sigma = self.params
+            value = rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        return max(0.0, value)
+
+def _rng(seed: int, *parts: Any) -> random.Random:
+    """A generator seeded from the call's input, so results don't depend on scheduling order."""
+    digest = hashlib.sha256("|".join(str(part) for part in (seed, *parts)).encode("utf-8")).digest()
+    return random.Random(int.from_bytes(digest[:8], "little"))
+
+# How the speculative writer asks for one section (see backend.agents._speculative_section_messages)
+SECTION_REQUEST = "Write only the section"
+# How the writer passes on reviewer feedback, for a full rewrite and for one section
+REVISION_REQUEST = "Reviewer Feedback"
+# Ends every answer to a revision request, so a fake reviewer can tell revised drafts from first drafts
+REVISION_MARKER = "(revideret)"
+
+def _count_tokens(messages: Sequence[BaseMessage]) -> int:
+    # Rough word-based estimate; the fake only needs plausible usage numbers
+    return sum(len(str(message.content).split()) for message in messages)
+
+# Provider prompt caches only kick in from this prompt length and cache in steps of 128 tokens
+PROMPT_CACHE_MIN_TOKENS = 1024
+# Hashes of every message prefix sent so far, shared by all fakes like a provider's cache
+_seen_prefixes = set()
+
+def _cached_prefix_tokens(messages: Sequence[BaseMessage], tools: Optional[list]) -> int:
+    """Tokens of the longest prefix of messages sent before (tools count as part of the prefix)."""
+    digest = hashlib.sha256(repr(sorted(tool["function"]["name"] for tool in tools or [])).encode("utf-8"))
+    cached = tokens = 0
+    for message in messages:
+        digest.update(f"{message.type}:{message.content}".encode("utf-8"))
+        tokens += len(str(message.content).split())
+        key = digest.copy().hexdigest()
+        if key in _seen_prefixes:
+            cached = tokens
+        else:
+            _seen_prefixes.add(key)
+    return cached // 128 * 128 if cached >= PROMPT_CACHE_MIN_TOKENS else 0
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic chat model that sleeps instead of calling an API.
+
+    Each call waits for a sample of `latency` (time to first token) plus
+    `token_latency` per output token and answers with `output_tokens` words,
+    starting with `prefix`. When tools are bound, the first `tool_rounds` turns
+    return `tool_calls` tool calls instead of an answer, or every turn calls the
+    first tool with `tool_reply` as its arguments (for structured output).
+    Requests to write a single section of a report get `section_tokens` words.
+    Answers to revision requests end with REVISION_MARKER; with `reject_reply`
+    set, tool calls on messages without it (a first draft) get those arguments.
+
+    `agent_fakes` maps agents' system prompts to fakes that answer those agents'
+    calls instead, so one model can stand in for every agent behind the router.
+
+    Like a provider-side prompt cache, the longest message prefix already seen
+    (from PROMPT_CACHE_MIN_TOKENS tokens up) is reported as cached input, and only
+    the uncached input adds `input_token_latency` per token to the first token.
+    """
+    latency: str = "fixed:0.05"
+    token_latency: float = 0.0
+    input_token_latency: float = 0.0
+    output_tokens: int = 200
+    section_tokens: Optional[int] = None
+    prefix: str = ""
+    # Answer with exactly this text instead of generated words
+    reply: Optional[str] = None
+    tool_reply: Optional[dict] = None
+    reject_reply: Optional[dict] = None
+    tool_calls: int = 2
+    tool_rounds: int = 1
+    seed: int = 0
+    calls: int = 0
+    # Reported to the metrics so costs are estimated as for this model
+    model_name: str = "gpt-4o-mini"
+    agent_fakes: Dict[str, "FakeChatModel"] = Field(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name}
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _answering(self, messages: List[BaseMessage]) -> "FakeChatModel":
+        """The fake for the calling agent (recognised by its system prompt), else this one."""
+        system = str(messages[0].content) if messages and messages[0].type == "system" else ""
+        return next((fake for prompt, fake in self.agent_fakes.items() if system.startswith(prompt)), self)
+
+    def _plan(self, messages: List[BaseMessage], tools: Optional[list]):
+        """Return (rng, first token delay, AIMessage) for this call."""
+        self.calls += 1
+        rng = _rng(self.seed, *(message.content for message in messages))
+        usage = {"input_tokens": _count_tokens(messages)}
+        cached = _cached_prefix_tokens(messages, tools)
+        if cached:
+            usage["input_token_details"] = {"cache_read": cached}
+        delay = LatencyDistribution.parse(self.latency).sample(rng) + self.input_token_latency * (usage["input_tokens"] - cached)
+
+        if tools and self.tool_reply is not None:
+            args = self.tool_reply
+            if self.reject_reply is not None and not any(REVISION_MARKER in str(message.content) for message in messages):
+                args = self.reject_reply
+            call = {"name": tools[0]["function"]["name"], "args": args, "id": f"call_{rng.getrandbits(32):08x}"}
+            usage.update(output_tokens=10, total_tokens=usage["input_tokens"] + 10)
+            return rng, delay, AIMessage(content="", tool_calls=[call], usage_metadata=usage)
+
+        rounds_done = sum(1 for message in messages if isinstance(message, AIMessage) and message.tool_calls)
+        if tools and self.tool_calls and rounds_done < self.tool_rounds:
+            tool_name = tools[0]["function"]["name"]
+            calls = [
+                {"name": tool_name, "args": {"query": " ".join(rng.choices(VOCABULARY, k=4))}, "id": f"call_{rounds_done}_{i}_{rng.getrandbits(32):08x}"}
+                for i in range(self.tool_calls)
+            ]
+            usage.update(output_tokens=10 * len(calls), total_tokens=usage["input_tokens"] + 10 * len(calls))
+            return rng, delay, AIMessage(content="", tool_calls=calls, usage_metadata=usage)
+
+        if self.reply is not None:
+            content = self.reply
+        else:
+            output_tokens = self.output_tokens
+            if self.section_tokens is not None and SECTION_REQUEST in str(messages[-1].content):
+                output_tokens = self.section_tokens
+            words = rng.choices(VOCABULARY, k=max(0, output_tokens - len(self.prefix.split())))
+            content = " ".join(filter(None, [self.prefix, " ".join(words)]))
+            if REVISION_REQUEST in str(messages[-1].content):
+                content = f"{content} {REVISION_MARKER}"
+        output_tokens = len(content.split())
+        usage.update(output_tokens=output_tokens, total_tokens=usage["input_tokens"] + output_tokens)
+        return rng, delay, AIMessage(content=content, usage_metadata=usage)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        fake = self._answering(messages)
+        _, delay, message = fake._plan(messages, kwargs.get("tools"))
+        time.sleep(delay + fake.token_latency * message.usage_metadata["output_tokens"])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        fake = self._answering(messages)
+        _, delay, message = fake._plan(messages, kwargs.get("tools"))
+        await asyncio.sleep(delay + fake.token_latency * message.usage_metadata["output_tokens"])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, message: AIMessage) -> List[AIMessageChunk]:
+        if message.tool_calls or not message.content:
+            return [AIMessageChunk(content=message.content, tool_calls=message.tool_calls, usage_metadata=message.usage_metadata)]
+        words = message.content.split(" ")
+        chunks = [AIMessageChunk(content=word if i == 0 else f" {word}") for i, word in enumerate(words)]
+        chunks[-1].usage_metadata = message.usage_metadata
+        return chunks
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        fake = self._answering(messages)
+        _, delay, message = fake._plan(messages, kwargs.get("tools"))
+        time.sleep(delay)
+        for chunk in fake._chunks(message):
+            time.sleep(fake.token_latency)
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        fake = self._answering(messages)
+        _, delay, message = fake._plan(messages, kwargs.get("tools"))
+        await asyncio.sleep(delay)
+        for chunk in fake._chunks(message):
+            await asyncio.sleep(fake.token_latency)
+            yield ChatGenerationChunk(message=chunk)
+
+class FakeSearchInput(BaseModel):
+    query: str = Field(description="search query to look up")
+
+class FakeSearchTool(BaseTool):
+    """Stand-in for the Tavily tool that returns `results` canned hits after a sampled delay."""
+    name: str = "tavily_search_results_json"
+    description: str = "A search engine optimized for comprehensive, accurate, and trusted results."
+    args_schema: Type[BaseModel] = FakeSearchInput
+    latency: str = "fixed:0.1"
+    results: int = 5
+    result_words: int = 80
+    seed: int = 0
+    calls: int = 0
+
+    def _results(self, query: str):
+        self.calls += 1
+        rng = _rng(self.seed, "search", query)
+        hits = [
+            {
+                "url": f"https://example.com/{query.replace(' ', '-')}/{i}",
+                "content": " ".join(rng.choices(VOCABULARY, k=self.result_words)),
+            }
+            for i in range(self.results)
+        ]
+        return LatencyDistribution.parse(self.latency).sample(rng), hits
+
+    def _run(self, query: str, run_manager=None):
+        delay, hits = self._results(query)
+        time.sleep(delay)
+        return hits
+
+    async def _arun(self, query: str, run_manager=None):
+        delay, hits = self._results(query)
+        await asyncio.sleep(delay)
+        return hits
+
+def install_fakes(
+    llm_latency: str = "fixed:0.05",
+    token_latency: float = 0.0,
+    input_token_latency: float = 0.0,
+    output_tokens: int = 200,
+    writer_tokens: int = 800,
+    section_tokens: int = 200,
+    tool_calls: int = 2,
+    tool_rounds: int = 1,
+    search_latency: str = "fixed:0.1",
+    search_results: int = 5,
+    reject_first_draft: bool = False,
+    seed: int = 0,
+) -> dict:
+    """Swap the backend's chat model factory and search tool for fakes (see backend.agents.use_clients).
+
+    The agents are still built by create_agent_runnable and routed between their
+    model tiers, so prompts, tool binding, routing, metrics and the response cache
+    run exactly as they do against the real model. With reject_first_draft the
+    reviewer sends every first draft back for a revision.
+    Returns the fakes by agent name, plus the search tool under "search".
+    """
+    from backend import agents
+    from backend.metrics import instrument_tool
+
+    search = instrument_tool(FakeSearchTool(latency=search_latency, results=search_results, seed=seed))
+    llm = FakeChatModel(
+        latency=llm_latency, token_latency=token_latency, input_token_latency=input_token_latency, output_tokens=output_tokens,
+        tool_calls=tool_calls, tool_rounds=tool_rounds, seed=seed,
+    )
+
+    fakes = {"search": search}
+    for name in agents.AGENT_SPECS:
+        settings = {}
+        if name == "planner":
+            # Name every research area so the planner fans out to all researchers
+            settings["prefix"] = "Plan: teknologi, marked og bæredygtighed."
+            # Three tasks, the last building on the first two, so dispatch runs two waves
+            settings["tool_reply"] = {
+                "plan": settings["prefix"],
+                "tasks": [
+                    {"id": "T1", "agent": "tech_researcher", "question": "teknologi og produktudvikling", "depends_on": []},
+                    {"id": "T2", "agent": "market_sales_researcher", "question": "marked og salg", "depends_on": []},
+                    {"id": "T3", "agent": "sustainability_quality_researcher", "question": "bæredygtighed og kvalitet", "depends_on": ["T1", "T2"]},
+                ],
+            }
+        elif name == "writer":
+            settings["output_tokens"] = writer_tokens
+            settings["section_tokens"] = section_tokens
+        elif name == "reviewer":
+            settings["tool_reply"] = {"approved": True, "severity": "none", "issues": []}
+            if reject_first_draft:
+                settings["reject_reply"] = {"approved": False, "severity": "major", "issues": [{"section": "S1", "issue": "Uddyb analysen med flere konkrete eksempler."}]}
+        fakes[name] = llm.model_copy(update=settings)
+
+    # Every model the router asks for is the same fake under that model's name,
+    # answering each agent's calls with that agent's fake
+    agent_fakes = {agents.AGENT_SPECS[name][0]: fakes[name] for name in agents.AGENT_SPECS}
+
+    def create_fake_model(model: str) -> FakeChatModel:
+        return llm.model_copy(update={"model_name": model, "agent_fakes": agent_fakes})
+
+    agents.use_clients(search_tool=search, model_factory=create_fake_model)
+    return fakes
@@ -0,0 +1,251 @@
+"""In-process stand-in for a Redis server, for trying STATE_BACKEND=redis without one.
+
+Speaks enough of the Redis protocol (RESP2) for backend.state_backend: strings,
+hashes, lists, expiry, SCAN and MULTI/EXEC. Data lives in memory until the
+process exits.
+
+    python -m benchmarks.redis_standin --port 6390
+    STATE_BACKEND=redis REDIS_URL=redis://127.0.0.1:6390/0 uvicorn backend.main:fastapi_app --workers 4
+"""
+import time
+import asyncio
+import threading
+import fnmatch
+import logging
+import argparse
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class CommandError(Exception):
+    """Sent back to the client as a RESP error reply."""
+
+class RedisStandIn:
+    """A single-process, in-memory store answering Redis commands over TCP."""
+
+    def __init__(self):
+        # key -> bytes, dict (hash) or list
+        self.data: Dict[bytes, object] = {}
+        self.expires: Dict[bytes, float] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 6390) -> int:
+        """Start listening and return the bound port (pass port 0 for a free one)."""
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    def start_in_thread(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Serve from a daemon thread with its own event loop; returns the bound port.
+
+        Keeps the stand-in responsive when the caller's own loop makes blocking calls to it.
+        """
+        started = threading.Event()
+        bound = []
+
+        def serve() -> None:
+            loop = asyncio.new_event_loop()
+            bound.append(loop.run_until_complete(self.start(host, port)))
+            started.set()
+            loop.run_forever()
+
+        threading.Thread(target=serve, name="redis-standin", daemon=True).start()
+        started.wait()
+        return bound[0]
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    # --- Protocol --- #
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command, e.g. from telnet
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:])):
+            size = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    def _encode(self, value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, CommandError):
+            return b"-ERR " + str(value).encode("utf-8") + b"\r\n"
+        if value is True:
+            return b"+OK\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, bytes):
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(self._encode(item) for item in value)
+        raise TypeError(f"Can't encode {type(value).__name__}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        queued: Optional[List[List[bytes]]] = None
+        try:
+            while (args := await self._read_command(reader)) is not None:
+                if not args:
+                    continue
+                name = args[0].upper()
+                if name == b"MULTI":
+                    queued, reply = [], True
+                elif name == b"EXEC":
+                    commands, queued = queued or [], None
+                    reply = [self._run(command) for command in commands]
+                elif name == b"DISCARD":
+                    queued, reply = None, True
+                elif queued is not None:
+                    queued.append(args)
+                    writer.write(b"+QUEUED\r\n")
+                    continue
+                else:
+                    reply = self._run(args)
+                writer.write(self._encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _run(self, args: List[bytes]):
+        handler = getattr(self, f"cmd_{args[0].decode('utf-8').lower()}", None)
+        if handler is None:
+            return CommandError(f"unknown command '{args[0].decode('utf-8')}'")
+        try:
+            return handler(*args[1:])
+        except (TypeError, ValueError) as e:
+            return CommandError(str(e))
+
+    # --- Keyspace --- #
+
+    def _live(self, key: bytes):
+        if key in self.expires and self.expires[key] <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def _typed(self, key: bytes, kind: type, create: bool = False):
+        value = self._live(key)
+        if value is None and create:
+            value = self.data[key] = kind()
+        if value is not None and not isinstance(value, kind):
+            raise ValueError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    # --- Commands --- #
+
+    def cmd_ping(self, *args):
+        return args[0] if args else True
+
+    def cmd_client(self, *args):
+        return True
+
+    def cmd_select(self, db):
+        return True
+
+    def cmd_flushdb(self, *args):
+        self.data.clear()
+        self.expires.clear()
+        return True
+
+    def cmd_get(self, key):
+        return self._typed(key, bytes)
+
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        if b"NX" in options and self._live(key) is not None:
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        for unit, scale in ((b"EX", 1.0), (b"PX", 0.001)):
+            if unit in options:
+                self.expires[key] = time.time() + float(options[options.index(unit) + 1]) * scale
+        return True
+
+    def cmd_del(self, *keys):
+        removed = sum(1 for key in keys if self._live(key) is not None)
+        for key in keys:
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._live(key) is not None)
+
+    def cmd_pexpire(self, key, milliseconds):
+        if self._live(key) is None:
+            return 0
+        self.expires[key] = time.time() + int(milliseconds) / 1000
+        return 1
+
+    def cmd_expire(self, key, seconds):
+        return self.cmd_pexpire(key, int(seconds) * 1000)
+
+    def cmd_hset(self, key, *pairs):
+        values = self._typed(key, dict, create=True)
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in values
+            values[field] = value
+        return added
+
+    def cmd_hgetall(self, key):
+        values = self._typed(key, dict) or {}
+        return [item for pair in values.items() for item in pair]
+
+    def cmd_hdel(self, key, *fields):
+        values = self._typed(key, dict) or {}
+        removed = sum(1 for field in fields if values.pop(field, None) is not None)
+        if not values:
+            self.data.pop(key, None)
+        return removed
+
+    def cmd_rpush(self, key, *values):
+        items = self._typed(key, list, create=True)
+        items.extend(values)
+        return len(items)
+
+    def cmd_lrange(self, key, start, end):
+        items = self._typed(key, list) or []
+        start, end = int(start), int(end)
+        start = max(0, start + len(items)) if start < 0 else start
+        end = end + len(items) if end < 0 else end
+        return items[start:end + 1]
+
+    def cmd_lset(self, key, index, value):
+        items = self._typed(key, list)
+        if items is None:
+            raise ValueError("no such key")
+        index = int(index)
+        if not -len(items) <= index < len(items):
+            raise ValueError("index out of range")
+        items[index] = value
+        return True
+
+    def cmd_scan(self, cursor, *options):
+        names = [option.upper() for option in options]
+        pattern = options[names.index(b"MATCH") + 1] if b"MATCH" in names else b"*"
+        # One pass over the whole keyspace, so the cursor always comes back as 0
+        keys = [key for key in list(self.data) if self._live(key) is not None and fnmatch.fnmatchcase(key.decode("utf-8"), pattern.decode("utf-8"))]
+        return [b"0", keys]
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    standin = RedisStandIn()
+    port = await standin.start(args.host, args.port)
+    logger.info(f"Redis stand-in listening on {args.host}:{port}")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    asyncio.run(main())
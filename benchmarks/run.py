@@ -0,0 +1,399 @@
+"""Offline benchmark for the report pipeline.
+
+Runs concurrent reports against deterministic fake LLM and search stand-ins
+(see benchmarks/fakes.py), so no OpenAI or Tavily keys are needed, and writes
+the results as JSON for comparing commits:
+
+    python -m benchmarks.run --reports 20 --concurrency 10
+    python -m benchmarks.run --target api --llm-latency lognormal:0.2,0.5 --baseline old.json
+    python -m benchmarks.run --target graph --research-mode speculative
+    python -m benchmarks.run --target api --state-backend redis
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from typing import Dict, List, Optional
+
+# Search results and checkpoints stay in memory so runs don't depend on earlier ones
+os.environ.setdefault("SEARCH_CACHE_ENABLED", "false")
+os.environ.setdefault("CHECKPOINTER", "memory")
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+from contextvars import ContextVar
+
+from .fakes import install_fakes
+
+logger = logging.getLogger(__name__)
+
+# Lines of /proc/self/statm are in pages
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def current_rss_mb() -> float:
+    """Resident set size of this process, falling back to the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE / 2**20
+    except (OSError, IndexError, ValueError):
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 1024
+
+class RSSSampler:
+    """Samples RSS in the background and keeps the peak seen since start()."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _sample(self):
+        while True:
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.peak_mb = current_rss_mb()
+        self._task = asyncio.create_task(self._sample())
+
+    async def stop(self) -> float:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self.peak_mb = max(self.peak_mb, current_rss_mb())
+        return self.peak_mb
+
+class NodeTimer(BaseCallbackHandler):
+    """Callback handler that records the wall time of every graph node run."""
+    run_inline = True
+
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = {}
+        self._started: Dict[uuid.UUID, tuple] = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, name=None, **kwargs):
+        # Node runs are the chains named after the node they run in
+        node = (metadata or {}).get("langgraph_node")
+        if node and node == name:
+            self._started[run_id] = (node, time.perf_counter())
+
+    def _finish(self, run_id):
+        started = self._started.pop(run_id, None)
+        if started:
+            node, start = started
+            self.durations.setdefault(node, []).append(time.perf_counter() - start)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def reset(self):
+        self.durations = {}
+        self._started = {}
+
+node_timer = NodeTimer()
+# Attach the timer to every run in this process, including runs started by the API's job workers
+_node_timer_var: ContextVar[Optional[NodeTimer]] = ContextVar("benchmark_node_timer", default=node_timer)
+register_configure_hook(_node_timer_var, inheritable=True)
+
+# --- Statistics --- #
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Linear-interpolated percentile (p in 0-100), or None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+# --- Targets --- #
+async def run_graph_report(prompt: str) -> dict:
+    """Run one report through the compiled graph via the same event stream the API serves."""
+    from backend.main import run_graph_events
+
+    start = time.perf_counter()
+    timings = {"first_event": None, "first_update": None, "first_token": None}
+    status = "error"
+    async for event in run_graph_events(prompt, str(uuid.uuid4()), stream_tokens=True):
+        _record_event(timings, event, time.perf_counter() - start)
+        if event["type"] in ("final", "error"):
+            status = event["type"]
+    return {"status": status, "latency": time.perf_counter() - start, **timings}
+
+async def run_api_report(client, prompt: str) -> dict:
+    """POST one report to /generate-report and read the SSE stream to the end."""
+    start = time.perf_counter()
+    timings = {"first_event": None, "first_update": None, "first_token": None}
+    status = "error"
+    async with client.stream("POST", "/generate-report", json={"prompt": prompt, "stream_tokens": True}) as response:
+        if response.status_code != 200:
+            return {"status": f"http_{response.status_code}", "latency": time.perf_counter() - start, **timings}
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: "):])
+            _record_event(timings, event, time.perf_counter() - start)
+            if event["type"] in ("final", "error"):
+                status = event["type"]
+    return {"status": status, "latency": time.perf_counter() - start, **timings}
+
+def _record_event(timings: dict, event: dict, elapsed: float):
+    if timings["first_event"] is None:
+        timings["first_event"] = elapsed
+    if event.get("type") == "update" and timings["first_update"] is None:
+        timings["first_update"] = elapsed
+    if event.get("type") == "token" and timings["first_token"] is None:
+        timings["first_token"] = elapsed
+    if event.get("type") == "final":
+        run_metrics = event.get("metrics") or {}
+        totals = run_metrics.get("totals") or {}
+        timings["prompt_tokens"] = totals.get("prompt_tokens", 0)
+        timings["cached_prompt_tokens"] = totals.get("cached_prompt_tokens", 0)
+        timings["cost_usd"] = totals.get("cost_usd", 0.0)
+        # Speculative runs report how much of the writing overlapped research
+        if run_metrics.get("speculation"):
+            timings["speculative_overlap"] = run_metrics["speculation"]["overlap_seconds"]
+
+async def run_load(run_one, reports: int, concurrency: int) -> dict:
+    """Run `reports` reports with at most `concurrency` in flight and summarize them."""
+    semaphore = asyncio.Semaphore(concurrency)
+    prompts = [f"Benchmark rapport {i}: eksport af bæredygtig teknologi" for i in range(reports)]
+
+    async def bounded(prompt: str) -> dict:
+        async with semaphore:
+            try:
+                return await run_one(prompt)
+            except Exception as e:
+                logger.exception("Benchmark report failed")
+                return {"status": "exception", "error": str(e), "latency": None, "first_event": None, "first_update": None, "first_token": None}
+
+    node_timer.reset()
+    sampler = RSSSampler()
+    sampler.start()
+    start = time.perf_counter()
+    results = await asyncio.gather(*(bounded(prompt) for prompt in prompts))
+    wall = time.perf_counter() - start
+    peak_rss = await sampler.stop()
+
+    succeeded = [r for r in results if r["status"] == "final"]
+    return {
+        "reports": reports,
+        "concurrency": concurrency,
+        "succeeded": len(succeeded),
+        "failed": reports - len(succeeded),
+        "wall_seconds": wall,
+        "throughput_reports_per_second": len(succeeded) / wall if wall else None,
+        "latency_seconds": summarize([r["latency"] for r in succeeded]),
+        "time_to_first_event_seconds": summarize([r["first_event"] for r in succeeded if r["first_event"] is not None]),
+        "time_to_first_update_seconds": summarize([r["first_update"] for r in succeeded if r["first_update"] is not None]),
+        "time_to_first_token_seconds": summarize([r["first_token"] for r in succeeded if r["first_token"] is not None]),
+        "prompt_tokens": sum(r.get("prompt_tokens", 0) for r in succeeded),
+        "cached_prompt_tokens": sum(r.get("cached_prompt_tokens", 0) for r in succeeded),
+        "cost_usd": sum(r.get("cost_usd", 0.0) for r in succeeded),
+        "speculative_overlap_seconds": summarize([r["speculative_overlap"] for r in succeeded if "speculative_overlap" in r]),
+        "node_latency_seconds": {node: summarize(values) for node, values in sorted(node_timer.durations.items())},
+        "peak_rss_mb": peak_rss,
+    }
+
+async def benchmark_graph(reports: int, concurrency: int) -> dict:
+    from backend.graph import app
+    from backend.checkpoints import open_checkpointer, close_checkpointer
+
+    # Same checkpointer setup as the API lifespan, so both targets do the same work
+    app.checkpointer = await open_checkpointer()
+    try:
+        return await run_load(run_graph_report, reports, concurrency)
+    finally:
+        await close_checkpointer(app.checkpointer)
+
+async def benchmark_api(reports: int, concurrency: int) -> dict:
+    """Serve the FastAPI app with uvicorn on a free local port and stream reports over HTTP."""
+    import httpx
+    import uvicorn
+    from backend.main import fastapi_app, job_manager
+
+    server = uvicorn.Server(uvicorn.Config(fastapi_app, host="127.0.0.1", port=0, log_level="warning", lifespan="on"))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        if serve_task.done():
+            serve_task.result()
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        timeout = httpx.Timeout(None, connect=10.0)
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=timeout, limits=limits) as client:
+            result = await run_load(lambda prompt: run_api_report(client, prompt), reports, concurrency)
+        result["job_workers"] = job_manager.max_workers
+        result["job_queue"] = job_manager.metrics()
+        return result
+    finally:
+        server.should_exit = True
+        await serve_task
+
+# --- Results --- #
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Metrics compared against a baseline: (path in the target's results, higher is better)
+COMPARED_METRICS = [
+    (("latency_seconds", "p50"), False),
+    (("latency_seconds", "p95"), False),
+    (("latency_seconds", "p99"), False),
+    (("time_to_first_event_seconds", "p50"), False),
+    (("throughput_reports_per_second",), True),
+    (("peak_rss_mb",), False),
+]
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Print each compared metric against the baseline; return the regressions beyond tolerance."""
+    regressions = []
+    for target, current in results["targets"].items():
+        previous = baseline.get("targets", {}).get(target)
+        if not previous:
+            continue
+        for path, higher_is_better in COMPARED_METRICS:
+            now, before = current, previous
+            for key in path:
+                now, before = (now or {}).get(key), (before or {}).get(key)
+            if not now or not before:
+                continue
+            change = (now - before) / before
+            name = f"{target}.{'.'.join(path)}"
+            print(f"{name:55} {before:10.4f} -> {now:10.4f} ({change:+.1%})")
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(name)
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the report pipeline offline with fake LLM and search.")
+    parser.add_argument("--target", choices=["graph", "api", "both"], default="both")
+    parser.add_argument("--reports", type=int, default=10, help="reports to run per target")
+    parser.add_argument("--concurrency", type=int, default=None, help="reports in flight at once (default: all)")
+    parser.add_argument("--llm-latency", default="lognormal:0.05,0.3", help="time to first token, e.g. fixed:0.1 or uniform:0.05,0.2")
+    parser.add_argument("--token-latency", type=float, default=0.0005, help="seconds per output token")
+    parser.add_argument("--input-token-latency", type=float, default=0.0, help="seconds per uncached input token before the first token")
+    parser.add_argument("--output-tokens", type=int, default=200, help="tokens per planner, researcher and reviewer answer")
+    parser.add_argument("--writer-tokens", type=int, default=800, help="tokens per writer draft")
+    parser.add_argument("--section-tokens", type=int, default=200, help="tokens per section when the speculative writer drafts one section at a time")
+    parser.add_argument("--tool-calls", type=int, default=2, help="searches per researcher turn")
+    parser.add_argument("--tool-rounds", type=int, default=1, help="search turns per researcher before it answers")
+    parser.add_argument("--search-latency", default="uniform:0.05,0.15")
+    parser.add_argument("--search-results", type=int, default=5)
+    parser.add_argument("--reject-first-draft", action="store_true", help="have the fake reviewer send every first draft back, so revisions are measured")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--research-mode", choices=["sequential", "parallel", "speculative"], default=None, help="RESEARCH_MODE to build the graph with (default: the environment's)")
+    parser.add_argument("--state-backend", choices=["memory", "sqlite", "redis"], default=None, help="STATE_BACKEND to run with, checkpoints included; redis without REDIS_URL uses benchmarks.redis_standin")
+    parser.add_argument("--output", default=None, help="results file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--baseline", default=None, help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="relative change counted as a regression")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+async def main(argv=None) -> int:
+    args = parse_args(argv)
+    concurrency = args.concurrency or args.reports
+    if args.research_mode:
+        # The graph is built on import, so this has to be set before backend.main is imported
+        os.environ["RESEARCH_MODE"] = args.research_mode
+    research_mode = os.getenv("RESEARCH_MODE", "parallel")
+    if args.state_backend:
+        # Also read on import; a fresh store per run so runs don't depend on earlier ones
+        os.environ["STATE_BACKEND"] = args.state_backend
+        os.environ["CHECKPOINTER"] = "memory" if args.state_backend == "memory" else "shared"
+        os.environ["STATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="benchmark-state-"), "state.sqlite3")
+        if args.state_backend == "redis" and "REDIS_URL" not in os.environ:
+            from .redis_standin import RedisStandIn
+
+            os.environ["REDIS_URL"] = f"redis://127.0.0.1:{RedisStandIn().start_in_thread()}/0"
+    state_backend = os.getenv("STATE_BACKEND", "memory")
+    fake_settings = {
+        "llm_latency": args.llm_latency,
+        "token_latency": args.token_latency,
+        "input_token_latency": args.input_token_latency,
+        "output_tokens": args.output_tokens,
+        "writer_tokens": args.writer_tokens,
+        "section_tokens": args.section_tokens,
+        "tool_calls": args.tool_calls,
+        "tool_rounds": args.tool_rounds,
+        "search_latency": args.search_latency,
+        "search_results": args.search_results,
+        "reject_first_draft": args.reject_first_draft,
+        "seed": args.seed,
+    }
+    fakes = install_fakes(**fake_settings)
+    # backend.main configures INFO logging on import; keep the benchmark output readable
+    import backend.main  # noqa: F401
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"reports": args.reports, "concurrency": concurrency, "research_mode": research_mode, "state_backend": state_backend, **fake_settings},
+        "targets": {},
+    }
+    targets = ["graph", "api"] if args.target == "both" else [args.target]
+    for target in targets:
+        print(f"Running {args.reports} reports through {target} (concurrency {concurrency}, {research_mode} research, {state_backend} state)...")
+        runner = benchmark_graph if target == "graph" else benchmark_api
+        results["targets"][target] = await runner(args.reports, concurrency)
+        summary = results["targets"][target]
+        print(
+            f"  {summary['succeeded']}/{summary['reports']} ok, "
+            f"p50 {summary['latency_seconds']['p50'] or 0:.3f}s, p95 {summary['latency_seconds']['p95'] or 0:.3f}s, "
+            f"{summary['throughput_reports_per_second'] or 0:.2f} reports/s, peak RSS {summary['peak_rss_mb']:.0f} MB"
+        )
+        if summary["prompt_tokens"]:
+            print(f"  {summary['cached_prompt_tokens']}/{summary['prompt_tokens']} prompt tokens cached, ${summary['cost_usd']:.4f} estimated cost")
+        if summary["speculative_overlap_seconds"]["count"]:
+            print(f"  writing overlapped research by {summary['speculative_overlap_seconds']['p50']:.3f}s (p50)")
+    results["fake_calls"] = {name: fake.calls for name, fake in fakes.items()}
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results", f"{time.strftime('%Y%m%d-%H%M%S')}-{results['commit'] or 'nogit'}.json"
+    )
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,60 @@
+"""How researcher prompt size scales with the number of search results.
+
+Runs one researcher turn of --calls searches over fake results and compares the
+tokens the tool messages add to the prompt as raw reprs (the old behaviour)
+and after backend.search_results dedupes, trims, ranks and budgets them:
+
+    python -m benchmarks.search_budget --results 1 5 10 20 --budget 3000
+"""
+import sys
+import argparse
+
+from langchain_core.messages import ToolMessage
+
+from backend.search_results import SearchResultProcessor, count_tokens
+from .fakes import FakeSearchTool
+
+def prompt_tokens(messages) -> int:
+    return sum(count_tokens(str(message.content)) for message in messages)
+
+def measure(results: int, calls: int, overlap: float, budget: int, max_result_tokens: int, result_words: int) -> dict:
+    """Tool-message tokens for one turn of `calls` searches with `results` hits each.
+
+    A share `overlap` of each later call's hits repeats the first call's, as
+    similar queries from one researcher do.
+    """
+    tool = FakeSearchTool(results=results, result_words=result_words)
+    first = tool._results("teknologi marked")[1]
+    tool_calls, raw = [], []
+    for i in range(calls):
+        hits = tool._results(f"teknologi marked {i}")[1] if i else first
+        repeated = int(results * overlap) if i else 0
+        hits = first[:repeated] + hits[repeated:]
+        tool_call = {"name": tool.name, "args": {"query": f"teknologi marked {i}"}, "id": f"call_{i}"}
+        tool_calls.append(tool_call)
+        raw.append(ToolMessage(content=str(hits), tool_call_id=tool_call["id"], name=tool.name, artifact=hits))
+    processed = SearchResultProcessor("teknologi og marked", token_budget=budget, max_result_tokens=max_result_tokens).process(tool_calls, raw)
+    return {"results": results, "raw_tokens": prompt_tokens(raw), "processed_tokens": prompt_tokens(processed)}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Show how researcher prompt size scales with search result count.")
+    parser.add_argument("--results", type=int, nargs="+", default=[1, 2, 5, 10, 20], help="results per search call")
+    parser.add_argument("--calls", type=int, default=2, help="search calls in the turn")
+    parser.add_argument("--overlap", type=float, default=0.4, help="share of each later call's results that repeat the first call's")
+    parser.add_argument("--budget", type=int, default=3000, help="token budget per turn (0 disables it)")
+    parser.add_argument("--max-result-tokens", type=int, default=400, help="tokens each result is trimmed to")
+    parser.add_argument("--result-words", type=int, default=300, help="words of content per fake result")
+    args = parser.parse_args(argv)
+
+    print(f"{'results':>8} {'raw tokens':>11} {'processed':>10}")
+    for results in args.results:
+        row = measure(results, args.calls, args.overlap, args.budget, args.max_result_tokens, args.result_words)
+        print(f"{row['results']:>8} {row['raw_tokens']:>11} {row['processed_tokens']:>10}")
+        if args.budget and row["processed_tokens"] > args.budget + 100 * args.calls:
+            # The budget covers the results; allow for the per-message JSON framing
+            print(f"Processed results exceed the budget of {args.budget} tokens", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
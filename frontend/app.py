@@ -1,10 +1,79 @@
+import os
+import time
+import asyncio
+from typing import Dict, Optional
+
 import streamlit as st
-import requests
-import json
-import httpx # Use httpx for streaming support in Streamlit
+
+from stream_client import BACKEND_BASE_URL, ReportStream, StreamError
 
 # --- Configuration --- #
-BACKEND_URL = "http://localhost:8000/generate-report" # Updated URL
+BACKEND_URL = f"{BACKEND_BASE_URL}/generate-report"
+# Max redraws per second of the streaming draft; tokens arriving in between are batched
+FRONTEND_RENDER_FPS = float(os.getenv("FRONTEND_RENDER_FPS", "10"))
+
+# --- Incremental Rendering --- #
+class DraftView:
+    """Streams the writer's draft into the page, redrawing at most FRONTEND_RENDER_FPS times a second.
+
+    Each section has its own placeholder, so a redraw only touches the sections
+    that received tokens since the last one.
+    """
+
+    def __init__(self, area, fps: float = FRONTEND_RENDER_FPS):
+        self.area = area
+        self.interval = 1 / fps if fps > 0 else 0.0
+        self.revision = None
+        self.texts: Dict[Optional[str], str] = {}
+        self.placeholders = {}
+        self.dirty = set()
+        self.container = None
+        self.last_render = 0.0
+
+    def add_token(self, revision, section: Optional[str], token: str) -> None:
+        if revision != self.revision or self.container is None or (section is None and any(self.placeholders)):
+            # A new revision starts over, as does a full rewrite after section revisions that didn't fit
+            self.flush()
+            self.revision = revision
+            self.texts, self.placeholders, self.dirty = {}, {}, set()
+            self.container = self.area.container()
+            self.container.markdown(f"## Draft (revision {revision})")
+        if section not in self.placeholders:
+            # Section revisions stream concurrently; each section keeps its place in the page
+            self.placeholders[section] = self.container.empty()
+            self.texts[section] = ""
+        self.texts[section] += token
+        self.dirty.add(section)
+        if time.monotonic() - self.last_render >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        for section in self.dirty:
+            self.placeholders[section].markdown(self.texts[section])
+        self.dirty = set()
+        self.last_render = time.monotonic()
+
+async def follow_report(prompt: str, status_area, draft_view: DraftView, connection_placeholder, fresh_run: bool = False) -> dict:
+    """Render the report's events as they arrive and return its final or error event."""
+    stream = ReportStream()
+    async for data in stream.events(prompt, stream_tokens=True, coalesce=not fresh_run):
+        if data.get("type") == "start" and stream.coalesced:
+            status_area.markdown("*Someone asked for the same report; following that run.*")
+        if data.get("type") == "update":
+            step = data.get("step", "?")
+            node = data.get("node", "Unknown")
+            summary = data.get("data", {}).get("summary", "Processing...")
+            # Only the new update is rendered; earlier ones stay as they are
+            status_area.markdown(f"**Step {step} ({node}):** {summary}")
+            connection_placeholder.empty()
+        elif data.get("type") == "token":
+            draft_view.add_token(data.get("revision"), data.get("section"), data.get("token", ""))
+        elif data.get("type") == "reconnecting":
+            connection_placeholder.warning(f"Connection lost ({data['reason']}); reconnecting (attempt {data['attempt']})...")
+        elif data.get("type") in ("final", "error"):
+            draft_view.flush()
+            return data
+    return {"type": "error", "message": "The stream ended without a final report."}
 
 # --- Streamlit UI --- #
 st.set_page_config(page_title="Multi-Agent Research Report Generator", layout="wide")
@@ -12,6 +81,7 @@ st.title("🕵️‍♂️ Multi-Agent Research Report Generator")
 
 # Input prompt
 prompt = st.text_area("Enter your research topic:", height=100)
+fresh_run = st.checkbox("Fresh run", help="By default an identical report that is already being generated (or just was) is shared. Tick this to generate a new one.")
 
 # Generate button
 if st.button("Generate Report"):
@@ -21,70 +91,32 @@ if st.button("Generate Report"):
         st.info("Generating report... Please wait.")
         
         # Placeholders for updates and final report
-        status_placeholder = st.empty()
+        result_placeholder = st.empty()
+        connection_placeholder = st.empty()
+        status_area = st.container()
         report_placeholder = st.empty()
-        
-        status_updates = []
-        final_report_content = None
-        error_content = None
+        draft_view = DraftView(report_placeholder)
 
         try:
-            # Use httpx.stream for Server-Sent Events
-            with httpx.stream("POST", BACKEND_URL, json={"prompt": prompt}, timeout=None) as response:
-                if response.status_code == 200:
-                    # Process the event stream
-                    for line in response.iter_lines():
-                        if line.startswith("data:"):
-                            try:
-                                data = json.loads(line[len("data:"):])
-                                
-                                if data.get("type") == "update":
-                                    step = data.get("step", "?")
-                                    node = data.get("node", "Unknown")
-                                    summary = data.get("data", {}).get("summary", "Processing...")
-                                    update_text = f"**Step {step} ({node}):** {summary}"
-                                    status_updates.append(update_text)
-                                    # Display latest status updates
-                                    status_placeholder.markdown("\n".join(status_updates))
-                                    
-                                    # Optionally display draft snippet
-                                    # snippet = data.get("data", {}).get("draft_report_snippet")
-                                    # if snippet:
-                                    #     report_placeholder.info(f"Current Draft Snippet:\n```markdown\n{snippet}\n```")
-                                        
-                                elif data.get("type") == "final":
-                                    final_report_content = data.get("report")
-                                    break # Exit loop once final report is received
-                                    
-                                elif data.get("type") == "error":
-                                    error_content = data.get("message", "An unknown error occurred.")
-                                    break # Exit loop on error
-                                    
-                            except json.JSONDecodeError:
-                                st.warning(f"Received non-JSON data: {line}")
-                            except Exception as e:
-                                st.error(f"Error processing stream data: {e}")
-                                error_content = f"Frontend error processing stream: {e}"
-                                break
-                else:
-                     error_content = f"Backend error: {response.status_code} - {response.text}"
-
-        except httpx.RequestError as e:
-            error_content = f"Failed to connect to the backend API: {e}"
+            result = asyncio.run(follow_report(prompt, status_area, draft_view, connection_placeholder, fresh_run))
+        except StreamError as e:
+            result = {"type": "error", "message": str(e)}
         except Exception as e:
-            error_content = f"An unexpected error occurred: {e}"
+            result = {"type": "error", "message": f"An unexpected error occurred: {e}"}
+        connection_placeholder.empty()
 
         # --- Display Final Results --- #
-        if final_report_content:
-            status_placeholder.success("Report generation complete!")
-            report_placeholder.markdown("## Generated Report")
-            report_placeholder.markdown(final_report_content)
-        elif error_content:
-            status_placeholder.error(f"Error generating report: {error_content}")
+        if result.get("type") == "final" and result.get("report"):
+            result_placeholder.success("Report generation complete!")
+            with report_placeholder.container():
+                st.markdown("## Generated Report")
+                st.markdown(result["report"])
+        elif result.get("type") == "error":
+            result_placeholder.error(f"Error generating report: {result.get('message', 'An unknown error occurred.')}")
             report_placeholder.empty() # Clear any previous snippets
         else:
             # This case might happen if the stream ends without a final or error event
-            status_placeholder.warning("Report generation finished, but no final report or error was received.")
+            result_placeholder.warning("Report generation finished, but no final report or error was received.")
 
 # --- Instructions/Notes --- #
 st.sidebar.title("How to Use")
@@ -0,0 +1,134 @@
+import os
+import json
+import asyncio
+from typing import AsyncIterator, Optional, Tuple
+
+import httpx
+
+# --- Configuration --- #
+BACKEND_BASE_URL = os.getenv("BACKEND_BASE_URL", "http://localhost:8000")
+STREAM_CONNECT_TIMEOUT = float(os.getenv("STREAM_CONNECT_TIMEOUT", "10"))
+# The backend sends a heartbeat every SSE_HEARTBEAT_SECONDS, so a longer silence means a dead connection
+STREAM_READ_TIMEOUT = float(os.getenv("STREAM_READ_TIMEOUT", "60"))
+# Reconnect attempts in a row before giving up on a run
+STREAM_MAX_RECONNECTS = int(os.getenv("STREAM_MAX_RECONNECTS", "5"))
+STREAM_RECONNECT_BACKOFF_SECONDS = float(os.getenv("STREAM_RECONNECT_BACKOFF_SECONDS", "1"))
+
+class StreamError(Exception):
+    """Raised when the backend rejects a stream or it can't be resumed."""
+
+class SSEParser:
+    """Incremental Server-Sent Events parser: feed it lines, get (event_id, data) back."""
+
+    def __init__(self):
+        self.event_id: Optional[str] = None
+        self._data = []
+
+    def feed(self, line: str) -> Optional[Tuple[Optional[str], str]]:
+        """Take one line of the stream; returns the event it completes, if any."""
+        if not line:
+            if not self._data:
+                return None
+            data, self._data = "\n".join(self._data), []
+            return self.event_id, data
+        if line.startswith(":"):
+            # Comment, e.g. the backend's heartbeat
+            return None
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "data":
+            self._data.append(value)
+        elif field == "id":
+            self.event_id = value
+        return None
+
+class ReportStream:
+    """Follows one report's event stream and reconnects when the connection drops.
+
+    The report is submitted with POST /generate-report. After a dropped connection
+    or a read timeout, the stream is picked up again from GET /jobs/{job_id}/events
+    with the last received event id, so no event is lost or repeated. If the
+    backend no longer knows the job (e.g. it restarted), the run is continued
+    from its last checkpoint via GET /reports/{thread_id}/resume, which queues it
+    as a new job that is followed the same way.
+    """
+
+    def __init__(
+        self,
+        base_url: str = BACKEND_BASE_URL,
+        connect_timeout: float = STREAM_CONNECT_TIMEOUT,
+        read_timeout: float = STREAM_READ_TIMEOUT,
+        max_reconnects: int = STREAM_MAX_RECONNECTS,
+        backoff_seconds: float = STREAM_RECONNECT_BACKOFF_SECONDS,
+    ):
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_reconnects = max_reconnects
+        self.backoff_seconds = backoff_seconds
+        self.job_id: Optional[str] = None
+        self.last_event_id: Optional[str] = None
+        # Set while the job is gone and the run is being continued from its checkpoint instead
+        self.resumed_from_checkpoint = False
+        # Set when the backend joined this request to an identical report instead of starting one
+        self.coalesced = False
+
+    def _request(self, client: httpx.AsyncClient, prompt: str, stream_tokens: bool, coalesce: bool):
+        if self.job_id is None:
+            return client.stream("POST", "/generate-report", json={"prompt": prompt, "stream_tokens": stream_tokens, "coalesce": coalesce})
+        if self.resumed_from_checkpoint:
+            return client.stream("GET", f"/reports/{self.job_id}/resume", params={"stream_tokens": stream_tokens})
+        headers = {"Last-Event-ID": self.last_event_id} if self.last_event_id is not None else {}
+        return client.stream("GET", f"/jobs/{self.job_id}/events", headers=headers)
+
+    async def events(self, prompt: str, stream_tokens: bool = True, coalesce: bool = True) -> AsyncIterator[dict]:
+        """Yield the report's events until its final or error event.
+
+        With coalesce, the backend may serve an identical report another user
+        started (self.coalesced is then True). While reconnecting, {"type": "reconnecting", "attempt": n, "reason": ...}
+        events are yielded so the caller can show it.
+        """
+        attempts = 0
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout) as client:
+            while True:
+                try:
+                    async with self._request(client, prompt, stream_tokens, coalesce) as response:
+                        if response.status_code == 404 and self.job_id and not self.resumed_from_checkpoint:
+                            # The backend forgot the job; the checkpoint still has the run
+                            self.resumed_from_checkpoint = True
+                            raise httpx.RemoteProtocolError("Job no longer known to the backend")
+                        if response.status_code == 409 and self.resumed_from_checkpoint:
+                            # The resumed run is still going on the backend
+                            raise httpx.RemoteProtocolError("Run still in progress")
+                        if response.status_code != 200:
+                            await response.aread()
+                            raise StreamError(f"Backend error: {response.status_code} - {response.text}")
+                        if self.job_id is None:
+                            self.job_id = response.headers.get("x-job-id")
+                            self.coalesced = response.headers.get("x-coalesced") == "true"
+                        elif self.resumed_from_checkpoint:
+                            # The resumed run is a new job under the same id, with its own event ids
+                            self.resumed_from_checkpoint = False
+                            self.last_event_id = None
+                        parser = SSEParser()
+                        async for line in response.aiter_lines():
+                            event = parser.feed(line)
+                            if event is None:
+                                continue
+                            event_id, data = event
+                            attempts = 0
+                            self.last_event_id = event_id
+                            payload = json.loads(data)
+                            yield payload
+                            if payload.get("type") in ("final", "error"):
+                                return
+                    # The server closed the stream before the run's final event
+                    raise httpx.RemoteProtocolError("Stream ended before the report finished")
+                except httpx.TransportError as e:
+                    if self.job_id is None:
+                        # Nothing to reattach to: the report was never accepted
+                        raise StreamError(f"Failed to connect to the backend API: {e}") from e
+                    attempts += 1
+                    if attempts > self.max_reconnects:
+                        raise StreamError(f"Lost the connection to the backend after {self.max_reconnects} reconnects: {e}") from e
+                    yield {"type": "reconnecting", "attempt": attempts, "reason": str(e) or type(e).__name__}
+                    await asyncio.sleep(self.backoff_seconds * attempts)
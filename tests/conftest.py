@@ -0,0 +1,5 @@
+import os
+
+# Read on import by the backend: search results and checkpoints stay in memory so tests don't depend on earlier runs
+os.environ.setdefault("SEARCH_CACHE_ENABLED", "false")
+os.environ.setdefault("CHECKPOINTER", "memory")
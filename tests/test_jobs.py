@@ -0,0 +1,109 @@
+import json
+import asyncio
+
+import pytest
+
+from backend.jobs import JobManager
+from backend.state_backend import SQLiteStateBackend
+
+TOKENS = 50
+
+async def run_report(job):
+    yield {"type": "start"}
+    for i in range(TOKENS):
+        yield {"type": "token", "token": f" w{i}"}
+    yield {"type": "final", "report": "".join(f" w{i}" for i in range(TOKENS))}
+
+async def failing_report(job):
+    yield {"type": "token", "token": " w0"}
+    yield {"type": "error", "message": "boom"}
+
+async def collect(manager, job_id, after=-1):
+    return [(event_id, event) async for event_id, event in manager.subscribe(job_id, after=after)]
+
+def test_completed_job_compacts_token_events_keeping_ids():
+    async def run():
+        manager = JobManager(run_report, max_workers=1, compact_types=("token",))
+        job = manager.submit("prompt")
+        live = await collect(manager, job.id)
+        replay = await collect(manager, job.id)
+        resumed = await collect(manager, job.id, after=10)
+        await manager.stop()
+        return job, live, replay, resumed
+
+    job, live, replay, resumed = asyncio.run(run())
+
+    # A subscriber attached while the job ran may have seen every token
+    assert live[-1] == (TOKENS + 1, {"type": "final", "report": live[-1][1]["report"]})
+    # Once completed, only the start and final events are kept, under their original ids
+    assert [event_id for event_id, _ in replay] == [0, TOKENS + 1]
+    assert sum(event is not None for event in job.events) == 2
+    assert len(job.events) == TOKENS + 2
+    assert resumed == [(TOKENS + 1, replay[-1][1])]
+
+def test_failed_job_keeps_its_token_events():
+    async def run():
+        manager = JobManager(failing_report, max_workers=1, compact_types=("token",))
+        job = manager.submit("prompt")
+        events = await collect(manager, job.id)
+        await manager.stop()
+        return job, events
+
+    job, events = asyncio.run(run())
+
+    assert job.status == "failed"
+    assert [event["type"] for _, event in events] == ["token", "error"]
+
+def test_shared_copy_is_compacted(tmp_path):
+    backend = SQLiteStateBackend(str(tmp_path / "state.sqlite3"))
+
+    async def run():
+        manager = JobManager(run_report, max_workers=1, backend=backend, poll_interval=0.01, compact_types=("token",))
+        other = JobManager(run_report, max_workers=1, backend=backend, poll_interval=0.01)
+        job = manager.submit("prompt")
+        await collect(manager, job.id)
+        # Let the mirror catch up, then read the job the way another worker does
+        await asyncio.wait(list(manager._mirrors.values()), timeout=5)
+        events = await collect(other, job.id)
+        await manager.stop()
+        return job, events
+
+    job, events = asyncio.run(run())
+
+    stored = [json.loads(event) for event in backend.lrange(f"jobs:{job.id}:events")]
+    assert len(stored) == TOKENS + 2
+    assert [event["type"] for event in stored if event is not None] == ["start", "final"]
+    assert [event_id for event_id, _ in events] == [0, TOKENS + 1]
+    backend.close()
+
+def test_finished_jobs_expire_on_a_timer():
+    async def run():
+        manager = JobManager(run_report, max_workers=1, retention_seconds=0.05, expiry_interval=0.05)
+        job = manager.submit("prompt")
+        await collect(manager, job.id)
+        assert manager.get(job.id) is not None
+        # No further submissions: only the timer can drop the job
+        await asyncio.sleep(0.3)
+        expired = manager.get(job.id) is None
+        await manager.stop()
+        return expired
+
+    assert asyncio.run(run())
+
+def test_reusing_the_id_of_an_unfinished_job_is_refused():
+    async def run():
+        manager = JobManager(run_report, max_workers=1)
+        job = manager.submit("prompt")
+        with pytest.raises(ValueError):
+            manager.submit("prompt", job_id=job.id)
+        await collect(manager, job.id)
+        again = manager.submit("prompt", job_id=job.id, resume=True)
+        await collect(manager, job.id)
+        await manager.stop()
+        return job, again
+
+    job, again = asyncio.run(run())
+
+    assert again is not job and again.id == job.id
+    assert again.options == {"resume": True}
+    assert again.status == "completed"
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, message_chunk_to_message
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+from backend import llm_cache
+from backend.llm_cache import ResponseCache, _replay_chunks, with_response_cache
+from benchmarks.fakes import FakeChatModel
+
+def _aggregate(chunks):
+    response = chunks[0]
+    for chunk in chunks[1:]:
+        response = response + chunk
+    return message_chunk_to_message(response)
+
+@pytest.fixture
+def cached_writer(monkeypatch):
+    monkeypatch.setattr(llm_cache, "exact_cache_agents", frozenset({"writer"}))
+    llm = FakeChatModel(latency="fixed:0", output_tokens=40)
+    prompt = ChatPromptTemplate.from_messages([MessagesPlaceholder(variable_name="messages")])
+    return llm, prompt | with_response_cache(llm, "writer", ResponseCache())
+
+def test_stream_miss_then_hit_replays_chunks(cached_writer):
+    llm, writer = cached_writer
+    request = {"messages": [HumanMessage(content="Skriv en rapport")]}
+
+    miss = list(writer.stream(request))
+    hit = list(writer.stream(request))
+
+    assert llm.calls == 1
+    assert len(miss) > 1 and len(hit) > 1
+    assert _aggregate(hit).content == _aggregate(miss).content
+    assert _aggregate(hit).usage_metadata == _aggregate(miss).usage_metadata
+
+def test_astream_hit_after_ainvoke(cached_writer):
+    llm, writer = cached_writer
+    request = {"messages": [HumanMessage(content="Skriv en rapport")]}
+
+    async def run():
+        response = await writer.ainvoke(request)
+        return response, [chunk async for chunk in writer.astream(request)]
+
+    response, chunks = asyncio.run(run())
+
+    assert llm.calls == 1
+    assert len(chunks) == len(response.content.split())
+    assert _aggregate(chunks).content == response.content
+
+def test_cache_bypass_streams_from_the_model(cached_writer):
+    llm, writer = cached_writer
+    request = {"messages": [HumanMessage(content="Skriv en rapport")]}
+    list(writer.stream(request))
+
+    list(writer.stream(request, {"configurable": {"cache_bypass": True}}))
+
+    assert llm.calls == 2
+
+def test_replay_keeps_tool_calls_and_whitespace():
+    message = AIMessage(
+        content="  Plan:\n teknologi og marked \n",
+        tool_calls=[{"name": "ResearchPlan", "args": {"plan": "x", "tasks": []}, "id": "call_1"}],
+        usage_metadata={"input_tokens": 5, "output_tokens": 3, "total_tokens": 8},
+    )
+
+    replayed = _aggregate(_replay_chunks(message))
+
+    assert replayed.content == message.content
+    assert replayed.tool_calls == message.tool_calls
+    assert replayed.usage_metadata == message.usage_metadata
@@ -0,0 +1,90 @@
+import asyncio
+from typing import Dict, List, Tuple
+
+import pytest
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
+
+from backend.search_results import count_tokens
+from benchmarks.fakes import install_fakes
+
+class PromptRecorder(BaseCallbackHandler):
+    """Records (agent, prompt tokens) of every chat model call, in call order."""
+
+    def __init__(self):
+        self.calls: List[Tuple[str, int]] = []
+
+    def on_chat_model_start(self, serialized, messages, *, metadata=None, **kwargs):
+        self.calls.append(((metadata or {}).get("agent"), sum(count_tokens(str(message.content)) for message in messages[0])))
+
+    def agent_calls(self, agent: str) -> List[int]:
+        return [tokens for name, tokens in self.calls if name == agent]
+
+@pytest.fixture(scope="module")
+def fakes():
+    return install_fakes(llm_latency="fixed:0", search_latency="fixed:0")
+
+def chained_tasks(count: int) -> List[dict]:
+    """`count` research tasks, each building on the one before, so they run one node after another."""
+    return [
+        {"id": f"T{i}", "agent": "tech_researcher", "question": f"teknologi spørgsmål {i}", "depends_on": [f"T{i - 1}"] if i > 1 else []}
+        for i in range(1, count + 1)
+    ]
+
+def run_report(research_mode: str) -> Tuple[List[Tuple[str, int]], dict, PromptRecorder]:
+    """Run one report; returns the (node, new messages) of every update, the final state and the prompts."""
+    from backend.graph import compile_graph
+
+    recorder = PromptRecorder()
+    deltas: List[Tuple[str, int]] = []
+    final: Dict = {}
+
+    async def run():
+        state = {"prompt": "Eksport af varmepumper", "messages": [HumanMessage(content="Eksport af varmepumper")], "revision_count": 0}
+        graph = compile_graph(research_mode)
+        async for mode, chunk in graph.astream(state, {"callbacks": [recorder]}, stream_mode=["updates", "values"]):
+            if mode == "values":
+                final.update(chunk)
+                continue
+            for node, update in chunk.items():
+                deltas.append((node, len((update or {}).get("messages") or [])))
+
+    asyncio.run(run())
+    return deltas, final, recorder
+
+def test_parallel_nodes_emit_only_new_messages(fakes, monkeypatch):
+    monkeypatch.setitem(fakes["planner"].tool_reply, "tasks", chained_tasks(4))
+
+    deltas, final, _ = run_report("parallel")
+
+    assert [tokens for node, tokens in deltas if node == "planner"] == [1]
+    assert [tokens for node, tokens in deltas if node == "reviewer"] == [1]
+    assert all(tokens == 0 for node, tokens in deltas if node not in ("planner", "reviewer"))
+    # The history holds the user prompt plus one message per node that emitted one
+    assert len(final["messages"]) == 1 + sum(tokens for _, tokens in deltas)
+
+def test_sequential_researchers_add_one_message_each(fakes):
+    deltas, final, recorder = run_report("sequential")
+
+    researchers = [(node, tokens) for node, tokens in deltas if node.endswith("_researcher")]
+    assert researchers and all(tokens == 1 for _, tokens in researchers)
+    assert len(final["messages"]) == 1 + sum(tokens for _, tokens in deltas)
+    # Each researcher's prompt is scoped to the plan and its own task, not the earlier transcripts
+    first_calls = [recorder.agent_calls(node)[0] for node, _ in researchers]
+    assert max(first_calls) <= 1.1 * min(first_calls)
+
+def test_prompt_tokens_grow_linearly_with_research_nodes(fakes, monkeypatch):
+    totals = {}
+    for count in (2, 4, 8):
+        monkeypatch.setitem(fakes["planner"].tool_reply, "tasks", chained_tasks(count))
+        _, _, recorder = run_report("parallel")
+        research_calls = recorder.agent_calls("tech_researcher")
+        # Two calls per task (search, then answer); a later task's prompt is no larger than an earlier one's
+        first_calls = research_calls[2::2]
+        assert max(first_calls) <= 1.1 * min(first_calls)
+        totals[count] = sum(tokens for _, tokens in recorder.calls)
+
+    # Linear growth adds the same tokens per extra node; quadratic growth would more than double the step
+    step_small = (totals[4] - totals[2]) / 2
+    step_large = (totals[8] - totals[4]) / 4
+    assert step_large == pytest.approx(step_small, rel=0.1)
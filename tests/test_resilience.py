@@ -0,0 +1,175 @@
+import time
+import asyncio
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import httpx
+import pytest
+
+from backend import resilience
+from backend.resilience import (
+    AsyncResilientTransport,
+    CircuitBreaker,
+    CircuitOpenError,
+    ResiliencePolicy,
+    ResilientTransport,
+    parse_retry_after,
+)
+
+real_sleep = time.sleep
+
+class Upstream:
+    """httpx.MockTransport handler answering with the queued responses (or errors), then 200s."""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.requests = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        reply = self.replies.pop(0) if self.replies else 200
+        if isinstance(reply, Exception):
+            raise reply
+        if isinstance(reply, int):
+            return httpx.Response(reply)
+        return reply
+
+@pytest.fixture
+def sleeps(monkeypatch) -> List[float]:
+    # Backoff delays are recorded instead of slept; the sync transport also sleeps 0 before each attempt
+    recorded = []
+
+    def sleep(delay):
+        if delay:
+            recorded.append(delay)
+
+    async def async_sleep(delay):
+        sleep(delay)
+
+    monkeypatch.setattr(resilience.time, "sleep", sleep)
+    monkeypatch.setattr(resilience.asyncio, "sleep", async_sleep)
+    return recorded
+
+def client(upstream: Upstream, **settings) -> httpx.Client:
+    events = settings.pop("events", [])
+    policy = ResiliencePolicy("test", on_event=lambda name, event, value: events.append(event), **{"backoff_base": 0.01, **settings})
+    return httpx.Client(transport=ResilientTransport(httpx.MockTransport(upstream), policy))
+
+def test_transient_errors_are_retried(sleeps):
+    upstream = Upstream(503, 502, 200)
+    events = []
+
+    response = client(upstream, events=events).get("https://api.test/")
+
+    assert response.status_code == 200
+    assert upstream.requests == 3
+    assert len(sleeps) == 2
+    assert events == ["retry", "retry"]
+
+def test_connection_errors_are_retried_then_raised(sleeps):
+    upstream = Upstream(*[httpx.ConnectError("refused")] * 3)
+
+    with pytest.raises(httpx.ConnectError):
+        client(upstream, max_retries=2).get("https://api.test/")
+    assert upstream.requests == 3
+
+def test_client_errors_are_not_retried(sleeps):
+    upstream = Upstream(400)
+
+    assert client(upstream).get("https://api.test/").status_code == 400
+    assert upstream.requests == 1
+    assert sleeps == []
+
+def test_last_response_is_returned_when_retries_run_out(sleeps):
+    upstream = Upstream(503, 503, 503)
+
+    assert client(upstream, max_retries=2).get("https://api.test/").status_code == 503
+    assert upstream.requests == 3
+
+def test_backoff_is_exponential_with_jitter(sleeps, monkeypatch):
+    # The upper end of the jitter range shows the cap of each attempt
+    monkeypatch.setattr(resilience.random, "uniform", lambda low, high: high)
+    upstream = Upstream(500, 500, 500, 500)
+
+    client(upstream, backoff_base=0.5, backoff_max=3).get("https://api.test/")
+
+    assert sleeps == [0.5, 1.0, 2.0, 3.0]
+
+def test_retry_after_is_honoured_up_to_the_max_delay(sleeps):
+    upstream = Upstream(
+        httpx.Response(429, headers={"Retry-After": "2"}),
+        httpx.Response(429, headers={"retry-after-ms": "1500"}),
+        httpx.Response(503, headers={"Retry-After": "120"}),
+    )
+
+    response = client(upstream, backoff_max=30).get("https://api.test/")
+
+    assert response.status_code == 200
+    assert sleeps[0] >= 2
+    assert 1.5 <= sleeps[1] < 2
+    assert sleeps[2] == 30
+
+def test_parse_retry_after():
+    in_ten_seconds = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=10), usegmt=True)
+
+    assert parse_retry_after(httpx.Headers({"Retry-After": "3"})) == 3
+    assert parse_retry_after(httpx.Headers({"retry-after-ms": "250", "Retry-After": "3"})) == 0.25
+    assert 8 < parse_retry_after(httpx.Headers({"Retry-After": in_ten_seconds})) <= 10
+    assert parse_retry_after(httpx.Headers({"Retry-After": "soon"})) is None
+    assert parse_retry_after(httpx.Headers()) is None
+
+def test_circuit_opens_after_consecutive_failures_and_recovers(sleeps):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.1)
+    upstream = Upstream(500, 500)
+    events = []
+    http = client(upstream, circuit_breaker=breaker, max_retries=0, events=events)
+
+    assert http.get("https://api.test/").status_code == 500
+    assert breaker.state == "closed"
+    assert http.get("https://api.test/").status_code == 500
+    assert breaker.state == "open"
+
+    # While open, requests fail without reaching the upstream
+    with pytest.raises(CircuitOpenError):
+        http.get("https://api.test/")
+    assert upstream.requests == 2
+    assert events == ["circuit_open"]
+
+    # After the reset time one probe goes through; its success closes the circuit
+    real_sleep(0.15)
+    assert http.get("https://api.test/").status_code == 200
+    assert breaker.state == "closed"
+
+def test_failed_probe_opens_the_circuit_again(sleeps):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.1)
+    upstream = Upstream(500, 500)
+    http = client(upstream, circuit_breaker=breaker, max_retries=0)
+
+    http.get("https://api.test/")
+    real_sleep(0.15)
+    http.get("https://api.test/")
+
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        http.get("https://api.test/")
+
+def test_rate_limits_do_not_open_the_circuit(sleeps):
+    breaker = CircuitBreaker(failure_threshold=2)
+    upstream = Upstream(429, 429, 429)
+
+    client(upstream, circuit_breaker=breaker, max_retries=2).get("https://api.test/")
+
+    assert breaker.state == "closed"
+
+def test_async_transport_retries_with_retry_after(sleeps):
+    upstream = Upstream(httpx.Response(429, headers={"Retry-After": "1"}), 503)
+    policy = ResiliencePolicy("test", backoff_base=0.01)
+
+    async def run():
+        async with httpx.AsyncClient(transport=AsyncResilientTransport(httpx.MockTransport(upstream), policy)) as http:
+            return await http.get("https://api.test/")
+
+    assert asyncio.run(run()).status_code == 200
+    assert upstream.requests == 3
+    assert sleeps[0] >= 1 and len(sleeps) == 2
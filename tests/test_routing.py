@@ -0,0 +1,33 @@
+from backend.routing import ModelRouter
+
+MODELS = ["gpt-4o-mini", "gpt-4o"]
+
+def call(router: ModelRouter, latency: dict) -> str:
+    """Route one writer call and record it with the chosen model's latency."""
+    model, reason = router.choose("writer", MODELS, input_tokens=100)
+    router.record("writer", model, reason, latency[model])
+    return reason
+
+def test_slow_tier_is_downgraded_then_probed_back_in():
+    router = ModelRouter(latency_target=1.0, probe_every=5)
+    latency = {"gpt-4o-mini": 0.2, "gpt-4o": 0.5}
+    assert call(router, latency) == "preferred"
+
+    # The strong tier goes slow: one call over the target moves the agent down
+    latency["gpt-4o"] = 10.0
+    assert [call(router, latency) for _ in range(2)] == ["preferred", "downgraded"]
+
+    # While it stays slow, only every 5th call probes it
+    reasons = [call(router, latency) for _ in range(10)]
+    assert reasons == ["downgraded"] * 3 + ["probe"] + ["downgraded"] * 4 + ["probe", "downgraded"]
+
+    # It recovers: the next probe's latency replaces the slow average
+    latency["gpt-4o"] = 0.5
+    reasons = [call(router, latency) for _ in range(5)]
+    assert reasons == ["downgraded"] * 3 + ["probe", "preferred"]
+
+def test_probing_can_be_disabled():
+    router = ModelRouter(latency_target=1.0, probe_every=0)
+    latency = {"gpt-4o-mini": 0.2, "gpt-4o": 10.0}
+
+    assert [call(router, latency) for _ in range(30)] == ["preferred"] + ["downgraded"] * 29
@@ -0,0 +1,132 @@
+import types
+import asyncio
+import threading
+
+import pytest
+
+from backend import search_cache
+from backend.search_cache import SearchCache
+
+class Clock:
+    """Stands in for the time module so tests control created_at and last_accessed."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(search_cache, "time", types.SimpleNamespace(time=clock.time))
+    return clock
+
+@pytest.fixture
+def make_cache(tmp_path, clock):
+    def make(ttl_seconds: float = 60, max_entries: int = 10) -> SearchCache:
+        return SearchCache(path=str(tmp_path / "search_cache.sqlite3"), ttl_seconds=ttl_seconds, max_entries=max_entries)
+    return make
+
+def test_hit_uses_normalized_query_and_max_results(make_cache):
+    cache = make_cache()
+    cache.set("  LangGraph   agents? ", 5, {"results": [1, 2]})
+
+    assert cache.get("langgraph agents", 5) == {"results": [1, 2]}
+    assert cache.get("langgraph agents", 3) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_entry_expires_after_ttl(make_cache, clock):
+    cache = make_cache(ttl_seconds=60)
+    cache.set("query", 5, ["result"])
+
+    clock.now += 59
+    assert cache.get("query", 5) == ["result"]
+
+    clock.now += 2
+    assert cache.get("query", 5) is None
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["entries"] == 0
+
+def test_reading_does_not_extend_ttl(make_cache, clock):
+    cache = make_cache(ttl_seconds=60)
+    cache.set("query", 5, ["result"])
+    for _ in range(3):
+        clock.now += 25
+        cache.get("query", 5)
+
+    assert cache.get("query", 5) is None
+
+def test_purge_expired_removes_only_expired_entries(make_cache, clock):
+    cache = make_cache(ttl_seconds=60)
+    cache.set("old", 5, ["old"])
+    clock.now += 45
+    cache.set("new", 5, ["new"])
+    clock.now += 30
+
+    assert cache.purge_expired() == 1
+    assert cache.get("old", 5) is None
+    assert cache.get("new", 5) == ["new"]
+
+def test_evicts_least_recently_used_when_full(make_cache, clock):
+    cache = make_cache(max_entries=2)
+    cache.set("a", 5, "a")
+    clock.now += 1
+    cache.set("b", 5, "b")
+    clock.now += 1
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a", 5) == "a"
+    clock.now += 1
+    cache.set("c", 5, "c")
+
+    assert cache.get("b", 5) is None
+    assert cache.get("a", 5) == "a"
+    assert cache.get("c", 5) == "c"
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 2
+
+def test_replacing_an_entry_does_not_evict(make_cache, clock):
+    cache = make_cache(max_entries=2)
+    cache.set("a", 5, "a")
+    cache.set("b", 5, "b")
+    clock.now += 1
+    cache.set("a", 5, "a2")
+
+    assert cache.get("a", 5) == "a2"
+    assert cache.get("b", 5) == "b"
+    assert cache.stats()["evictions"] == 0
+
+def test_async_search_uses_the_cache_off_the_event_loop(tmp_path, monkeypatch):
+    from langchain_community.tools.tavily_search import TavilySearchResults
+    from backend.tavily import CachedTavilySearchResults, PooledTavilySearchAPIWrapper
+
+    threads = []
+
+    class RecordingCache(SearchCache):
+        def get(self, query, max_results):
+            threads.append(threading.get_ident())
+            return super().get(query, max_results)
+
+        def set(self, query, max_results, value):
+            threads.append(threading.get_ident())
+            super().set(query, max_results, value)
+
+    async def search(self, query, run_manager=None):
+        return "content", [{"url": "https://example.com"}]
+
+    monkeypatch.setattr(TavilySearchResults, "_arun", search)
+    cache = RecordingCache(path=str(tmp_path / "search_cache.sqlite3"))
+    tool = CachedTavilySearchResults(max_results=5, api_wrapper=PooledTavilySearchAPIWrapper(tavily_api_key="test-key"), cache=cache)
+
+    async def run():
+        # A miss (get, then set) and a hit
+        return await tool._arun("varmepumper"), await tool._arun("varmepumper"), threading.get_ident()
+
+    first, second, loop_thread = asyncio.run(run())
+
+    assert first == second == ("content", [{"url": "https://example.com"}])
+    assert len(threads) == 3
+    assert loop_thread not in threads
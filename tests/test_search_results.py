@@ -0,0 +1,77 @@
+import json
+from typing import List, Tuple
+
+import pytest
+from langchain_core.messages import ToolMessage
+
+from backend.search_results import SearchResultProcessor, count_tokens, normalize_url
+
+WORDS = "varmepumpe eksport marked teknologi kvalitet bæredygtighed salg Norden Tyskland effektivitet".split()
+
+def result(i: int, url: str = None, sentences: int = 20) -> dict:
+    # Distinct content per i, long enough to need trimming
+    content = " ".join(f"{WORDS[(i + j) % len(WORDS)].capitalize()} {WORDS[(i * j) % len(WORDS)]} nummer {i}-{j}." for j in range(sentences))
+    return {"url": url or f"https://example.com/{i}", "title": f"Resultat {i}", "content": content}
+
+def turn(results_per_call: List[List[dict]], start: int = 0) -> Tuple[List[dict], List[ToolMessage]]:
+    """Tool calls and their messages for one researcher turn."""
+    calls, messages = [], []
+    for n, results in enumerate(results_per_call, start=start):
+        call_id = f"call_{n}"
+        calls.append({"name": "tavily_search", "args": {"query": f"varmepumper {n}"}, "id": call_id})
+        messages.append(ToolMessage(content=json.dumps(results), tool_call_id=call_id, name="tavily_search", artifact=results))
+    return calls, messages
+
+def sent(messages: List[ToolMessage]) -> List[dict]:
+    return [item for message in messages if message.content.startswith("[") for item in json.loads(message.content)]
+
+@pytest.mark.parametrize("count", [2, 10, 50])
+def test_turn_stays_within_token_budget(count):
+    processor = SearchResultProcessor("Eksport af varmepumper", token_budget=1000, max_result_tokens=150)
+    calls, messages = turn([[result(i) for i in range(count)]])
+
+    kept = sent(processor.process(calls, messages))
+
+    assert kept
+    assert sum(count_tokens(json.dumps(item, ensure_ascii=False)) for item in kept) <= 1000
+    assert all(count_tokens(item["content"]) <= 150 for item in kept)
+
+def test_budget_is_shared_by_the_calls_of_a_turn():
+    processor = SearchResultProcessor("Eksport af varmepumper", token_budget=600, max_result_tokens=100)
+    calls, messages = turn([[result(i) for i in range(10)], [result(i) for i in range(10, 20)]])
+
+    processed = processor.process(calls, messages)
+
+    assert len(processed) == 2
+    assert sum(count_tokens(json.dumps(item, ensure_ascii=False)) for item in sent(processed)) <= 600
+
+def test_duplicates_are_dropped_within_and_across_turns():
+    processor = SearchResultProcessor("Eksport af varmepumper", token_budget=0)
+    first = result(1, url="https://www.Example.com/a/")
+    same_url = {**result(2), "url": "https://example.com/a#intro"}
+    same_content = {**first, "url": "https://example.com/other", "content": first["content"].upper()}
+
+    kept = sent(processor.process(*turn([[first, same_url], [same_content]])))
+    assert [normalize_url(item["url"]) for item in kept] == ["https://example.com/a"]
+
+    later = processor.process(*turn([[same_url, result(3)]], start=2))
+    assert [item["url"] for item in sent(later)] == ["https://example.com/3"]
+
+def test_results_over_budget_can_be_sent_later():
+    processor = SearchResultProcessor("Eksport af varmepumper", token_budget=300, max_result_tokens=100)
+    results = [result(i) for i in range(6)]
+
+    first = {item["url"] for item in sent(processor.process(*turn([results])))}
+    second = {item["url"] for item in sent(processor.process(*turn([results], start=1)))}
+
+    # Dropped for the budget is not the same as seen
+    assert first and second
+    assert not first & second
+
+def test_errors_and_other_tools_pass_through():
+    processor = SearchResultProcessor("Eksport af varmepumper")
+    error = ToolMessage(content="Search failed", tool_call_id="call_0", name="tavily_search", status="error")
+    text = ToolMessage(content="plain text", tool_call_id="call_1", name="other_tool")
+    calls = [{"name": "tavily_search", "args": {"query": "x"}, "id": "call_0"}, {"name": "other_tool", "args": {}, "id": "call_1"}]
+
+    assert processor.process(calls, [error, text]) == [error, text]
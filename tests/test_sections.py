@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from backend.sections import join_sections, replace_sections, revised_section, split_sections
+from benchmarks.fakes import install_fakes
+
+REPORT = "Rapport om varmepumper\n\n## Indledning\nFørste udkast.\n\n## Marked\nSalg i Norden.\n\n## Konklusion\nKort."
+
+@pytest.fixture(scope="module")
+def fakes():
+    return install_fakes(llm_latency="fixed:0", search_latency="fixed:0")
+
+def test_revision_of_one_section_is_accepted():
+    sections = split_sections(REPORT)
+
+    updated = replace_sections(sections, {"S3": "## Marked\nSalg i Norden og Tyskland."})
+
+    assert [section["id"] for section in updated] == ["S1", "S2", "S3", "S4"]
+    assert updated[2]["content"] == "## Marked\nSalg i Norden og Tyskland."
+    assert updated[1] == sections[1]
+
+def test_subsections_added_in_a_revision_are_kept():
+    sections = split_sections(REPORT)
+    revision = "## Marked\n\nnyt om markedet\n\n### Detaljer\n\nvigtig ny detalje"
+
+    updated = replace_sections(sections, {"S3": revision})
+
+    assert updated[2]["content"] == revision
+    assert updated[2]["title"] == "Marked"
+
+def test_text_outside_the_section_is_a_mismatch():
+    section = split_sections(REPORT)[2]
+
+    # Text before the heading, a later section at the same level, the whole report again
+    assert revised_section(section, "Her er afsnittet:\n\n## Marked\nNyt.") is None
+    assert revised_section(section, "## Marked\nNyt.\n\n## Konklusion\nOgså ny.") is None
+    assert revised_section(section, "## Marked\nNyt.\n\n# Bilag\nEkstra.") is None
+    assert revised_section(section, REPORT.replace("Salg i Norden.", "Nyt.")) is None
+    # Case, trailing punctuation and the heading level don't matter
+    assert revised_section(section, "### marked:\nNyt.") == "### marked:\nNyt."
+
+def test_subsection_repeating_another_section_is_a_mismatch():
+    sections = split_sections(REPORT)
+
+    assert replace_sections(sections, {"S3": "## Marked\nNyt.\n\n### Konklusion\nKort."}) is None
+
+def test_mismatched_revisions_are_rejected():
+    sections = split_sections(REPORT)
+
+    # Renamed heading, the heading twice, nothing at all
+    assert replace_sections(sections, {"S3": "## Markedet\nNyt."}) is None
+    assert replace_sections(sections, {"S3": "## Marked\nEt.\n\n## Marked\nTo."}) is None
+    assert replace_sections(sections, {"S3": ""}) is None
+
+def test_text_before_the_first_heading_matches_headingless_text():
+    section = split_sections(REPORT)[0]
+
+    assert revised_section(section, "Ny titel") == "Ny titel"
+    assert revised_section(section, "## Indledning\nNyt.") is None
+    assert revised_section(section, "Ny titel\n\n### Undertitel\nNyt.") is None
+
+def revision_state() -> dict:
+    sections = split_sections(REPORT)
+    return {
+        "prompt": "Eksport af varmepumper",
+        "draft_report": join_sections(sections),
+        "draft_sections": sections,
+        "review_feedback": "[S3] Uddyb markedet.",
+        "section_feedback": {"S3": "Uddyb markedet."},
+        "revision_count": 0,
+    }
+
+def test_writer_rewrites_in_full_when_a_section_revision_returns_the_report(fakes, monkeypatch):
+    from backend.agents import arun_writer_agent
+
+    # Asked for one section, the writer answers with a whole report
+    full_report = "## Indledning\nNy.\n\n## Marked\nNy.\n\n## Marked\nDublet.\n\n## Konklusion\nNy."
+    monkeypatch.setattr(fakes["writer"], "reply", full_report)
+    calls = fakes["writer"].calls
+
+    update = asyncio.run(arun_writer_agent(revision_state()))
+
+    # One section call, then the full rewrite; no section got the whole report spliced in
+    assert fakes["writer"].calls == calls + 2
+    assert update["draft_report"] == full_report
+    assert update["revised_sections"] is None
+    assert update["revision_count"] == 1
+
+def test_writer_splices_in_a_matching_section(fakes, monkeypatch):
+    from backend.agents import arun_writer_agent
+
+    monkeypatch.setattr(fakes["writer"], "reply", "## Marked\nSalg i Norden og Tyskland.")
+
+    update = asyncio.run(arun_writer_agent(revision_state()))
+
+    assert update["revised_sections"] == ["S3"]
+    assert update["draft_report"] == REPORT.replace("Salg i Norden.", "Salg i Norden og Tyskland.")
+
+def test_writer_keeps_subsections_added_to_a_section(fakes, monkeypatch):
+    from backend.agents import arun_writer_agent
+
+    revision = "## Marked\n\nSalg i Norden.\n\n### Detaljer\n\nVigtig ny detalje."
+    monkeypatch.setattr(fakes["writer"], "reply", revision)
+
+    update = asyncio.run(arun_writer_agent(revision_state()))
+
+    assert update["revised_sections"] == ["S3"]
+    assert "### Detaljer\n\nVigtig ny detalje." in update["draft_report"]
+    assert update["draft_sections"][2]["content"] == revision
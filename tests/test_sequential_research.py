@@ -0,0 +1,52 @@
+import asyncio
+from typing import List
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from backend.agents import sequential_order
+from benchmarks.fakes import install_fakes
+
+@pytest.fixture(scope="module")
+def fakes():
+    return install_fakes(llm_latency="fixed:0", search_latency="fixed:0")
+
+def task(task_id: str, agent: str, *depends_on: str) -> dict:
+    return {"id": task_id, "agent": agent, "question": f"spørgsmål {task_id}", "depends_on": list(depends_on)}
+
+def test_order_follows_plan_order():
+    tasks = [task("T1", "market_sales_researcher"), task("T2", "tech_researcher"), task("T3", "market_sales_researcher")]
+
+    assert sequential_order(tasks) == ["market_sales_researcher", "tech_researcher"]
+
+def test_dependencies_run_first():
+    tasks = [
+        task("T1", "sustainability_quality_researcher", "T3"),
+        task("T2", "tech_researcher", "T3"),
+        task("T3", "market_sales_researcher"),
+    ]
+
+    assert sequential_order(tasks) == ["market_sales_researcher", "sustainability_quality_researcher", "tech_researcher"]
+
+def run_sequential() -> List[str]:
+    """Run one report in sequential mode; returns the nodes in the order they ran."""
+    from backend.graph import compile_graph
+
+    async def run():
+        state = {"prompt": "Eksport af varmepumper", "messages": [HumanMessage(content="Eksport af varmepumper")], "revision_count": 0}
+        return [node async for chunk in compile_graph("sequential").astream(state, stream_mode="updates") for node in chunk]
+
+    return asyncio.run(run())
+
+def test_sequential_mode_runs_only_the_planned_researchers(fakes, monkeypatch):
+    # The plan text names every area; only the tasks decide who runs
+    monkeypatch.setitem(fakes["planner"].tool_reply, "plan", "Teknologi, marked og bæredygtighed")
+    monkeypatch.setitem(fakes["planner"].tool_reply, "tasks", [
+        task("T1", "sustainability_quality_researcher"),
+        task("T2", "market_sales_researcher", "T1"),
+    ])
+
+    nodes = run_sequential()
+
+    assert nodes[:4] == ["planner", "sustainability_quality_researcher", "market_sales_researcher", "writer"]
+    assert "tech_researcher" not in nodes
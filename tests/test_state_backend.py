@@ -0,0 +1,135 @@
+import time
+import uuid
+
+import pytest
+
+from backend.state_backend import RedisStateBackend, SQLiteStateBackend, StateBackend
+from benchmarks.redis_standin import RedisStandIn
+
+TTL = 0.2
+
+@pytest.fixture(scope="module")
+def redis_url():
+    port = RedisStandIn().start_in_thread()
+    return f"redis://127.0.0.1:{port}/0"
+
+@pytest.fixture(params=["sqlite", "redis"])
+def backend(request, tmp_path):
+    # The same contract for both; a fresh prefix keeps tests apart on the shared stand-in
+    prefix = f"test:{uuid.uuid4().hex[:8]}:"
+    if request.param == "sqlite":
+        backend = SQLiteStateBackend(str(tmp_path / "state.sqlite3"), prefix=prefix)
+    else:
+        backend = RedisStateBackend(request.getfixturevalue("redis_url"), prefix=prefix)
+    yield backend
+    backend.close()
+
+def test_backend_must_implement_every_operation():
+    class Partial(StateBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
+
+def test_strings(backend):
+    assert backend.get("a") is None
+    backend.set("a", "värde")
+    backend.set("b", b"\x00bytes")
+    backend.set("c", 3)
+
+    assert backend.get("a") == "värde".encode("utf-8")
+    assert backend.get("b") == b"\x00bytes"
+    assert backend.get("c") == b"3"
+    backend.delete("a", "b", "missing")
+    assert backend.get("a") is None and backend.get("b") is None
+
+def test_add_only_sets_missing_keys(backend):
+    assert backend.add("lock", "first")
+    assert not backend.add("lock", "second")
+    assert backend.get("lock") == b"first"
+
+def test_ttl_expires_and_is_renewed(backend):
+    backend.set("short", "x", ttl=TTL)
+    backend.set("kept", "x", ttl=TTL)
+    time.sleep(TTL / 2)
+    backend.set("kept", "y", ttl=TTL)
+    time.sleep(TTL * 0.75)
+
+    assert backend.get("short") is None
+    assert backend.get("kept") == b"y"
+    # Setting without a ttl makes the key permanent again
+    backend.set("kept", "z")
+    time.sleep(TTL * 1.5)
+    assert backend.get("kept") == b"z"
+
+def test_add_succeeds_once_the_key_expired(backend):
+    assert backend.add("lock", "first", ttl=TTL)
+    time.sleep(TTL * 1.5)
+
+    assert backend.add("lock", "second")
+    assert backend.get("lock") == b"second"
+
+def test_hashes(backend):
+    assert backend.hgetall("h") == {}
+    backend.hset("h", {"status": "running", "count": 1})
+    backend.hset("h", {"status": "completed"})
+
+    assert backend.hgetall("h") == {"status": b"completed", "count": b"1"}
+    backend.hdel("h", "count", "missing")
+    assert backend.hgetall("h") == {"status": b"completed"}
+
+def test_hash_ttl(backend):
+    backend.hset("h", {"status": "running"}, ttl=TTL)
+    time.sleep(TTL * 1.5)
+
+    assert backend.hgetall("h") == {}
+
+def test_lists(backend):
+    assert backend.lrange("l") == []
+    assert backend.rpush("l", "a", "b") == 2
+    assert backend.rpush("l", "c") == 3
+
+    assert backend.lrange("l") == [b"a", b"b", b"c"]
+    assert backend.lrange("l", 1) == [b"b", b"c"]
+    assert backend.lrange("l", 0, 1) == [b"a", b"b"]
+    assert backend.lrange("l", -2) == [b"b", b"c"]
+    assert backend.lrange("l", 5) == []
+
+def test_lset_overwrites_by_index_and_ignores_missing_items(backend):
+    backend.rpush("l", "a", "b", "c")
+    backend.lset("l", {0: "A", 2: "C", 7: "past the end"})
+    backend.lset("missing", {0: "x"})
+
+    assert backend.lrange("l") == [b"A", b"b", b"C"]
+    assert backend.lrange("missing") == []
+
+def test_list_ttl(backend):
+    backend.rpush("l", "a", ttl=TTL)
+    time.sleep(TTL * 1.5)
+
+    assert backend.lrange("l") == []
+    assert backend.rpush("l", "b") == 1
+
+def test_keys_by_prefix(backend):
+    backend.set("jobs:1", "x")
+    backend.hset("jobs:2", {"status": "queued"})
+    backend.rpush("jobs:2:events", "e")
+    backend.set("jobs_other", "x")
+    backend.set("jobs:expired", "x", ttl=TTL)
+    time.sleep(TTL * 1.5)
+
+    assert sorted(backend.keys("jobs:")) == ["jobs:1", "jobs:2", "jobs:2:events"]
+    # Wildcard characters in the prefix match only themselves
+    assert backend.keys("jobs%") == [] and backend.keys("jobs*") == []
+
+def test_prefix_separates_stores(backend):
+    backend.set("shared", "mine")
+    if isinstance(backend, SQLiteStateBackend):
+        other = SQLiteStateBackend(backend.path, prefix="other:")
+    else:
+        other = RedisStateBackend(backend.url, prefix="other:")
+
+    assert other.get("shared") is None
+    assert "shared" not in other.keys("")
+    other.close()
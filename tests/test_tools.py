@@ -0,0 +1,56 @@
+import time
+import asyncio
+import threading
+
+from backend.tools import aexecute_tool_calls, execute_tool_calls
+
+class Tool:
+    """Stand-in search tool: "slow" queries hang until released, "bad" ones raise."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def invoke(self, args: dict) -> str:
+        if args["query"] == "slow":
+            self.release.wait(5)
+        if args["query"] == "bad":
+            raise ValueError("no results")
+        return f"results for {args['query']}"
+
+    async def ainvoke(self, args: dict) -> str:
+        if args["query"] == "slow":
+            await asyncio.sleep(5)
+        return self.invoke(args)
+
+def calls(*queries: str) -> list:
+    return [{"name": "tavily_search", "args": {"query": query}, "id": f"call_{n}"} for n, query in enumerate(queries)]
+
+def summary(messages) -> list:
+    return [(message.tool_call_id, message.status, message.content) for message in messages]
+
+EXPECTED = [
+    ("call_0", "error", "Error: timed out after 0.2s"),
+    ("call_1", "success", "results for fast"),
+    ("call_2", "error", "Error: timed out after 0.2s"),
+    ("call_3", "error", "Error: no results"),
+    ("call_4", "error", "Error: timed out after 0.2s"),
+]
+
+def test_timeout_covers_the_whole_turn():
+    tool = Tool()
+    start = time.monotonic()
+
+    messages = execute_tool_calls(tool, calls("slow", "fast", "slow", "bad", "slow"), timeout=0.2)
+
+    # The hanging calls share one deadline instead of waiting 0.2s each
+    assert time.monotonic() - start < 0.4
+    assert summary(messages) == EXPECTED
+    tool.release.set()
+
+def test_async_timeout_covers_the_whole_turn():
+    start = time.monotonic()
+
+    messages = asyncio.run(aexecute_tool_calls(Tool(), calls("slow", "fast", "slow", "bad", "slow"), timeout=0.2))
+
+    assert time.monotonic() - start < 0.4
+    assert summary(messages) == EXPECTED